@@ -0,0 +1,161 @@
+#!/bin/python3
+"""
+End-to-end benchmark of update.py against tools/mock_upstream.py.
+
+For every combination of --plugins and --servers, a scratch directory gets a plugins.json with that many synthetic
+plugins and that many server roots, each with every plugin installed at version 1.0 and an old Paper build.
+update.py is then run on all of them twice, as separate processes with their own cache directory:
+    cold  empty cache, every plugin and Paper gets downloaded
+    warm  straight after, with --cache-ttl 0 so all metadata is revalidated (Paper gets updated again, from the store)
+Each run reports its wall time, requests and body bytes the mock upstream saw, and update.py's peak RSS.
+
+    python3 bench/bench.py --plugins 10 100 1000 --servers 1 4 --latency 0.02
+"""
+import os
+import sys
+import json
+import time
+import shutil
+import zipfile
+import argparse
+import tempfile
+import subprocess
+import urllib.request
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+UPDATE_PY = os.path.join(REPO_ROOT, "update.py")
+MOCK_UPSTREAM_PY = os.path.join(REPO_ROOT, "tools", "mock_upstream.py")
+MC_VERSION = "1.21.4"
+PAPER_BUILDS = 5
+
+parser = argparse.ArgumentParser(description="Benchmarks update.py against a local mock upstream", formatter_class=argparse.ArgumentDefaultsHelpFormatter)
+parser.add_argument("--plugins", type=int, nargs="+", default=[10, 100, 1000], help="Plugin counts to benchmark.")
+parser.add_argument("--servers", type=int, nargs="+", default=[1, 4], help="Server root counts to benchmark.")
+parser.add_argument("--jar-size", type=int, default=64 * 1024, help="Filler bytes in each plugin jar.")
+parser.add_argument("--paper-size", type=int, default=1024 * 1024, help="Filler bytes in each Paper jar.")
+parser.add_argument("--latency", type=float, default=0.0, help="Seconds the mock upstream waits before every response.")
+parser.add_argument("--bandwidth", type=float, default=0.0, help="Bytes per second the mock upstream sends bodies at, 0 for unlimited.")
+parser.add_argument("--json", action="store_true", help="Print one JSON object per run instead of a table.")
+parser.add_argument("--keep", action="store_true", help="Keep the scratch directories and print where they are.")
+parser.add_argument("update_args", nargs=argparse.REMAINDER, help="Extra arguments for update.py, after --.")
+
+
+def start_mock_upstream(options: argparse.Namespace) -> (subprocess.Popen, str):
+    """Starts tools/mock_upstream.py on a free port, returning the process and its base URL."""
+    process = subprocess.Popen(
+        [
+            sys.executable, MOCK_UPSTREAM_PY, "--port", "0",
+            "--plugins", str(max(options.plugins)),
+            "--mc-version", MC_VERSION,
+            "--paper-builds", str(PAPER_BUILDS),
+            "--jar-size", str(options.jar_size),
+            "--paper-size", str(options.paper_size),
+            "--latency", str(options.latency),
+            "--bandwidth", str(options.bandwidth),
+        ],
+        stdout=subprocess.PIPE,
+        text=True,
+    )
+    # "Serving on http://127.0.0.1:<port>"
+    base_url = process.stdout.readline().strip().split(" ")[-1]
+    return (process, base_url)
+
+
+def mock_request(base_url: str, path: str, method: str = "GET") -> dict:
+    request = urllib.request.Request(base_url + path, method=method, data=b"" if method == "POST" else None)
+    with urllib.request.urlopen(request) as response:
+        return json.load(response)
+
+
+def write_old_jar(path: str, name: str):
+    with zipfile.ZipFile(path, "w") as jar:
+        jar.writestr("plugin.yml", f"name: {name}\nversion: 1.0\nmain: bench.{name}\n")
+
+
+def make_servers(work_dir: str, manifest: dict, plugin_count: int, server_count: int) -> list[str]:
+    """Fills work_dir with the plugins.json for plugin_count plugins and server_count server roots using them."""
+    plugins = manifest["plugins"][:plugin_count]
+    updaters_dir = os.path.join(work_dir, "plugins", "updaters")
+    os.makedirs(updaters_dir)
+    with open(os.path.join(updaters_dir, "plugins.json"), "w") as manifest_file:
+        json.dump({"plugins": plugins}, manifest_file, indent=4)
+
+    server_roots = []
+    for number in range(server_count):
+        server_root = os.path.join(work_dir, f"server{number}")
+        plugins_dir = os.path.join(server_root, "plugins")
+        os.makedirs(plugins_dir)
+        for plugin in plugins:
+            write_old_jar(os.path.join(plugins_dir, plugin["prefix"] + "-1.0.jar"), plugin["name"])
+        with open(os.path.join(server_root, "version_history.json"), "w") as version_file:
+            json.dump({"currentVersion": f"git-Paper-1 (MC: {MC_VERSION})"}, version_file)
+        os.symlink(f"paper-{MC_VERSION}-1.jar", os.path.join(server_root, "paper.jar"))
+        server_roots.append(server_root)
+    return server_roots
+
+
+def run_update(work_dir: str, base_url: str, server_roots: list[str], extra_args: list[str]) -> dict:
+    """Runs update.py once, returning its exit code, wall time, peak RSS and the requests the mock upstream saw."""
+    env = dict(os.environ)
+    env["PAPER_UPDATER_MIRROR"] = base_url
+    env["PAPER_UPDATER_CACHE"] = os.path.join(work_dir, "cache")
+    # Only the mock upstream knows the synthetic repos, so don't send it a real token
+    env.pop("GITHUB_TOKEN", None)
+    env.pop("GH_TOKEN", None)
+
+    mock_request(base_url, "/_stats/reset", "POST")
+    with open(os.path.join(work_dir, "update.log"), "a") as log_file:
+        start = time.monotonic()
+        process = subprocess.Popen([sys.executable, UPDATE_PY, "--servers", *server_roots, *extra_args], cwd=work_dir, env=env, stdout=log_file, stderr=subprocess.STDOUT)
+        # wait4 gives this one process's resource usage, RUSAGE_CHILDREN would be the maximum over all runs so far
+        (_, status, usage) = os.wait4(process.pid, 0)
+        seconds = time.monotonic() - start
+
+    hosts = mock_request(base_url, "/_stats")
+    return {
+        "exit_code": os.waitstatus_to_exitcode(status),
+        "seconds": round(seconds, 3),
+        "requests": sum(host["requests"] for host in hosts.values()),
+        "bytes": sum(host["bytes"] for host in hosts.values()),
+        # ru_maxrss is in KiB on Linux
+        "peak_rss_mib": round(usage.ru_maxrss / 1024, 1),
+    }
+
+
+def format_row(result: dict) -> str:
+    return (
+        f"{result['plugins']:>7} {result['servers']:>7} {result['run']:>5} {result['seconds']:>9.2f} "
+        f"{result['requests']:>8} {result['bytes'] / (1024 * 1024):>9.1f} {result['peak_rss_mib']:>8.1f} {result['exit_code']:>4}"
+    )
+
+
+def main():
+    options = parser.parse_args()
+    extra_args = [arg for arg in options.update_args if arg != "--"]
+    (mock_process, base_url) = start_mock_upstream(options)
+    try:
+        manifest = mock_request(base_url, "/_manifest")
+        if not options.json:
+            print(f"{'plugins':>7} {'servers':>7} {'run':>5} {'seconds':>9} {'requests':>8} {'MiB':>9} {'RSS MiB':>8} {'exit':>4}")
+
+        for plugin_count in options.plugins:
+            for server_count in options.servers:
+                work_dir = tempfile.mkdtemp(prefix=f"bench-{plugin_count}p-{server_count}s-")
+                try:
+                    server_roots = make_servers(work_dir, manifest, plugin_count, server_count)
+                    for (run, run_args) in (("cold", []), ("warm", ["--cache-ttl", "0"])):
+                        result = {"plugins": plugin_count, "servers": server_count, "run": run}
+                        result.update(run_update(work_dir, base_url, server_roots, run_args + extra_args))
+                        print(json.dumps(result) if options.json else format_row(result), flush=True)
+                finally:
+                    if options.keep:
+                        print(f"Kept {work_dir}", file=sys.stderr)
+                    else:
+                        shutil.rmtree(work_dir)
+    finally:
+        mock_process.terminate()
+        mock_process.wait()
+
+
+if __name__ == "__main__":
+    main()
@@ -16,7 +16,13 @@ else
 fi
 
 cp -v update.py ${INSTALL_DIR}
+cp -rfv paper_updater ${INSTALL_DIR}
 cp -rfv plugins ${INSTALL_DIR}
 
+# These plugins are now updated through plugins/updaters/plugins.json, remove their old updater scripts
+for RETIRED_UPDATER in blocklocker floodgate luckperms-bukkit protocollib vault viabackwards viaversion; do
+    rm -fv ${INSTALL_DIR}/plugins/updaters/${RETIRED_UPDATER}.py
+done
+
 echo "Successfully installed updater to $INSTALL_DIR"
 
@@ -0,0 +1,8 @@
+"""Shared helpers for update.py and the plugin updaters in plugins/updaters."""
+import os
+
+# Everything cached between runs lives here, shared by every server root on the host
+# Absolute, so it stays put while a legacy updater has changed the cwd (see update.run_updater)
+CACHE_DIR = os.path.abspath(os.environ.get("PAPER_UPDATER_CACHE") or os.path.join(
+    os.environ.get("XDG_CACHE_HOME") or os.path.expanduser("~/.cache"), "paper-plugin-updater"
+))
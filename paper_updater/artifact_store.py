@@ -0,0 +1,158 @@
+"""
+Content-addressed store for downloaded jars, shared by every server root on the host.
+
+Artifacts live at <store>/sha256/<first 2 hex chars>/<sha256>. Servers get reflinks (or hardlinks, or as a last
+resort copies) of them, so N servers running the same jar cost one download and one copy on disk.
+Downloads are also indexed by URL, for sources that don't publish a checksum up front.
+
+Objects are read-only, but a hardlinked jar can still be changed in place through a server (by root, or anything that
+chmods it first), which would change it for every server. So an object is checked against its name before it's used
+again (see verify), through the digest cache so that only costs a read after the file changed.
+"""
+import os
+import fcntl
+import shutil
+import hashlib
+import tempfile
+
+from paper_updater import CACHE_DIR
+from paper_updater.digests import DigestCache
+
+HASH_CHUNK_SIZE = 1024 * 1024
+# From linux/fs.h, clones a file's extents on filesystems that support it (btrfs, xfs)
+FICLONE = 0x40049409
+
+
+def sha256_file(file_path: str) -> str:
+    digest = hashlib.sha256()
+    with open(file_path, "rb") as file:
+        for chunk in iter(lambda: file.read(HASH_CHUNK_SIZE), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def fsync_dir(dir_path: str):
+    """Makes renames inside dir_path durable."""
+    fd = os.open(dir_path, os.O_RDONLY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+def _write_atomic(file_path: str, data: bytes):
+    (fd, temp_path) = tempfile.mkstemp(dir=os.path.dirname(file_path), suffix=".tmp")
+    with os.fdopen(fd, "wb") as temp_file:
+        temp_file.write(data)
+    os.replace(temp_path, file_path)
+
+
+def _reflink(source_path: str, dest_path: str):
+    with open(source_path, "rb") as source, open(dest_path, "wb") as dest:
+        fcntl.ioctl(dest.fileno(), FICLONE, source.fileno())
+
+
+class ArtifactStore:
+    def __init__(self, store_dir: str = CACHE_DIR, digest_cache: DigestCache = None):
+        self.objects_dir = os.path.join(store_dir, "sha256")
+        self.urls_dir = os.path.join(store_dir, "urls")
+        self.temp_dir = os.path.join(store_dir, "tmp")
+        for directory in (self.objects_dir, self.urls_dir, self.temp_dir):
+            os.makedirs(directory, exist_ok=True)
+        # Pass the run's digest cache if it has one, two caches on the same file would overwrite each other's entries
+        self.digest_cache = digest_cache or DigestCache(store_dir)
+
+    def path(self, sha256: str) -> str:
+        return os.path.join(self.objects_dir, sha256[:2], sha256)
+
+    def _url_path(self, url: str) -> str:
+        return os.path.join(self.urls_dir, hashlib.sha256(url.encode()).hexdigest())
+
+    def lookup(self, url: str = None, sha256: str = None) -> str:
+        """
+        Returns the sha256 of a stored artifact matching the checksum, or failing that the URL, or None.
+        Only pass url for URLs that always serve the same file (e.g. a specific build or release asset).
+        """
+        if sha256 is None and url is not None:
+            try:
+                with open(self._url_path(url), "r") as url_file:
+                    sha256 = url_file.read().strip()
+            except OSError:
+                return None
+
+        if sha256 is not None and os.path.isfile(self.path(sha256)):
+            return sha256
+        return None
+
+    def verify(self, sha256: str, size: int = None) -> bool:
+        """Whether the stored object named sha256 still has that sha256 (and size, if given)."""
+        object_path = os.path.abspath(self.path(sha256))
+        try:
+            if size is not None and os.path.getsize(object_path) != size:
+                return False
+        except OSError:
+            return False
+        digests = self.digest_cache.digest_files([object_path], ("sha256",))
+        if digests.get(object_path, {}).get("sha256") != sha256.lower():
+            return False
+        # Objects stored before they were made read-only
+        if os.stat(object_path).st_mode & 0o222:
+            os.chmod(object_path, 0o444)
+        return True
+
+    def discard(self, sha256: str):
+        """Deletes a stored object, e.g. one that failed verify, so it gets downloaded again."""
+        try:
+            os.remove(self.path(sha256))
+        except FileNotFoundError:
+            pass
+
+    def part_path(self, url: str) -> str:
+        """
+        Returns where to download url to before add(). It's on the store's filesystem, and always the same for
+        a given url so an interrupted download can be resumed by the next run.
+        """
+        return os.path.join(self.temp_dir, hashlib.sha256(url.encode()).hexdigest() + ".part")
+
+    def add(self, file_path: str, url: str = None, sha256: str = None) -> str:
+        """
+        Moves file_path into the store and returns its sha256.
+        Pass sha256 when it was already computed while downloading, to skip hashing the file again.
+        """
+        if sha256 is None:
+            sha256 = sha256_file(file_path)
+
+        object_path = self.path(sha256)
+        os.makedirs(os.path.dirname(object_path), exist_ok=True)
+        os.chmod(file_path, 0o444)
+        os.replace(file_path, object_path)
+        fsync_dir(os.path.dirname(object_path))
+
+        if url is not None:
+            _write_atomic(self._url_path(url), sha256.encode())
+        return sha256
+
+    def link(self, sha256: str, dest_path: str):
+        """Places the stored artifact at dest_path, replacing whatever was there."""
+        object_path = self.path(sha256)
+        # Renaming a link over another link to the same file does nothing, which would leave the temp link behind
+        if os.path.exists(dest_path) and os.path.samefile(object_path, dest_path):
+            return
+        (fd, temp_path) = tempfile.mkstemp(dir=os.path.dirname(os.path.abspath(dest_path)), suffix=".tmp")
+        os.close(fd)
+        os.remove(temp_path)
+
+        try:
+            # A reflink (copy-on-write clone) is a file of its own, so nothing written to it can reach the store
+            _reflink(object_path, temp_path)
+        except OSError:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+            # Only btrfs, xfs and the like can reflink. Hardlinks can't cross filesystems, then it's a plain copy
+            try:
+                os.link(object_path, temp_path)
+            except OSError:
+                shutil.copyfile(object_path, temp_path)
+
+        os.replace(temp_path, dest_path)
+        fsync_dir(os.path.dirname(os.path.abspath(dest_path)))
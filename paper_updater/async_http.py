@@ -0,0 +1,27 @@
+"""
+asyncio front end to HttpClient, for updaters written as coroutines (update_async).
+
+Each call runs the shared HttpClient in a worker thread, so async updaters still share its connection pool,
+per-host limits, metadata cache, artifact store and run report with every other updater. What matters is that
+an updater can have several requests in flight at once, e.g. asyncio.gather over the jars it downloads.
+"""
+import asyncio
+
+from paper_updater.http_client import HttpClient
+
+
+class AsyncHttpClient:
+    def __init__(self, http: HttpClient):
+        self.http = http
+        self.store = http.store
+
+    async def get_json(self, url: str) -> dict:
+        return await asyncio.to_thread(self.http.get_json, url)
+
+    async def download(self, url: str, file_path: str, sha256: str = None, size: int = None, base_path: str = None, hashes: dict = None) -> str:
+        return await asyncio.to_thread(self.http.download, url, file_path, sha256, size, base_path, hashes)
+
+
+def run_async(coroutine_function, *args):
+    """Runs an async updater function to completion on a new event loop in the calling thread."""
+    return asyncio.run(coroutine_function(*args))
@@ -0,0 +1,62 @@
+"""
+Integrity audit of a server's jars (update.py --audit): the jars in plugins/ and paper.jar's target are hashed
+(in parallel and through the digest cache, see paper_updater.digests) and compared against the checksums upstream
+published for them: a sha256 where there is one, otherwise e.g. Modrinth's sha512.
+
+Each file gets a status:
+    ok        its digests are the published ones
+    corrupt   it differs, and isn't even a readable zip (truncated, bad CRCs, ...)
+    tampered  it differs, but is a valid jar, so it was replaced or modified
+    unknown   there is no published checksum to compare with (the source doesn't publish one, or it was installed
+              before checksums were recorded and isn't the latest release)
+"""
+import os
+import zipfile
+
+from paper_updater.digests import DigestCache
+
+OK = "ok"
+CORRUPT = "corrupt"
+TAMPERED = "tampered"
+UNKNOWN = "unknown"
+STATUSES = (OK, CORRUPT, TAMPERED, UNKNOWN)
+
+
+def is_intact_zip(file_path: str) -> bool:
+    """Whether file_path is a zip file whose entries all pass their CRC check. Reads the whole file."""
+    try:
+        with zipfile.ZipFile(file_path) as jar:
+            return jar.testzip() is None
+    except (OSError, zipfile.BadZipFile, EOFError, ValueError):
+        return False
+
+
+def audit_files(expected: dict, digest_cache: DigestCache, jobs: int = None) -> list[dict]:
+    """
+    Checks files against their published checksums. expected is {file path: ({algorithm: hex digest}, where they're
+    from)}, with {} for files nothing was published for. Returns one {"file", "status", "digests", "expected", "source"}
+    per file, in the order of expected. "digests" are the file's own, for sha256 and every algorithm in "expected".
+    """
+    # Files are only hashed with the algorithms they have a published digest for, and sha256 to show
+    by_algorithms = {}
+    for (file_path, (published, _)) in expected.items():
+        by_algorithms.setdefault(tuple(sorted({"sha256", *published})), []).append(file_path)
+    digests = {}
+    for (algorithms, file_paths) in by_algorithms.items():
+        digests.update(digest_cache.digest_files(file_paths, algorithms, jobs))
+
+    results = []
+    for (file_path, (published, source)) in expected.items():
+        file_digests = digests.get(os.path.abspath(file_path))
+        if file_digests is None:
+            # Couldn't be read at all
+            status = CORRUPT
+        elif not published:
+            status = UNKNOWN
+        elif all(file_digests[algorithm] == digest.lower() for (algorithm, digest) in published.items()):
+            status = OK
+        else:
+            # Only files that don't match are read a second time
+            status = TAMPERED if is_intact_zip(file_path) else CORRUPT
+        results.append({"file": file_path, "status": status, "digests": file_digests, "expected": published, "source": source})
+    return results
@@ -0,0 +1,128 @@
+"""
+Which Minecraft versions plugin releases support, so an upgrade that would strand plugins is refused before anything
+is downloaded (update.py <mc_version>, overridden with --force).
+
+What a release supports is known from, in order:
+    the source   Modrinth game versions, Hangar platform versions or the MC version in a release asset's name,
+                 given as "mc_versions" in the plugin's plan (see paper_updater.sources)
+    the jar      the api-version in its paper-plugin.yml/plugin.yml, once the release has been installed. Paper loads
+                 plugins built against its own API version or an older one, and refuses newer ones.
+Both are kept in a matrix in the cache directory, by plugin and release version, as a published release never changes
+what it supports. A release the matrix knows nothing about yet is reported as unknown rather than holding anything up.
+"""
+import os
+import re
+import json
+import tempfile
+import threading
+
+from paper_updater import CACHE_DIR
+from paper_updater.plugin_index import PluginIndex
+
+MATRIX_FILE_NAME = "compatibility.json"
+
+
+class StrandedPlugins(Exception):
+    """Upgrading to a Minecraft version would leave plugins without a release that supports it."""
+
+
+def parse_mc_version(version: str) -> tuple:
+    """ "1.21.4" -> (1, 21, 4), or None if version isn't a plain Minecraft version."""
+    if version is None or not re.fullmatch(r"\d+(\.\d+)*", version):
+        return None
+    return tuple(int(part) for part in version.split("."))
+
+
+def api_version_supports(api_version: str, mc_version: str) -> bool:
+    """Whether a plugin with api_version loads on mc_version, or None if either can't be parsed."""
+    api = parse_mc_version(api_version)
+    mc = parse_mc_version(mc_version)
+    if api is None or mc is None:
+        return None
+    # Tuples compare as a prefix first, so api-version "1.20" covers every 1.20.x release
+    return api <= mc
+
+
+def supports(entry: dict, mc_version: str) -> bool:
+    """Whether the release described by entry ({"mc_versions", "api_version"}) supports mc_version, or None if unknown."""
+    if entry.get("mc_versions"):
+        return mc_version in entry["mc_versions"]
+    if entry.get("api_version"):
+        return api_version_supports(entry["api_version"], mc_version)
+    return None
+
+
+class CompatibilityMatrix:
+    def __init__(self, cache_dir: str = CACHE_DIR):
+        # None keeps the matrix in memory only
+        self.cache_dir = cache_dir
+        self._plugins: dict[str, dict[str, dict]] = None
+        self._changed = False
+        self._lock = threading.Lock()
+
+    def _path(self) -> str:
+        return os.path.join(self.cache_dir, MATRIX_FILE_NAME)
+
+    def _load(self) -> dict:
+        if self._plugins is None:
+            self._plugins = {}
+            if self.cache_dir is not None:
+                try:
+                    with open(self._path(), "r") as matrix_file:
+                        self._plugins = json.load(matrix_file)["plugins"]
+                except (OSError, ValueError, KeyError):
+                    pass
+        return self._plugins
+
+    def get(self, plugin: str, version: str) -> dict:
+        """What's known about the plugin's release: {"mc_versions", "api_version"}, either of which may be missing."""
+        with self._lock:
+            return dict(self._load().get(plugin, {}).get(version, {}))
+
+    def record(self, plugin: str, version: str, mc_versions: list[str] = None, api_version: str = None):
+        with self._lock:
+            entry = self._load().setdefault(plugin, {}).setdefault(version, {})
+            for (key, value) in (("mc_versions", mc_versions), ("api_version", api_version)):
+                if value and entry.get(key) != value:
+                    entry[key] = value
+                    self._changed = True
+
+    def save(self):
+        with self._lock:
+            if self.cache_dir is None or not self._changed:
+                return
+            os.makedirs(self.cache_dir, exist_ok=True)
+            (fd, temp_path) = tempfile.mkstemp(dir=self.cache_dir, suffix=".tmp")
+            with os.fdopen(fd, "w") as temp_file:
+                json.dump({"plugins": self._plugins}, temp_file)
+            os.replace(temp_path, self._path())
+            self._changed = False
+
+    def learn(self, plan: list[dict], index: PluginIndex):
+        """Records what the plan's sources say about the target releases, and the api-version of the installed jars."""
+        for item in plan:
+            if item.get("mc_versions"):
+                self.record(item["name"], item["target_version"], mc_versions=item["mc_versions"])
+            info = index.get(item["current_file"])
+            if info is not None and info.api_version is not None:
+                self.record(item["name"], item["current_version"], api_version=info.api_version)
+
+    def check(self, resolved: dict, index: PluginIndex) -> dict:
+        """
+        Works out whether every plugin in a resolved plan (see update.py resolve_server) can move to its
+        "mc_version". Returns {"stranded": [{"name", "reason"}], "unknown": [names]}. Updaters that found no release
+        for the version at all are stranded too.
+        """
+        self.learn(resolved["plan"], index)
+        mc_version = resolved["mc_version"]
+        stranded = [{"name": error["updater"], "reason": error["error"]} for error in resolved["errors"]]
+        unknown = []
+        for item in resolved["plan"]:
+            if item["name"] == "Paper":
+                continue
+            supported = supports(self.get(item["name"], item["target_version"]), mc_version)
+            if supported is None:
+                unknown.append(item["name"])
+            elif not supported:
+                stranded.append({"name": item["name"], "reason": f"{item['target_version']} doesn't support {mc_version}"})
+        return {"stranded": stranded, "unknown": unknown}
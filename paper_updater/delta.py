@@ -0,0 +1,158 @@
+"""
+Zip entry level deltas between two versions of a jar.
+
+Most plugin updates change a few classes, and most of the new jar's entries are byte for byte the same compressed
+data as in the old one (often with a new timestamp in the entry header). A delta lists the new jar as a sequence
+of byte ranges copied from the old jar and bytes sent along: entry headers and the central directory are always
+sent, entry data is copied whenever the old jar has exactly the same compressed bytes.
+
+A delta is served by a companion service (tools/delta_server.py) at <service>/<old sha256>/<host>/<path>, for the
+jar at https://<host>/<path>. HttpClient rebuilds the new jar from the old one and checks it against the published
+sha256, and downloads the whole jar instead if anything doesn't add up.
+
+Format: MAGIC, a line of JSON {"base", "target", "size", "ops"}, then the bytes sent along. Each op is
+[offset, length]: length bytes copied from offset in the old jar, or with offset -1, the next length bytes sent along.
+"""
+import io
+import os
+import json
+import struct
+import hashlib
+import zipfile
+import urllib.parse
+
+MAGIC = b"paper-updater-delta 1\n"
+SENT = -1
+# Fixed size part of a zip local file header, followed by the file name and extra field
+LOCAL_HEADER_SIZE = 30
+LOCAL_HEADER_SIGNATURE = b"PK\x03\x04"
+
+
+class DeltaError(Exception):
+    """A delta couldn't be read or applied."""
+
+
+def delta_url(service_url: str, base_sha256: str, url: str) -> str:
+    """Where the delta service at service_url serves the delta from the jar with base_sha256 to the jar at url."""
+    parts = urllib.parse.urlsplit(url)
+    return service_url.rstrip("/") + "/" + base_sha256 + "/" + parts.netloc + urllib.parse.urlunsplit(("", "", parts.path, parts.query, ""))
+
+
+def parse_delta_path(path: str) -> (str, str):
+    """The (base sha256, url) a delta service was asked for with path (/<base sha256>/<host>/<path>), or None."""
+    (base_sha256, _, rest) = path.lstrip("/").partition("/")
+    if len(base_sha256) != 64 or "/" not in rest:
+        return None
+    return (base_sha256.lower(), "https://" + rest)
+
+
+def entry_ranges(data: bytes) -> list[tuple]:
+    """
+    Returns (header start, data start, end) of every entry in the zip file data, in file order, or None if data
+    isn't a zip file. An entry's data runs up to the next entry (or the central directory), so it includes the
+    data descriptor of entries that have one.
+    """
+    try:
+        with zipfile.ZipFile(io.BytesIO(data)) as zip_file:
+            offsets = sorted({info.header_offset for info in zip_file.infolist()})
+            central_directory = zip_file.start_dir
+    except (zipfile.BadZipFile, OSError):
+        return None
+
+    ranges = []
+    for (i, start) in enumerate(offsets):
+        end = offsets[i + 1] if i + 1 < len(offsets) else central_directory
+        if data[start:start + 4] != LOCAL_HEADER_SIGNATURE or start + LOCAL_HEADER_SIZE > end:
+            return None
+        (name_length, extra_length) = struct.unpack("<HH", data[start + 26:start + LOCAL_HEADER_SIZE])
+        data_start = min(end, start + LOCAL_HEADER_SIZE + name_length + extra_length)
+        ranges.append((start, data_start, end))
+    return ranges
+
+
+def make_delta(base: bytes, target: bytes) -> bytes:
+    """The delta rebuilding target from base, or None if either isn't a zip file."""
+    base_ranges = entry_ranges(base)
+    target_ranges = entry_ranges(target)
+    if base_ranges is None or target_ranges is None:
+        return None
+
+    base_entries = {}
+    for (_, data_start, end) in base_ranges:
+        base_entries.setdefault(hashlib.sha256(base[data_start:end]).digest(), data_start)
+
+    ops = []
+    sent = bytearray()
+
+    def send(start: int, end: int):
+        if start >= end:
+            return
+        if len(ops) > 0 and ops[-1][0] == SENT:
+            ops[-1][1] += end - start
+        else:
+            ops.append([SENT, end - start])
+        sent.extend(target[start:end])
+
+    def copy(offset: int, length: int):
+        if len(ops) > 0 and ops[-1][0] != SENT and ops[-1][0] + ops[-1][1] == offset:
+            ops[-1][1] += length
+        else:
+            ops.append([offset, length])
+
+    position = 0
+    for (start, data_start, end) in target_ranges:
+        send(position, data_start)
+        offset = base_entries.get(hashlib.sha256(target[data_start:end]).digest())
+        if offset is None or data_start == end:
+            send(data_start, end)
+        else:
+            copy(offset, end - data_start)
+        position = end
+    send(position, len(target))
+
+    header = {
+        "base": hashlib.sha256(base).hexdigest(),
+        "target": hashlib.sha256(target).hexdigest(),
+        "size": len(target),
+        "ops": ops,
+    }
+    return MAGIC + json.dumps(header, separators=(",", ":")).encode() + b"\n" + bytes(sent)
+
+
+def apply_delta(base_path: str, delta: bytes, file_path: str) -> (str, int):
+    """Writes the jar rebuilt from base_path and delta to file_path. Returns its (sha256, size)."""
+    if not delta.startswith(MAGIC):
+        raise DeltaError("Not a delta")
+    header_end = delta.find(b"\n", len(MAGIC))
+    if header_end == -1:
+        raise DeltaError("Truncated delta")
+    try:
+        header = json.loads(delta[len(MAGIC):header_end])
+        ops = header["ops"]
+    except (ValueError, KeyError) as e:
+        raise DeltaError(f"Invalid delta header: {e}")
+
+    sent = memoryview(delta)[header_end + 1:]
+    sent_position = 0
+    digest = hashlib.sha256()
+    size = 0
+    with open(base_path, "rb") as base_file, open(file_path, "wb") as file:
+        for (offset, length) in ops:
+            if offset == SENT:
+                chunk = sent[sent_position:sent_position + length]
+                sent_position += length
+            else:
+                base_file.seek(offset)
+                chunk = base_file.read(length)
+            if len(chunk) != length:
+                raise DeltaError(f"Delta refers to bytes past the end of {'the delta' if offset == SENT else base_path}")
+            digest.update(chunk)
+            file.write(chunk)
+            size += length
+        file.flush()
+        os.fsync(file.fileno())
+
+    if size != header.get("size"):
+        raise DeltaError(f"Rebuilt {size} bytes, the delta says {header.get('size')}")
+    return (digest.hexdigest(), size)
+
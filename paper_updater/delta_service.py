@@ -0,0 +1,25 @@
+"""
+The delta service's side of paper_updater.delta, run by tools/delta_server.py.
+
+Jars are fetched into an artifact store the same way update.py downloads them, so the service knows every jar it
+has handed out (or that shares its store) as a base to make deltas from.
+"""
+from paper_updater.http_client import HttpClient
+from paper_updater.delta import make_delta
+
+
+class DeltaService:
+    def __init__(self, http: HttpClient):
+        self.http = http
+
+    def delta(self, base_sha256: str, url: str) -> bytes:
+        """The delta from the stored jar with base_sha256 to the jar at url, or None if there can't be one."""
+        store = self.http.store
+        if store.lookup(sha256=base_sha256) is None or not store.verify(base_sha256):
+            return None
+        target_sha256 = self.http.store_artifact(url)
+        if target_sha256 == base_sha256:
+            return None
+
+        with open(store.path(base_sha256), "rb") as base_file, open(store.path(target_sha256), "rb") as target_file:
+            return make_delta(base_file.read(), target_file.read())
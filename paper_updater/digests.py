@@ -0,0 +1,134 @@
+"""
+Digests (sha1, sha256, sha512) of local jars, for looking them up by hash (see paper_updater.identify) and checking
+them (see paper_updater.audit).
+
+Files are hashed in a thread pool, one per CPU by default. Each file is mapped into memory and every algorithm
+hashes the whole mapping in one call, which hashlib does without holding the GIL, so the threads really do run on
+all cores. Digests are kept in the cache directory by inode and reused for as long as the file's size, mtime and
+ctime stay the same, so only new or changed jars are ever read again. An inode shared through the artifact store is
+hashed once for every server on the host. ctime is part of the key as it can't be set back like mtime can.
+"""
+import os
+import json
+import mmap
+import hashlib
+import tempfile
+import threading
+import concurrent.futures
+
+from paper_updater import CACHE_DIR
+
+ALGORITHMS = ("sha1", "sha256", "sha512")
+DIGESTS_FILE_NAME = "digests.json"
+
+
+def hash_file(file_path: str, algorithms: tuple = ALGORITHMS) -> dict:
+    """{algorithm: hex digest} of file_path for every algorithm in algorithms."""
+    digests = {algorithm: hashlib.new(algorithm) for algorithm in algorithms}
+    with open(file_path, "rb") as file:
+        # Empty files can't be mapped, and their digests are the initial ones anyway
+        if os.fstat(file.fileno()).st_size > 0:
+            with mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as data:
+                if hasattr(data, "madvise"):
+                    data.madvise(mmap.MADV_SEQUENTIAL)
+                for digest in digests.values():
+                    digest.update(data)
+    return {algorithm: digest.hexdigest() for (algorithm, digest) in digests.items()}
+
+
+def _key(stat: os.stat_result) -> str:
+    return f"{stat.st_dev}:{stat.st_ino}"
+
+
+class DigestCache:
+    def __init__(self, cache_dir: str = CACHE_DIR):
+        # None keeps the digests in memory only
+        self.cache_dir = cache_dir
+        self._entries: dict[str, dict] = None
+        self._changed = False
+        self._lock = threading.Lock()
+
+    def _path(self) -> str:
+        return os.path.join(self.cache_dir, DIGESTS_FILE_NAME)
+
+    def _load(self) -> dict:
+        if self._entries is None:
+            self._entries = {}
+            if self.cache_dir is not None:
+                try:
+                    with open(self._path(), "r") as digests_file:
+                        self._entries = json.load(digests_file)["inodes"]
+                except (OSError, ValueError, KeyError):
+                    pass
+        return self._entries
+
+    def get(self, stat: os.stat_result) -> dict:
+        """The digests known for the file with stat, or {} if its size, mtime or ctime changed since."""
+        with self._lock:
+            entry = self._load().get(_key(stat))
+        if entry is None or (entry["size"], entry["mtime_ns"], entry["ctime_ns"]) != (stat.st_size, stat.st_mtime_ns, stat.st_ctime_ns):
+            return {}
+        return entry["digests"]
+
+    def put(self, file_path: str, stat: os.stat_result, digests: dict):
+        with self._lock:
+            entry = self._load().get(_key(stat))
+            if entry is None or (entry["size"], entry["mtime_ns"], entry["ctime_ns"]) != (stat.st_size, stat.st_mtime_ns, stat.st_ctime_ns):
+                entry = {"size": stat.st_size, "mtime_ns": stat.st_mtime_ns, "ctime_ns": stat.st_ctime_ns, "digests": {}}
+                self._entries[_key(stat)] = entry
+            # The path is only kept to tell when the inode is gone
+            entry["path"] = file_path
+            entry["digests"].update(digests)
+            self._changed = True
+
+    def save(self):
+        with self._lock:
+            if self.cache_dir is None or not self._changed:
+                return
+            # Inodes that are gone (or reused by another file) would only ever be looked up again by accident
+            entries = {}
+            for (key, entry) in self._entries.items():
+                try:
+                    if _key(os.stat(entry["path"])) == key:
+                        entries[key] = entry
+                except OSError:
+                    pass
+            self._entries = entries
+            os.makedirs(self.cache_dir, exist_ok=True)
+            (fd, temp_path) = tempfile.mkstemp(dir=self.cache_dir, suffix=".tmp")
+            with os.fdopen(fd, "w") as temp_file:
+                json.dump({"inodes": self._entries}, temp_file)
+            os.replace(temp_path, self._path())
+            self._changed = False
+
+    def digest_files(self, file_paths: list[str], algorithms: tuple = ALGORITHMS, jobs: int = None) -> dict:
+        """
+        Returns {file path: {algorithm: digest}} for file_paths, hashing the files whose digests aren't cached on up
+        to jobs threads (default: one per CPU). Files that can't be read are left out.
+        """
+        results = {}
+        to_hash = {}
+        for file_path in file_paths:
+            file_path = os.path.abspath(file_path)
+            try:
+                stat = os.stat(file_path)
+            except OSError:
+                continue
+            digests = self.get(stat)
+            if all(algorithm in digests for algorithm in algorithms):
+                results[file_path] = {algorithm: digests[algorithm] for algorithm in algorithms}
+            else:
+                to_hash[file_path] = stat
+
+        if len(to_hash) > 0:
+            with concurrent.futures.ThreadPoolExecutor(max_workers=jobs or os.cpu_count()) as executor:
+                futures = {file_path: executor.submit(hash_file, file_path, algorithms) for file_path in to_hash}
+                for (file_path, future) in futures.items():
+                    try:
+                        digests = future.result()
+                    except (OSError, ValueError):
+                        continue
+                    self.put(file_path, to_hash[file_path], digests)
+                    results[file_path] = digests
+            self.save()
+        return results
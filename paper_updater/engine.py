@@ -0,0 +1,123 @@
+"""
+Runs the plugins listed in the declarative manifest (plugins/updaters/plugins.json).
+
+A manifest entry looks like:
+    {"name": "ViaVersion", "prefix": "ViaVersion", "source": {"type": "github", "repo": "ViaVersion/ViaVersion"}}
+
+"prefix" is how the plugin's jar is found in the plugins directory. The installed version is whatever follows the
+prefix in the jar's file name, or failing that the version in its plugin.yml. Updated jars are saved as
+"<prefix>-<version>.jar".
+See paper_updater.sources for the source types and their options.
+"""
+import os
+import json
+
+from paper_updater.http_client import HttpClient
+from paper_updater.artifact_store import sha256_file
+from paper_updater.plugin_index import PluginIndex, JarInfo
+from paper_updater.sources import resolve_release
+
+
+def load_manifest(manifest_path: str) -> list[dict]:
+    with open(manifest_path, "r") as manifest_file:
+        return json.load(manifest_file)["plugins"]
+
+
+def get_current_version(plugin: dict, info: JarInfo) -> str:
+    version = os.path.splitext(info.name)[0][len(plugin["prefix"]):].lstrip("-")
+    if not version:
+        return info.declared_version or "???"
+
+    return version
+
+
+# Source types whose release versions leave out the build details the jars declare, e.g. a fill API's "2.2.3" for
+# a Floodgate build declaring "2.2.3-SNAPSHOT (b110-4e2c9a1)". Elsewhere such a version is a pre-release of 2.2.3.
+BUILD_DETAIL_SOURCES = ("fill",)
+
+
+def is_latest_version(plugin: dict, info: JarInfo, latest_version: str) -> bool:
+    declared_version = info.declared_version or ""
+    if get_current_version(plugin, info) == latest_version or declared_version == latest_version:
+        return True
+
+    return plugin["source"]["type"] in BUILD_DETAIL_SOURCES and (
+        declared_version.startswith(latest_version) and declared_version[len(latest_version)] in "-+ "
+    )
+
+
+def plan_plugin(plugin: dict, index: PluginIndex, http: HttpClient, mc_version: str) -> dict:
+    """
+    Works out what update_plugin would do, without changing anything. Returns None if the plugin isn't installed.
+    The plan has "name", "current_file", "current_version", "target_file", "target_version", "up_to_date",
+    "url", "sha256", "hashes", "size" and "mc_versions" (None, or {} for hashes, when the source doesn't publish it).
+    """
+    old_file = index.find(plugin["prefix"])
+    if old_file is None:
+        return None
+    return plan_release(plugin, old_file, index, resolve_release(http, plugin["source"], mc_version))
+
+
+def plan_release(plugin: dict, old_file: str, index: PluginIndex, release: dict) -> dict:
+    """The plan for replacing old_file with release (see paper_updater.sources), see plan_plugin."""
+    old_info = index.get(old_file)
+    return {
+        "name": plugin["name"],
+        "current_file": old_file,
+        "current_version": get_current_version(plugin, old_info),
+        "target_file": plugin["prefix"] + "-" + release["version"] + ".jar",
+        "target_version": release["version"],
+        "up_to_date": is_latest_version(plugin, old_info, release["version"]),
+        "url": release["url"],
+        "sha256": release["sha256"],
+        "hashes": release["hashes"],
+        "size": release["size"],
+        "mc_versions": release["mc_versions"],
+    }
+
+
+def check_plugin(plugin: dict, index: PluginIndex, http: HttpClient, mc_version: str) -> list[dict]:
+    plan = plan_plugin(plugin, index, http, mc_version)
+    if plan is None:
+        return []
+    return [plan]
+
+
+def update_plugin(plugin: dict, index: PluginIndex, http: HttpClient, mc_version: str) -> list[str]:
+    """Updates one manifest entry. Returns the plugin's jar file name, or [] if it isn't installed."""
+    if index.find(plugin["prefix"]) is None:
+        # Plugin not installed, skip
+        return []
+
+    print(f"Updating {plugin['name']}...")
+    return update_planned(plan_plugin(plugin, index, http, mc_version), index, http)
+
+
+def update_planned(plan: dict, index: PluginIndex, http: HttpClient) -> list[str]:
+    """Carries out a plan from plan_plugin or plan_release. Returns the plugin's jar file name."""
+    name = plan["name"]
+    old_file = plan["current_file"]
+    current_version = plan["current_version"]
+    latest_version = plan["target_version"]
+
+    if plan["up_to_date"]:
+        print(f"{name} already at latest version.")
+        return [old_file]
+
+    if current_version == "???":
+        print(f"{name} is at an unknown version! Will update anyway.")
+
+    new_file = plan["target_file"]
+    http.download(plan["url"], index.path(new_file), plan["sha256"], plan["size"], index.installed_path(old_file), plan["hashes"])
+    sha256 = plan["sha256"]
+    if sha256 is None and plan["hashes"]:
+        # Checked against what the source published, so its sha256 is as good as a published one for --audit
+        sha256 = sha256_file(index.path(new_file))
+    index.add(new_file, sha256)
+
+    if old_file != new_file:
+        print(f"Removing old {name} version: {old_file}")
+        index.remove(old_file)
+
+    print(f"Updated {name} from {current_version} -> {latest_version}")
+    return [new_file]
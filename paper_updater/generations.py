@@ -0,0 +1,283 @@
+"""
+Swaps a staged update into a server in one go, keeping what it replaced as a numbered generation.
+
+While a server is updated, new jars are only written to plugins/.staging.next (see begin_staging) and the new
+Paper build is only downloaded. Once everything is downloaded and verified, commit() renames the new jars into plugins,
+removes the old ones and points paper.jar at the new build. Each of those steps is a single rename, so the server is
+never without a working set of jars for longer than that, and an updater failing halfway never leaves a mix of versions.
+
+The jars that were removed or replaced (and the previous paper.jar) are kept in plugins/.generations/<n>, hardlinked
+where possible, and rollback() puts the newest generation back.
+
+The swap can also be put off: stage() leaves the downloaded jars in plugins/.staging with a list of the changes, and
+apply_staged() later commits them without any network access (update.py --daemon and --apply-staged). Each update
+starts from those staged changes in a directory of its own, which only replaces plugins/.staging once the update is
+done, so an update that fails halfway leaves the staged one as it was.
+"""
+import os
+import json
+import time
+import fcntl
+import shutil
+import contextlib
+
+from paper_updater.artifact_store import fsync_dir
+from paper_updater.plugin_index import PluginIndex, STAGING_DIR_NAME, NEXT_STAGING_DIR_NAME
+
+GENERATIONS_DIR_NAME = ".generations"
+GENERATION_FILE_NAME = "generation.json"
+# In the staging directory, lists the changes stage() left there
+STAGED_FILE_NAME = "staged.json"
+LOCK_FILE_NAME = ".staging.lock"
+# The staging directory that plugins/.staging.next replaced, until it's deleted
+OLD_STAGING_DIR_NAME = ".staging.old"
+KEEP_GENERATIONS = 5
+
+
+def swap_symlink(link_path: str, target: str):
+    """Points the symlink at link_path to target, replacing whatever is there in one rename."""
+    new_link_path = link_path + ".new"
+    if os.path.lexists(new_link_path):
+        os.remove(new_link_path)
+    os.symlink(target, new_link_path)
+    os.replace(new_link_path, link_path)
+
+
+def _keep(source_path: str, dest_path: str):
+    """Keeps a copy of source_path at dest_path, as a hardlink if the filesystem allows."""
+    try:
+        os.link(source_path, dest_path)
+    except OSError:
+        shutil.copy2(source_path, dest_path)
+
+
+class Generations:
+    def __init__(self, server_root: str, plugins_dir: str = None):
+        self.server_root = server_root
+        self.plugins_dir = plugins_dir or os.path.join(server_root, "plugins")
+        self.generations_dir = os.path.join(self.plugins_dir, GENERATIONS_DIR_NAME)
+        self.paper_jar = os.path.join(server_root, "paper.jar")
+        self.staging_dir = os.path.join(self.plugins_dir, STAGING_DIR_NAME)
+        self.next_staging_dir = os.path.join(self.plugins_dir, NEXT_STAGING_DIR_NAME)
+        self.old_staging_dir = os.path.join(self.plugins_dir, OLD_STAGING_DIR_NAME)
+        self.staged_path = os.path.join(self.staging_dir, STAGED_FILE_NAME)
+
+    @contextlib.contextmanager
+    def lock(self):
+        """Keeps other update.py processes from staging, committing or rolling back this server at the same time."""
+        os.makedirs(self.plugins_dir, exist_ok=True)
+        with open(os.path.join(self.plugins_dir, LOCK_FILE_NAME), "a") as lock_file:
+            fcntl.flock(lock_file.fileno(), fcntl.LOCK_EX)
+            yield
+
+    def _recover(self):
+        """Puts back the staging directory if a swap in _replace_staged was interrupted between its two renames."""
+        if not os.path.exists(self.staging_dir) and os.path.isdir(self.old_staging_dir):
+            os.rename(self.old_staging_dir, self.staging_dir)
+
+    def _replace_staged(self, staging_dir: str):
+        """Makes staging_dir the staging directory, deleting the one it replaces."""
+        if os.path.abspath(staging_dir) == os.path.abspath(self.staging_dir):
+            return
+        self._recover()
+        if os.path.exists(self.old_staging_dir):
+            shutil.rmtree(self.old_staging_dir)
+        if os.path.exists(self.staging_dir):
+            os.rename(self.staging_dir, self.old_staging_dir)
+        os.rename(staging_dir, self.staging_dir)
+        fsync_dir(self.plugins_dir)
+        shutil.rmtree(self.old_staging_dir, ignore_errors=True)
+
+    def begin_staging(self, index: PluginIndex):
+        """
+        Starts staging index's changes in plugins/.staging.next, on top of those stage() left, so jars already staged
+        aren't downloaded again. plugins/.staging isn't touched until commit() or stage() is done.
+        """
+        self._recover()
+        staged = self.staged()
+        index.begin_staging(self.next_staging_dir)
+        if staged is None:
+            return
+        # Only what's still there, e.g. the update may have been applied by hand since
+        added = [name for name in staged["added"] if os.path.isfile(os.path.join(self.staging_dir, name))]
+        index.resume_staging(added, staged["removed"], staged.get("checksums"), self.staging_dir)
+
+    def paper_is_at(self, paper_target: str) -> bool:
+        """Whether paper.jar already points at paper_target, so there is nothing to swap."""
+        return paper_target is not None and os.path.islink(self.paper_jar) and os.readlink(self.paper_jar) == paper_target
+
+    def numbers(self) -> list[int]:
+        if not os.path.isdir(self.generations_dir):
+            return []
+        return sorted(int(name) for name in os.listdir(self.generations_dir) if name.isdigit())
+
+    def path(self, number: int) -> str:
+        return os.path.join(self.generations_dir, str(number))
+
+    def read(self, number: int) -> dict:
+        with open(os.path.join(self.path(number), GENERATION_FILE_NAME), "r") as generation_file:
+            return json.load(generation_file)
+
+    def commit(self, index: PluginIndex, paper_target: str = None) -> int:
+        """
+        Swaps in the jars staged in index and, if given, points paper.jar at paper_target.
+        Returns the number of the generation holding what was replaced, or None if there was nothing to do.
+        """
+        (added, removed) = index.staged_changes()
+        if self.paper_is_at(paper_target):
+            paper_target = None
+        if len(added) == 0 and len(removed) == 0 and paper_target is None:
+            self._end_commit(index)
+            return None
+
+        numbers = self.numbers()
+        number = numbers[-1] + 1 if len(numbers) > 0 else 1
+        generation_dir = self.path(number)
+        os.makedirs(generation_dir)
+
+        replaced = [name for name in added if os.path.exists(os.path.join(self.plugins_dir, name))]
+        for name in removed + replaced:
+            _keep(os.path.join(self.plugins_dir, name), os.path.join(generation_dir, name))
+
+        paper = None
+        if paper_target is not None:
+            paper = {"target": paper_target, "previous_target": None, "previous_file": False}
+            if os.path.islink(self.paper_jar):
+                paper["previous_target"] = os.readlink(self.paper_jar)
+            elif os.path.exists(self.paper_jar):
+                _keep(self.paper_jar, os.path.join(generation_dir, "paper.jar"))
+                paper["previous_file"] = True
+
+        generation = {
+            "time": time.time(),
+            "added": [name for name in added if name not in replaced],
+            "replaced": replaced,
+            "removed": removed,
+            # Put back with the jars by rollback, see PluginIndex.add
+            "checksums": {name: index.installed_checksum(name) for name in removed + replaced},
+            "paper": paper,
+        }
+        with open(os.path.join(generation_dir, GENERATION_FILE_NAME), "w") as generation_file:
+            json.dump(generation, generation_file)
+            generation_file.flush()
+            os.fsync(generation_file.fileno())
+        fsync_dir(generation_dir)
+
+        # Nothing in the server has changed up to here
+        for name in added:
+            os.replace(os.path.join(index.staging_dir, name), os.path.join(self.plugins_dir, name))
+        for name in removed:
+            os.remove(os.path.join(self.plugins_dir, name))
+        if paper_target is not None:
+            swap_symlink(self.paper_jar, paper_target)
+        fsync_dir(self.plugins_dir)
+
+        self._end_commit(index)
+        self.prune()
+        return number
+
+    def _end_commit(self, index: PluginIndex):
+        staging_dir = index.staging_dir
+        index.end_staging()
+        # Whatever an earlier stage() left is superseded by this update (or was just committed, by apply_staged)
+        if os.path.abspath(staging_dir) != os.path.abspath(self.staging_dir):
+            self._replace_staged(staging_dir)
+        elif os.path.exists(self.staged_path):
+            os.remove(self.staged_path)
+
+    def stage(self, index: PluginIndex, paper_target: str = None) -> dict:
+        """
+        Leaves the jars staged in index in the staging directory, along with the list of changes, for apply_staged.
+        Returns that list, or None if there was nothing to stage.
+        """
+        (added, removed) = index.staged_changes()
+        # The checksums recorded for the staged jars would be lost with the staging, apply_staged puts them back
+        infos = [index.get(name) for name in added]
+        checksums = {info.name: info.sha256 for info in infos if info is not None and info.sha256 is not None}
+        staging_dir = index.staging_dir
+        index.end_staging(keep_files=True)
+        if self.paper_is_at(paper_target):
+            paper_target = None
+        staged_path = os.path.join(staging_dir, STAGED_FILE_NAME)
+        staged = None
+        if len(added) > 0 or len(removed) > 0 or paper_target is not None:
+            staged = {"time": time.time(), "added": added, "removed": removed, "checksums": checksums, "paper": paper_target}
+            with open(staged_path + ".tmp", "w") as staged_file:
+                json.dump(staged, staged_file)
+                staged_file.flush()
+                os.fsync(staged_file.fileno())
+            os.replace(staged_path + ".tmp", staged_path)
+        elif os.path.exists(staged_path):
+            os.remove(staged_path)
+        # Only now that everything is staged does it replace what an earlier stage() left
+        self._replace_staged(staging_dir)
+        return staged
+
+    def staged(self) -> dict:
+        """The changes left by stage(), or None."""
+        self._recover()
+        try:
+            with open(self.staged_path, "r") as staged_file:
+                return json.load(staged_file)
+        except FileNotFoundError:
+            return None
+
+    def apply_staged(self) -> (dict, int):
+        """
+        Commits the changes left by stage(). Returns (those changes, the generation number), or (None, None) if
+        there weren't any. Raises FileNotFoundError if a staged file has gone missing since.
+        """
+        staged = self.staged()
+        if staged is None:
+            return (None, None)
+        index = PluginIndex(self.plugins_dir)
+        missing = [name for name in staged["added"] if not os.path.isfile(os.path.join(index.staging_dir, name))]
+        if staged["paper"] is not None and not os.path.isfile(os.path.join(self.server_root, staged["paper"])):
+            missing.append(staged["paper"])
+        if len(missing) > 0:
+            raise FileNotFoundError(f"Staged files are missing, not applying any of them: {', '.join(missing)}")
+
+        index.resume_staging(staged["added"], staged["removed"], staged.get("checksums"))
+        try:
+            number = self.commit(index, staged["paper"])
+        except BaseException:
+            index.end_staging(keep_files=True)
+            raise
+        index.save()
+        return (staged, number)
+
+    def rollback(self) -> dict:
+        """Undoes the newest generation's update, returning its record, or None if there is none."""
+        numbers = self.numbers()
+        if len(numbers) == 0:
+            return None
+        number = numbers[-1]
+        generation_dir = self.path(number)
+        generation = self.read(number)
+
+        for name in generation["added"]:
+            jar_path = os.path.join(self.plugins_dir, name)
+            if os.path.exists(jar_path):
+                os.remove(jar_path)
+        for name in generation["replaced"] + generation["removed"]:
+            os.replace(os.path.join(generation_dir, name), os.path.join(self.plugins_dir, name))
+
+        paper = generation["paper"]
+        if paper is not None:
+            if paper["previous_target"] is not None:
+                swap_symlink(self.paper_jar, paper["previous_target"])
+            elif paper["previous_file"]:
+                os.replace(os.path.join(generation_dir, "paper.jar"), self.paper_jar)
+        fsync_dir(self.plugins_dir)
+
+        index = PluginIndex(self.plugins_dir)
+        index.set_checksums(generation.get("checksums", {}))
+        index.save()
+
+        shutil.rmtree(generation_dir)
+        return generation
+
+    def prune(self, keep: int = KEEP_GENERATIONS):
+        """Deletes all but the newest keep generations."""
+        for number in self.numbers()[:-keep]:
+            shutil.rmtree(self.path(number))
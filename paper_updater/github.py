@@ -0,0 +1,111 @@
+"""Helpers for updaters that download GitHub release assets."""
+import os
+
+from paper_updater.http_client import HttpClient
+
+GITHUB_API = "https://api.github.com"
+GITHUB_API_HOST = "api.github.com"
+GRAPHQL_URL = GITHUB_API + "/graphql"
+# Releases with more assets than this are left to the REST API
+MAX_ASSETS = 100
+
+
+def asset_sha256(asset: dict) -> str:
+    """
+    Returns the sha256 GitHub published for a release asset, or None.
+    Only assets uploaded since mid 2025 have a digest, in the form "sha256:<hex>".
+    """
+    digest = asset.get("digest")
+    if not digest or not digest.startswith("sha256:"):
+        return None
+    return digest[len("sha256:"):]
+
+
+def latest_release_url(repo: str) -> str:
+    """REST URL of the latest release of repo ("owner/name")."""
+    return GITHUB_API + "/repos/" + repo + "/releases/latest"
+
+
+def github_token() -> str:
+    """The GitHub token from $GITHUB_TOKEN (or $GH_TOKEN), or None."""
+    return os.environ.get("GITHUB_TOKEN") or os.environ.get("GH_TOKEN")
+
+
+def authorize(http: HttpClient) -> bool:
+    """Sends the GitHub token, if there is one, with every GitHub API request. Returns whether there was one."""
+    token = github_token()
+    if not token:
+        return False
+    http.host_headers[GITHUB_API_HOST] = {"Authorization": f"Bearer {token}"}
+    return True
+
+
+def _latest_releases_query(repos: list[str], with_digest: bool) -> dict:
+    asset_fields = "name downloadUrl size" + (" digest" if with_digest else "")
+    variables = {}
+    declarations = []
+    fields = []
+    for (i, repo) in enumerate(repos):
+        (owner, name) = repo.split("/", 1)
+        variables[f"owner{i}"] = owner
+        variables[f"name{i}"] = name
+        declarations.append(f"$owner{i}: String!, $name{i}: String!")
+        fields.append(
+            f"repo{i}: repository(owner: $owner{i}, name: $name{i}) "
+            f"{{ latestRelease {{ tagName releaseAssets(first: {MAX_ASSETS}) {{ totalCount nodes {{ {asset_fields} }} }} }} }}"
+        )
+    query = "query(" + ", ".join(declarations) + ") { " + " ".join(fields) + " }"
+    return {"query": query, "variables": variables}
+
+
+def _rest_release(release: dict) -> dict:
+    """Converts a GraphQL latestRelease into the parts of the REST release JSON updaters use."""
+    return {
+        "tag_name": release["tagName"],
+        "assets": [
+            {
+                "name": asset["name"],
+                "browser_download_url": asset["downloadUrl"],
+                "size": asset["size"],
+                "digest": asset.get("digest"),
+            }
+            for asset in release["releaseAssets"]["nodes"]
+        ],
+    }
+
+
+def prefetch_latest_releases(http: HttpClient, repos: list[str]) -> int:
+    """
+    Looks up the latest release of every repo ("owner/name") in a single GraphQL query, and hands each one to http
+    as the answer for its REST releases/latest URL, so updaters asking for that URL don't send a request of their own.
+    Repos http already knows the answer for are skipped. GraphQL needs a token; without one, or if the query fails,
+    nothing is prefetched and updaters use the REST API as before. Returns the number of releases prefetched.
+    """
+    repos = sorted({repo for repo in repos if not http.is_known(latest_release_url(repo))})
+    # A mirror answers the per-repo requests from its own cache, and doesn't get our token to query with
+    if len(repos) == 0 or not github_token() or http.mirror is not None:
+        return 0
+
+    try:
+        response = http.post_json(GRAPHQL_URL, _latest_releases_query(repos, True))
+        if response.get("data") is None:
+            # Asset digests are newer than the rest of the schema, try again without them
+            response = http.post_json(GRAPHQL_URL, _latest_releases_query(repos, False))
+    except Exception as e:
+        print(f"Unable to look up GitHub releases in one query, falling back to one request per repo: {e}")
+        return 0
+
+    data = response.get("data") or {}
+    prefetched = 0
+    for (i, repo) in enumerate(repos):
+        repository = data.get(f"repo{i}")
+        # Repos that don't exist or have no release are left to the REST API, which reports them as usual
+        if repository is None or repository["latestRelease"] is None:
+            continue
+        release = repository["latestRelease"]
+        if release["releaseAssets"]["totalCount"] > MAX_ASSETS:
+            continue
+        http.remember(latest_release_url(repo), _rest_release(release))
+        prefetched += 1
+
+    return prefetched
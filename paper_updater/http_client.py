@@ -0,0 +1,579 @@
+"""
+One HTTP client for the whole run.
+
+update.py creates a single HttpClient and hands it to every updater, so requests to the same host
+(most updaters talk to api.github.com) reuse pooled keep-alive connections instead of paying for a
+new TCP + TLS handshake each time. Every request has a timeout, so a hung host can't stall the run forever,
+and goes through the retry and circuit breaker policy in paper_updater.resilience.
+
+requests (or httpx) is only imported when the first request is actually sent. Importing it is a good part of
+the startup time, and a run answered entirely from the caches never needs it.
+"""
+import os
+import time
+import fcntl
+import hashlib
+import threading
+import contextlib
+import urllib.parse
+import importlib.util
+import concurrent.futures
+
+from paper_updater import run_report
+from paper_updater.metadata_cache import MetadataCache
+from paper_updater.artifact_store import ArtifactStore, sha256_file, fsync_dir
+from paper_updater.digests import hash_file
+from paper_updater.resilience import RetryPolicy, CircuitBreaker, HostUnavailable, should_retry
+
+USER_AGENT = "paper-plugin-updater"
+# (connect, read) in seconds
+DEFAULT_TIMEOUT = (10, 60)
+DEFAULT_POOL_SIZE = 10
+# Requests in flight to one host at a time, so a batch run doesn't hammer (or get rate limited by) a single upstream
+DEFAULT_HOST_LIMIT = 6
+CHUNK_SIZE = 1024 * 1024
+# Files smaller than this are always downloaded as one stream
+SEGMENT_MIN_SIZE = 8 * 1024 * 1024
+
+
+def http2_available() -> bool:
+    """Whether httpx and its http2 extra (h2) are installed, without importing them."""
+    return importlib.util.find_spec("httpx") is not None and importlib.util.find_spec("h2") is not None
+
+
+def mirror_url(mirror: str, url: str) -> str:
+    """Where a mirror at base URL mirror serves url: https://host/path?query becomes <mirror>/host/path?query."""
+    parts = urllib.parse.urlsplit(url)
+    return mirror.rstrip("/") + "/" + parts.netloc + urllib.parse.urlunsplit(("", "", parts.path, parts.query, ""))
+
+
+class DownloadError(Exception):
+    """A download didn't match the checksum or size its source published."""
+
+
+class RangeNotSupported(Exception):
+    """The server answered a byte range request with the whole file."""
+
+
+class RetryableResponse(Exception):
+    """A download was answered with a status worth trying again later (429, 5xx, rate limited)."""
+
+    def __init__(self, url: str, response):
+        super().__init__(f"{url}: HTTP {response.status_code}")
+        self.response = response
+
+
+class HttpClient:
+    def __init__(self, timeout: tuple = DEFAULT_TIMEOUT, pool_size: int = DEFAULT_POOL_SIZE, http2: bool = True, cache: MetadataCache = None, store: ArtifactStore = None, segments: int = 1, host_limit: int = DEFAULT_HOST_LIMIT, retry: RetryPolicy = None, breaker: CircuitBreaker = None, mirror: str = None, delta_service: str = None):
+        self.timeout = timeout
+        # Base URL every request is sent to instead of its own host, see mirror_url. URLs are still cached,
+        # limited and reported under their own host, so a run through a mirror behaves like one without.
+        self.mirror = mirror
+        # Base URL of a delta service (see paper_updater.delta) to ask for new versions of jars as deltas, or None
+        self.delta_service = delta_service
+        self.retry = retry or RetryPolicy()
+        self.breaker = breaker or CircuitBreaker()
+        self.host_limit = host_limit
+        self._host_slots: dict[str, threading.BoundedSemaphore] = {}
+        # Extra headers sent to a host, e.g. {"api.github.com": {"Authorization": ...}}
+        self.host_headers: dict[str, dict] = {}
+        # Large downloads are split into this many parallel byte ranges when the server supports it
+        self.segments = segments
+        self.cache = cache
+        self.store = store
+        # Responses already fetched this run, so servers and updaters asking for the same URL share one request
+        self._memo: dict[str, concurrent.futures.Future] = {}
+        self._memo_lock = threading.Lock()
+        self._download_locks: dict[str, threading.Lock] = {}
+        # HTTP/2 is only used when httpx and its http2 extra (h2) are installed
+        self.http2 = http2 and http2_available()
+        self.pool_size = pool_size
+        self._session = None
+        self._session_lock = threading.Lock()
+        # Errors after which a download can be resumed, filled in along with the session
+        self._transient_errors = ()
+
+    @property
+    def _client(self):
+        if self._session is None:
+            with self._session_lock:
+                if self._session is None:
+                    self._session = self._create_session()
+        return self._session
+
+    def _create_session(self):
+        headers = {"User-Agent": USER_AGENT}
+        if self.http2:
+            import httpx
+            self._transient_errors = (httpx.TransportError,)
+            return httpx.Client(
+                http2=True,
+                headers=headers,
+                follow_redirects=True,
+                timeout=httpx.Timeout(self.timeout[1], connect=self.timeout[0]),
+                limits=httpx.Limits(max_connections=self.pool_size, max_keepalive_connections=self.pool_size),
+            )
+
+        import requests
+        from requests.adapters import HTTPAdapter
+        self._transient_errors = (requests.ConnectionError, requests.Timeout, requests.exceptions.ChunkedEncodingError)
+        session = requests.Session()
+        session.headers.update(headers)
+        adapter = HTTPAdapter(pool_connections=self.pool_size, pool_maxsize=self.pool_size)
+        session.mount("https://", adapter)
+        session.mount("http://", adapter)
+        return session
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def close(self):
+        if self._session is not None:
+            self._session.close()
+
+    def _host_slot(self, url: str) -> threading.BoundedSemaphore:
+        """Returns the semaphore limiting requests to url's host to host_limit at a time."""
+        host = urllib.parse.urlsplit(url).netloc
+        with self._memo_lock:
+            slot = self._host_slots.get(host)
+            if slot is None:
+                slot = threading.BoundedSemaphore(max(1, self.host_limit))
+                self._host_slots[host] = slot
+        return slot
+
+    def _target(self, url: str) -> str:
+        """The URL a request for url is actually sent to."""
+        if self.mirror is None or url.startswith(self.mirror) or (self.delta_service is not None and url.startswith(self.delta_service)):
+            return url
+        return mirror_url(self.mirror, url)
+
+    def _headers(self, url: str, headers: dict = None) -> dict:
+        # A mirror makes its own requests upstream, our tokens stay here
+        if self.mirror is not None:
+            return headers
+        host_headers = self.host_headers.get(urllib.parse.urlsplit(url).netloc)
+        if not host_headers:
+            return headers
+        return {**host_headers, **(headers or {})}
+
+    def _request(self, url: str, send):
+        """
+        Sends a request with send(), retrying failures as the retry policy allows, and returns the last response.
+        Raises HostUnavailable without sending anything if url's host has failed too often lately.
+        """
+        host = urllib.parse.urlsplit(url).netloc
+        attempt = 0
+        while True:
+            trial = self.breaker.before_request(host)
+            try:
+                with self._host_slot(url):
+                    response = send()
+            except self._transient_errors:
+                self.breaker.record_failure(host)
+                delay = self.retry.wait(attempt)
+                if delay is None:
+                    raise
+            else:
+                if not should_retry(response):
+                    self.breaker.record_success(host)
+                    return response
+                self.breaker.record_failure(host)
+                delay = self.retry.wait(attempt, response)
+                if delay is None:
+                    return response
+                response.close()
+            finally:
+                if trial:
+                    self.breaker.end_trial(host)
+
+            run_report.add(retries=1)
+            time.sleep(delay)
+            attempt += 1
+
+    def get(self, url: str, headers: dict = None):
+        headers = self._headers(url, headers)
+        target = self._target(url)
+        if self.http2:
+            return self._request(url, lambda: self._client.get(target, headers=headers))
+        return self._request(url, lambda: self._client.get(target, headers=headers, timeout=self.timeout))
+
+    def post_json(self, url: str, body) -> dict:
+        """Sends body as JSON and returns the JSON response. Not remembered or cached, unlike get_json."""
+        headers = self._headers(url)
+        target = self._target(url)
+        start = time.monotonic()
+        if self.http2:
+            response = self._request(url, lambda: self._client.post(target, json=body, headers=headers))
+        else:
+            response = self._request(url, lambda: self._client.post(target, json=body, headers=headers, timeout=self.timeout))
+        run_report.add(metadata_requests=1, metadata_seconds=time.monotonic() - start)
+        response.raise_for_status()
+        return response.json()
+
+    def head(self, url: str):
+        target = self._target(url)
+        if self.http2:
+            return self._request(url, lambda: self._client.head(target))
+        return self._request(url, lambda: self._client.head(target, timeout=self.timeout, allow_redirects=True))
+
+    def get_json(self, url: str) -> dict:
+        """
+        Returns the JSON body at url. Each URL is only fetched once per client; concurrent callers asking for the
+        same URL wait for the first request instead of sending their own. Treat the result as read-only.
+        """
+        with self._memo_lock:
+            future = self._memo.get(url)
+            is_owner = future is None
+            if is_owner:
+                future = concurrent.futures.Future()
+                self._memo[url] = future
+
+        if not is_owner:
+            run_report.add(cache_hits=1)
+            return future.result()
+
+        try:
+            body = self.fetch_json(url)
+        except BaseException as e:
+            with self._memo_lock:
+                del self._memo[url]
+            future.set_exception(e)
+            raise
+
+        future.set_result(body)
+        return body
+
+    def remember(self, url: str, body):
+        """
+        Records body as the answer to get_json(url), for metadata learned some other way (e.g. a batched query).
+        It is also written to the metadata cache, without validators, so it counts as fresh for the usual TTL.
+        """
+        with self._memo_lock:
+            if url in self._memo:
+                return
+            future = concurrent.futures.Future()
+            future.set_result(body)
+            self._memo[url] = future
+        if self.cache is not None:
+            self.cache.put(url, None, None, body)
+
+    def is_known(self, url: str) -> bool:
+        """Whether get_json(url) would be answered without sending a request."""
+        with self._memo_lock:
+            if url in self._memo:
+                return True
+        if self.cache is None:
+            return False
+        entry = self.cache.get(url)
+        return entry is not None and self.cache.is_fresh(entry)
+
+    def forget(self):
+        """Drops the responses remembered by get_json, so the next calls go to the cache or network again."""
+        with self._memo_lock:
+            self._memo = {}
+
+    def _get_metadata(self, url: str, headers: dict = None):
+        start = time.monotonic()
+        response = self.get(url, headers=headers)
+        run_report.add(metadata_requests=1, metadata_seconds=time.monotonic() - start)
+        return response
+
+    def fetch_json(self, url: str) -> dict:
+        """Like get_json, but not remembered: answered from the metadata cache while fresh, otherwise (re)fetched."""
+        if self.cache is None:
+            response = self._get_metadata(url)
+            response.raise_for_status()
+            return response.json()
+
+        entry = self.cache.get(url)
+        if entry is not None and self.cache.is_fresh(entry):
+            run_report.add(cache_hits=1)
+            return entry["body"]
+
+        headers = self.cache.conditional_headers(entry) if entry is not None else None
+        response = self._get_metadata(url, headers=headers)
+        if response.status_code == 304 and entry is not None:
+            run_report.add(cache_hits=1)
+            return self.cache.refresh(url, entry)["body"]
+
+        response.raise_for_status()
+        body = response.json()
+        self.cache.put(url, response.headers.get("ETag"), response.headers.get("Last-Modified"), body)
+        return body
+
+    @contextlib.contextmanager
+    def stream(self, url: str, headers: dict = None):
+        """
+        Yields (response, chunks) for a streamed GET, where chunks iterates over the response body.
+        The request counts against its host's limit until the stream is closed. It isn't retried here, as the
+        caller knows how to resume; statuses worth retrying raise RetryableResponse for it to handle.
+        """
+        host = urllib.parse.urlsplit(url).netloc
+        trial = self.breaker.before_request(host)
+        try:
+            with self._host_slot(url):
+                try:
+                    if self.http2:
+                        context = self._client.stream("GET", self._target(url), headers=self._headers(url, headers))
+                    else:
+                        context = self._client.get(self._target(url), headers=self._headers(url, headers), timeout=self.timeout, stream=True)
+                    with context as response:
+                        if should_retry(response):
+                            self.breaker.record_failure(host)
+                            raise RetryableResponse(url, response)
+                        self.breaker.record_success(host)
+                        if self.http2:
+                            yield (response, response.iter_bytes(CHUNK_SIZE))
+                        else:
+                            yield (response, response.iter_content(CHUNK_SIZE))
+                except self._transient_errors:
+                    self.breaker.record_failure(host)
+                    raise
+        finally:
+            if trial:
+                self.breaker.end_trial(host)
+
+    def _fetch(self, url: str, file_path: str) -> (str, int):
+        """
+        Downloads url into file_path and returns (sha256, size).
+        If file_path already holds the start of the file (a .part left by an interrupted download), only the rest
+        is requested. Large files may be fetched as several byte ranges in parallel, see HttpClient.segments.
+        """
+        if self.segments > 1 and not os.path.exists(file_path):
+            result = self._fetch_segmented(url, file_path)
+            if result is not None:
+                return result
+
+        attempt = 0
+        while True:
+            try:
+                return self._fetch_stream(url, file_path)
+            except self._transient_errors + (RetryableResponse,) as e:
+                delay = self.retry.wait(attempt, getattr(e, "response", None))
+                if delay is None:
+                    raise
+                run_report.add(retries=1)
+                print("Download interrupted, resuming...")
+                time.sleep(delay)
+                attempt += 1
+
+    def _fetch_stream(self, url: str, file_path: str) -> (str, int):
+        digest = hashlib.sha256()
+        size = 0
+        with open(file_path, "a+b") as file:
+            # Another process may be downloading into the same .part file
+            fcntl.flock(file.fileno(), fcntl.LOCK_EX)
+            file.seek(0)
+            for chunk in iter(lambda: file.read(CHUNK_SIZE), b""):
+                digest.update(chunk)
+                size += len(chunk)
+
+            headers = {"Range": f"bytes={size}-"} if size > 0 else None
+            with self.stream(url, headers) as (response, chunks):
+                if size > 0 and response.status_code == 416:
+                    # Nothing left to download, verification will tell whether the .part is actually complete
+                    return (digest.hexdigest(), size)
+                response.raise_for_status()
+
+                content_range = response.headers.get("Content-Range", "")
+                if size > 0 and (response.status_code != 206 or not content_range.startswith(f"bytes {size}-")):
+                    # The server ignored our Range header and is sending the whole file, so start over
+                    file.truncate(0)
+                    digest = hashlib.sha256()
+                    size = 0
+
+                for chunk in chunks:
+                    digest.update(chunk)
+                    file.write(chunk)
+                    size += len(chunk)
+                    run_report.add(download_bytes=len(chunk))
+
+            file.flush()
+            os.fsync(file.fileno())
+
+        return (digest.hexdigest(), size)
+
+    def _fetch_segmented(self, url: str, file_path: str) -> (str, int):
+        """
+        Downloads url as self.segments byte ranges in parallel and returns (sha256, size).
+        Returns None when the server doesn't advertise range support or the file is too small to be worth it.
+        """
+        response = self.head(url)
+        if response.status_code != 200 or response.headers.get("Accept-Ranges") != "bytes":
+            return None
+        length = int(response.headers.get("Content-Length", 0))
+        if length < SEGMENT_MIN_SIZE:
+            return None
+
+        bounds = [(i * length // self.segments, (i + 1) * length // self.segments - 1) for i in range(self.segments)]
+        try:
+            with open(file_path, "wb") as file:
+                file.truncate(length)
+                with concurrent.futures.ThreadPoolExecutor(max_workers=self.segments) as executor:
+                    # The segments' bytes count towards whoever asked for the download
+                    stats = run_report.current()
+                    futures = [executor.submit(self._fetch_segment, url, file.fileno(), start, end, stats) for (start, end) in bounds]
+                    for future in futures:
+                        future.result()
+                os.fsync(file.fileno())
+        except RangeNotSupported:
+            os.remove(file_path)
+            return None
+        except BaseException:
+            # A half-filled segmented file can't be resumed as a single stream
+            os.remove(file_path)
+            raise
+
+        return (sha256_file(file_path), length)
+
+    def _fetch_segment(self, url: str, fd: int, start: int, end: int, stats: run_report.Stats = None):
+        position = start
+        attempt = 0
+        while True:
+            try:
+                with self.stream(url, {"Range": f"bytes={position}-{end}"}) as (response, chunks):
+                    if response.status_code != 206:
+                        raise RangeNotSupported(url)
+                    for chunk in chunks:
+                        os.pwrite(fd, chunk, position)
+                        position += len(chunk)
+                        if stats is not None:
+                            stats.add(download_bytes=len(chunk))
+            except self._transient_errors + (RetryableResponse,) as e:
+                delay = self.retry.wait(attempt, getattr(e, "response", None))
+                if delay is None:
+                    raise
+                if stats is not None:
+                    stats.add(retries=1)
+                time.sleep(delay)
+                attempt += 1
+                continue
+
+            if position > end:
+                return
+            # The server closed the range early without an error, which is worth as many retries as one
+            delay = self.retry.wait(attempt)
+            if delay is None:
+                raise DownloadError(f"{url}: byte range {start}-{end} ended early at {position}")
+            time.sleep(delay)
+            attempt += 1
+
+    def _fetch_delta(self, url: str, base_path: str, temp_path: str, sha256: str) -> bool:
+        """
+        Rebuilds the jar at url in temp_path from base_path, its previous version, and a delta from the delta service.
+        Returns whether that worked and the result has the expected sha256. Any failure just means a full download.
+        """
+        # Only runs with --delta get here
+        from paper_updater import delta
+        base_sha256 = sha256_file(base_path)
+        try:
+            response = self.get(delta.delta_url(self.delta_service, base_sha256, url))
+        except self._transient_errors + (HostUnavailable,):
+            return False
+        if response.status_code != 200:
+            return False
+        run_report.add(download_bytes=len(response.content))
+
+        try:
+            (rebuilt_sha256, _) = delta.apply_delta(base_path, response.content, temp_path)
+        except (delta.DeltaError, OSError) as e:
+            print(f"Unable to apply the delta, downloading the whole file: {e}")
+            rebuilt_sha256 = None
+        if rebuilt_sha256 != sha256.lower():
+            if rebuilt_sha256 is not None:
+                print("The jar rebuilt from the delta doesn't match its checksum, downloading the whole file")
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+            return False
+
+        run_report.add(delta_downloads=1)
+        print(f"Rebuilt from a {len(response.content) / 1024:.0f} KiB delta")
+        return True
+
+    def _fetch_verified(self, url: str, temp_path: str, sha256: str, size: int, base_path: str = None, hashes: dict = None) -> str:
+        """
+        Downloads url into temp_path and checks it against the expected sha256, size and other hashes
+        ({algorithm: hex digest}). Returns its sha256.
+        If the download is interrupted temp_path is kept, so the next attempt can resume it.
+        With a delta service, base_path (the jar's previous version) and a known sha256, a delta is tried first.
+        """
+        start = time.monotonic()
+        use_delta = (
+            self.delta_service is not None and base_path is not None and sha256 is not None
+            # A .part left by an interrupted download is worth more than a delta
+            and os.path.isfile(base_path) and not os.path.exists(temp_path)
+        )
+        try:
+            if use_delta and self._fetch_delta(url, base_path, temp_path, sha256):
+                return sha256.lower()
+            (fetched_sha256, fetched_size) = self._fetch(url, temp_path)
+        finally:
+            run_report.add(download_seconds=time.monotonic() - start)
+        try:
+            if size is not None and fetched_size != size:
+                raise DownloadError(f"{url}: expected {size} bytes but got {fetched_size}")
+            if sha256 is not None and fetched_sha256 != sha256.lower():
+                raise DownloadError(f"{url}: expected sha256 {sha256} but got {fetched_sha256}")
+            if hashes:
+                fetched_hashes = hash_file(temp_path, tuple(hashes))
+                for (algorithm, digest) in hashes.items():
+                    if fetched_hashes[algorithm] != digest.lower():
+                        raise DownloadError(f"{url}: expected {algorithm} {digest} but got {fetched_hashes[algorithm]}")
+        except DownloadError:
+            os.remove(temp_path)
+            raise
+
+        return fetched_sha256
+
+    def download(self, url: str, file_path: str, sha256: str = None, size: int = None, base_path: str = None, hashes: dict = None) -> str:
+        """
+        Downloads url to file_path.
+        The file is streamed to a temp file and checked against sha256, size and hashes ({algorithm: hex digest} of
+        any other digests the source publishes, e.g. Modrinth's sha512), when given, before it replaces file_path
+        in one rename, so a truncated or corrupt download never replaces a working jar.
+        With an artifact store, the store is checked first (by sha256 if known, otherwise by url), and
+        file_path ends up linked to the stored copy.
+        base_path is the version being replaced, if any, which a delta service can send a delta against.
+        """
+        file_name = os.path.basename(file_path)
+        if self.store is None:
+            if sha256 is not None and os.path.isfile(file_path) and sha256_file(file_path) == sha256.lower():
+                print(f"{file_name} is already downloaded")
+                run_report.add(cache_hits=1)
+                return file_path
+
+            print(f"Downloading {file_name}...")
+            temp_path = file_path + ".part"
+            self._fetch_verified(url, temp_path, sha256, size, base_path, hashes)
+            os.replace(temp_path, file_path)
+            fsync_dir(os.path.dirname(os.path.abspath(file_path)))
+            return file_path
+
+        stored_sha256 = self.store_artifact(url, sha256, size, base_path, file_name, hashes)
+        self.store.link(stored_sha256, file_path)
+        return file_path
+
+    def store_artifact(self, url: str, sha256: str = None, size: int = None, base_path: str = None, file_name: str = None, hashes: dict = None) -> str:
+        """Makes sure the artifact at url is in the store, downloading it if it isn't, and returns its sha256."""
+        file_name = file_name or os.path.basename(url.split("?")[0])
+        # Only one thread downloads a given artifact, the others then find it in the store
+        with self._memo_lock:
+            download_lock = self._download_locks.setdefault(sha256 or url, threading.Lock())
+
+        with download_lock:
+            stored_sha256 = self.store.lookup(url, sha256)
+            if stored_sha256 is not None:
+                if self.store.verify(stored_sha256, size):
+                    print(f"Using cached {file_name}")
+                    run_report.add(cache_hits=1)
+                    return stored_sha256
+                print(f"The cached {file_name} was changed since it was downloaded, downloading it again")
+                self.store.discard(stored_sha256)
+
+            print(f"Downloading {file_name}...")
+            temp_path = self.store.part_path(url)
+            fetched_sha256 = self._fetch_verified(url, temp_path, sha256, size, base_path, hashes)
+            return self.store.add(temp_path, url, fetched_sha256)
@@ -0,0 +1,112 @@
+"""
+Finds updates for installed jars that no updater accounts for, by recognising the jars by their hashes
+(update.py --identify), so plugins from Modrinth and Hangar don't need a plugins.json entry or an updater script.
+
+Modrinth knows the hashes of every file it hosts: one POST to /version_files/update with the sha512 of every
+unaccounted jar returns, for each jar it recognises, the newest version for the Minecraft version on Paper, Spigot or
+Bukkit. Jars Modrinth doesn't know are looked up on Hangar, under the name in their plugin.yml, and recognised by
+the sha256 of one of the project's recent versions. Jars neither of them recognises are left alone.
+"""
+import urllib.parse
+import concurrent.futures
+
+from paper_updater import engine
+from paper_updater.digests import DigestCache
+from paper_updater.http_client import HttpClient
+from paper_updater.plugin_index import PluginIndex, parse_jar_name
+from paper_updater.sources import (
+    MODRINTH_API, MODRINTH_LOADERS, HANGAR_API, SourceError,
+    modrinth_release_from_version, hangar_release,
+)
+
+MODRINTH_ALGORITHM = "sha512"
+# Modrinth takes any number of hashes, this only keeps request bodies sensible
+MAX_HASHES_PER_REQUEST = 500
+# How many of a Hangar project's newest versions an installed jar is compared against
+HANGAR_VERSIONS = 25
+# Hangar lookups made at the same time, HttpClient's per-host limit applies on top
+HANGAR_JOBS = 8
+
+
+def modrinth_updates(http: HttpClient, hashes: list[str], mc_version: str) -> dict:
+    """{hash: newest Modrinth version object for mc_version} for the hashes Modrinth recognises."""
+    versions = {}
+    for start in range(0, len(hashes), MAX_HASHES_PER_REQUEST):
+        versions.update(http.post_json(MODRINTH_API + "/version_files/update", {
+            "hashes": hashes[start:start + MAX_HASHES_PER_REQUEST],
+            "algorithm": MODRINTH_ALGORITHM,
+            "loaders": MODRINTH_LOADERS,
+            "game_versions": [mc_version],
+        }))
+    return versions
+
+
+def hangar_update(http: HttpClient, project: str, sha256: str, mc_version: str) -> dict:
+    """
+    The newest release of the Hangar project for mc_version, if one of the project's newest versions is the jar
+    with sha256. Otherwise None.
+    """
+    query = urllib.parse.urlencode({"limit": HANGAR_VERSIONS, "offset": 0, "platform": "PAPER"})
+    try:
+        versions = http.get_json(HANGAR_API + "/projects/" + urllib.parse.quote(project) + "/versions?" + query)["result"]
+    except Exception:
+        # Most plugins simply aren't on Hangar under that name
+        return None
+    if not any(version["downloads"].get("PAPER", {}).get("fileInfo", {}).get("sha256Hash") == sha256 for version in versions):
+        return None
+
+    try:
+        return hangar_release(http, {"type": "hangar", "project": project}, mc_version)
+    except SourceError:
+        # Recognised, but there's no release for mc_version to update to
+        return None
+
+
+def identified_plan(index: PluginIndex, file_name: str, name: str, release: dict, up_to_date: bool) -> dict:
+    # Updated jars keep the installed jar's name, with the new version
+    plugin = {"name": name, "prefix": parse_jar_name(file_name)[0]}
+    plan = engine.plan_release(plugin, file_name, index, release)
+    plan["up_to_date"] = plan["up_to_date"] or up_to_date
+    return plan
+
+
+def update_identified(plan: dict, index: PluginIndex, http: HttpClient, mc_version: str) -> list[str]:
+    """Carries out a plan from identify, called like the other updaters."""
+    print(f"Updating {plan['name']} ({plan['current_file']})...")
+    return engine.update_planned(plan, index, http)
+
+
+def identify(http: HttpClient, index: PluginIndex, file_names: list[str], mc_version: str, digest_cache: DigestCache) -> (list[dict], list[str]):
+    """
+    Recognises the jars file_names in index by their hashes. Returns the plans for updating the recognised ones
+    (see paper_updater.engine), and the names of the jars that weren't recognised.
+    """
+    paths = {index.installed_path(file_name): file_name for file_name in file_names}
+    digests = {paths[path]: file_digests for (path, file_digests) in digest_cache.digest_files(list(paths), ("sha256", MODRINTH_ALGORITHM)).items()}
+
+    plans = {}
+    hashes = sorted({file_digests[MODRINTH_ALGORITHM] for file_digests in digests.values()})
+    modrinth_versions = modrinth_updates(http, hashes, mc_version) if len(hashes) > 0 else {}
+    for (file_name, file_digests) in digests.items():
+        version = modrinth_versions.get(file_digests[MODRINTH_ALGORITHM])
+        if version is None:
+            continue
+        release = modrinth_release_from_version(version)
+        up_to_date = any(file.get("hashes", {}).get(MODRINTH_ALGORITHM) == file_digests[MODRINTH_ALGORITHM] for file in version["files"])
+        plans[file_name] = identified_plan(index, file_name, index.get(file_name).plugin_id, release, up_to_date)
+
+    remaining = [file_name for file_name in digests if file_name not in plans]
+    with concurrent.futures.ThreadPoolExecutor(max_workers=HANGAR_JOBS) as executor:
+        futures = [
+            executor.submit(hangar_update, http, index.get(file_name).plugin_id, digests[file_name]["sha256"], mc_version)
+            for file_name in remaining
+        ]
+        for (file_name, future) in zip(remaining, futures):
+            release = future.result()
+            if release is not None:
+                plans[file_name] = identified_plan(index, file_name, index.get(file_name).plugin_id, release, release["sha256"] == digests[file_name]["sha256"])
+
+    return (
+        [plans[file_name] for file_name in file_names if file_name in plans],
+        [file_name for file_name in file_names if file_name not in plans],
+    )
@@ -0,0 +1,119 @@
+"""
+On-disk cache for JSON metadata responses (release listings, build info, ...).
+
+Each URL's last response is kept along with its ETag and Last-Modified headers. While an entry is younger than
+the TTL it is used as-is; once it expires the next request is made conditional, so unchanged metadata comes back
+as a cheap 304 instead of a full body. The cache is bounded in size, dropping the least recently used entries first.
+"""
+import os
+import json
+import time
+import hashlib
+import tempfile
+import threading
+
+from paper_updater import CACHE_DIR
+
+DEFAULT_TTL = 5 * 60
+DEFAULT_MAX_BYTES = 32 * 1024 * 1024
+
+
+class MetadataCache:
+    def __init__(self, cache_dir: str = os.path.join(CACHE_DIR, "metadata"), ttl: float = DEFAULT_TTL, max_bytes: int = DEFAULT_MAX_BYTES):
+        self.cache_dir = cache_dir
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        os.makedirs(cache_dir, exist_ok=True)
+        self._total_bytes = sum(entry.stat().st_size for entry in os.scandir(cache_dir) if entry.name.endswith(".json"))
+
+    def _path(self, url: str) -> str:
+        return os.path.join(self.cache_dir, hashlib.sha256(url.encode()).hexdigest() + ".json")
+
+    def get(self, url: str) -> dict:
+        """
+        Returns the cached entry for url, or None.
+        An entry has "etag", "last_modified", "stored_at" and "body" keys.
+        """
+        path = self._path(url)
+        try:
+            with open(path, "r") as entry_file:
+                entry = json.load(entry_file)
+            # Reading counts as a use, so eviction drops the least recently used entries
+            os.utime(path)
+        except (OSError, ValueError):
+            return None
+
+        if entry.get("url") != url:
+            return None
+        return entry
+
+    def is_fresh(self, entry: dict) -> bool:
+        return time.time() - entry["stored_at"] < self.ttl
+
+    def conditional_headers(self, entry: dict) -> dict:
+        headers = {}
+        if entry.get("etag"):
+            headers["If-None-Match"] = entry["etag"]
+        if entry.get("last_modified"):
+            headers["If-Modified-Since"] = entry["last_modified"]
+        return headers
+
+    def put(self, url: str, etag: str, last_modified: str, body) -> dict:
+        entry = {
+            "url": url,
+            "etag": etag,
+            "last_modified": last_modified,
+            "stored_at": time.time(),
+            "body": body,
+        }
+        self._write(url, entry)
+        return entry
+
+    def refresh(self, url: str, entry: dict) -> dict:
+        """Marks entry as fresh again after the server confirmed it is unchanged (304)."""
+        entry["stored_at"] = time.time()
+        self._write(url, entry)
+        return entry
+
+    def _write(self, url: str, entry: dict):
+        path = self._path(url)
+        data = json.dumps(entry).encode()
+
+        # Written to a temp file and renamed, so concurrent readers never see a half-written entry
+        (fd, temp_path) = tempfile.mkstemp(dir=self.cache_dir, suffix=".tmp")
+        with os.fdopen(fd, "wb") as temp_file:
+            temp_file.write(data)
+
+        with self._lock:
+            try:
+                old_size = os.path.getsize(path)
+            except OSError:
+                old_size = 0
+            os.replace(temp_path, path)
+            self._total_bytes += len(data) - old_size
+            if self._total_bytes > self.max_bytes:
+                self._evict()
+
+    def _evict(self):
+        entries = [entry for entry in os.scandir(self.cache_dir) if entry.name.endswith(".json")]
+        entries.sort(key=lambda entry: entry.stat().st_mtime)
+
+        # Evict down to 3/4 of the limit so we aren't evicting again on the very next write
+        target = self.max_bytes * 3 // 4
+        for entry in entries:
+            if self._total_bytes <= target:
+                break
+            try:
+                size = entry.stat().st_size
+                os.remove(entry.path)
+            except OSError:
+                continue
+            self._total_bytes -= size
+
+    def clear(self):
+        with self._lock:
+            for entry in os.scandir(self.cache_dir):
+                if entry.name.endswith(".json"):
+                    os.remove(entry.path)
+            self._total_bytes = 0
@@ -0,0 +1,270 @@
+"""
+Caching mirror for a fleet of servers (update.py --serve-mirror).
+
+Other hosts run update.py with --mirror http://<mirror>:<port> (or $PAPER_UPDATER_MIRROR), which sends a request
+for https://<host>/<path> to the mirror as /<host>/<path>. The mirror answers from its own metadata cache and
+artifact store, going upstream only for what it hasn't got (or what has gone stale), so each Paper build, release
+listing and jar is fetched once per fleet and everything else is a LAN request.
+
+Jar downloads are served from the store with Range support, so clients can resume and use --segments as usual.
+Everything else is treated as JSON metadata: cached for the mirror's --cache-ttl and served with an ETag, so
+clients revalidating their own cache get a 304. With the store, the mirror also serves deltas (see
+paper_updater.delta) at /_delta/<old sha256>/<host>/<path>, for clients run with --delta <mirror>/_delta.
+
+The one JSON POST request the updaters make, Modrinth's hash lookup (see paper_updater.identify), is passed upstream
+as it is, uncached. No other POST is mirrored.
+
+Only the requests the updaters make are mirrored (see upstream_routes): the mirror sends the GitHub token it was given
+with GitHub API requests, so anything else on those hosts is refused rather than made on the operator's behalf. It
+listens on localhost unless told otherwise, serving a fleet takes an explicit HOST:PORT.
+"""
+import os
+import re
+import sys
+import json
+import hashlib
+import urllib.parse
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+from paper_updater.delta import parse_delta_path
+from paper_updater.delta_service import DeltaService
+from paper_updater.http_client import HttpClient
+from paper_updater.resilience import HostUnavailable
+
+DEFAULT_HOST = "127.0.0.1"
+DEFAULT_PORT = 8780
+DELTA_PREFIX = "/_delta"
+# Paths below a PaperMC style v2 downloads API (see paper_updater.sources.fill_release and paper_updater.paper)
+FILL_PATHS = r"/projects/[^/]+(/versions/[^/]+(/builds(/\d+(/downloads/[^/]+)?)?)?)?"
+# Paths below a Jenkins job (see paper_updater.sources.jenkins_release)
+JENKINS_PATHS = r"(/lastSuccessfulBuild/api/json|/\d+/artifact/.+)"
+# The paths the built-in sources and updaters request on each host, as regexes. Sources in the plugin manifest add theirs.
+KNOWN_ROUTES = {
+    "api.papermc.io": ["/v2" + FILL_PATHS],
+    "api.github.com": [r"/repos/[^/]+/[^/]+/releases/latest"],
+    "github.com": [r"/[^/]+/[^/]+/releases/download/[^/]+/[^/]+"],
+    # Where GitHub redirects asset downloads, with signed URLs
+    "objects.githubusercontent.com": [r"/.+"],
+    "release-assets.githubusercontent.com": [r"/.+"],
+    "download.geysermc.org": ["/v2" + FILL_PATHS],
+    "api.modrinth.com": [r"/v2/project/[^/]+/version"],
+    "cdn.modrinth.com": [r"/data/.+"],
+    "hangar.papermc.io": [r"/api/v1/projects/[^/]+(/[^/]+)?/versions"],
+    "hangarcdn.papermc.io": [r"/.+"],
+}
+# The only URL passed on for POST requests
+POST_URLS = ("https://api.modrinth.com/v2/version_files/update",)
+SEND_CHUNK_SIZE = 1024 * 1024
+
+
+def upstream_routes(manifest_plugins: list[dict]) -> dict:
+    """
+    {host: compiled regex of the paths mirrored there}: KNOWN_ROUTES plus the paths below the Jenkins jobs and fill
+    APIs in the manifest's sources.
+    """
+    routes = {host: list(paths) for (host, paths) in KNOWN_ROUTES.items()}
+    for plugin in manifest_plugins:
+        source = plugin.get("source", {})
+        base = source.get({"jenkins": "job", "fill": "api"}.get(source.get("type"), ""))
+        if not isinstance(base, str) or not base.startswith("https://"):
+            continue
+        parts = urllib.parse.urlsplit(base)
+        paths = JENKINS_PATHS if source["type"] == "jenkins" else FILL_PATHS
+        routes.setdefault(parts.netloc, []).append(re.escape(parts.path.rstrip("/")) + paths)
+    return {host: re.compile("|".join(f"(?:{path})" for path in paths)) for (host, paths) in routes.items()}
+
+
+def is_routed(routes: dict, url: str) -> bool:
+    """Whether url is one of the requests mirrored according to routes (see upstream_routes)."""
+    parts = urllib.parse.urlsplit(url)
+    pattern = routes.get(parts.netloc)
+    return parts.scheme == "https" and pattern is not None and pattern.fullmatch(parts.path) is not None
+
+
+def is_artifact(url: str) -> bool:
+    """Whether url is a file download rather than API metadata, going by the URL patterns of the sources."""
+    path = urllib.parse.urlsplit(url).path
+    return path.endswith(".jar") or "/downloads/" in path or "/artifact/" in path or "/releases/download/" in path
+
+
+def parse_range(range_header: str, size: int) -> (int, int):
+    """(start, end) of a single "bytes=start-end" range, or None if there isn't one that can be served."""
+    if not range_header or not range_header.startswith("bytes=") or "," in range_header:
+        return None
+    (first, _, last) = range_header[len("bytes="):].partition("-")
+    try:
+        if first == "":
+            # "bytes=-N" is the last N bytes
+            start = max(0, size - int(last))
+            end = size - 1
+        else:
+            start = int(first)
+            end = min(int(last), size - 1) if last else size - 1
+    except ValueError:
+        return None
+    return (start, end)
+
+
+class MirrorHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    # Set by serve()
+    http = None
+    delta_service = None
+    routes = {}
+
+    def log_message(self, format: str, *args):
+        sys.stderr.write(f"{self.address_string()} {format % args}\n")
+
+    def do_HEAD(self):
+        self.serve(send_body=False)
+
+    def do_GET(self):
+        self.serve(send_body=True)
+
+    def do_POST(self):
+        body = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        (host, _, rest) = self.path.lstrip("/").partition("/")
+        url = "https://" + host + "/" + rest
+        if url not in POST_URLS:
+            self.respond(404, "text/plain", b"Not mirrored\n")
+            return
+        try:
+            answer = self.http.post_json(url, json.loads(body))
+        except ConnectionError:
+            self.close_connection = True
+            return
+        except HostUnavailable as e:
+            self.respond(503, "text/plain", f"{e}\n".encode())
+            return
+        except Exception as e:
+            status = getattr(getattr(e, "response", None), "status_code", None) or 502
+            self.log_message("%s: %s: %s", url, type(e).__name__, e)
+            self.respond(status, "text/plain", f"{type(e).__name__}: {e}\n".encode())
+            return
+        self.respond(200, "application/json", json.dumps(answer).encode())
+
+    def upstream_url(self, path: str) -> str:
+        """The upstream URL asked for with path (/<host>/<path>?<query>), or None if it isn't mirrored."""
+        (host, _, rest) = path.lstrip("/").partition("/")
+        url = "https://" + host + "/" + rest
+        if not is_routed(self.routes, url):
+            return None
+        return url
+
+    def serve(self, send_body: bool):
+        url = None
+        try:
+            if self.path.startswith(DELTA_PREFIX + "/"):
+                self.serve_delta(send_body)
+                return
+
+            url = self.upstream_url(self.path)
+            if url is None:
+                self.respond(404, "text/plain", b"Not mirrored\n", send_body=send_body)
+            elif is_artifact(url) and self.http.store is not None:
+                self.serve_artifact(url, send_body)
+            else:
+                self.serve_json(url, send_body)
+        except ConnectionError:
+            # The client went away, possibly halfway through a response
+            self.close_connection = True
+        except HostUnavailable as e:
+            self.respond(503, "text/plain", f"{e}\n".encode(), send_body=send_body)
+        except Exception as e:
+            # Upstream's own error status if there was one (e.g. 404 for a missing release)
+            status = getattr(getattr(e, "response", None), "status_code", None) or 502
+            self.log_message("%s: %s: %s", url or self.path, type(e).__name__, e)
+            self.respond(status, "text/plain", f"{type(e).__name__}: {e}\n".encode(), send_body=send_body)
+
+    def serve_json(self, url: str, send_body: bool):
+        body = json.dumps(self.http.fetch_json(url)).encode()
+        etag = '"' + hashlib.sha256(body).hexdigest()[:32] + '"'
+        if self.headers.get("If-None-Match") == etag:
+            self.respond(304, "application/json", b"", {"ETag": etag})
+            return
+        self.respond(200, "application/json", body, {"ETag": etag}, send_body)
+
+    def serve_artifact(self, url: str, send_body: bool):
+        sha256 = self.http.store_artifact(url)
+        object_path = self.http.store.path(sha256)
+        size = os.path.getsize(object_path)
+        headers = {"Accept-Ranges": "bytes", "ETag": '"' + sha256 + '"'}
+
+        status = 200
+        (start, end) = (0, size - 1)
+        requested = parse_range(self.headers.get("Range"), size)
+        if requested is not None:
+            (start, end) = requested
+            if start > end:
+                self.respond(416, "application/octet-stream", b"", {"Content-Range": f"bytes */{size}"})
+                return
+            status = 206
+            headers["Content-Range"] = f"bytes {start}-{end}/{size}"
+
+        self.send_response(status)
+        self.send_header("Content-Type", "application/java-archive")
+        self.send_header("Content-Length", str(end - start + 1))
+        for (key, value) in headers.items():
+            self.send_header(key, value)
+        self.end_headers()
+        if not send_body:
+            return
+        with open(object_path, "rb") as object_file:
+            object_file.seek(start)
+            remaining = end - start + 1
+            while remaining > 0:
+                chunk = object_file.read(min(SEND_CHUNK_SIZE, remaining))
+                if not chunk:
+                    break
+                self.wfile.write(chunk)
+                remaining -= len(chunk)
+
+    def serve_delta(self, send_body: bool):
+        request = parse_delta_path(self.path[len(DELTA_PREFIX):])
+        if request is None or self.delta_service is None:
+            self.respond(404, "text/plain", b"", send_body=send_body)
+            return
+        (base_sha256, url) = request
+        if not is_routed(self.routes, url) or not is_artifact(url):
+            self.respond(404, "text/plain", b"Not mirrored\n", send_body=send_body)
+            return
+
+        body = self.delta_service.delta(base_sha256, url)
+        if body is None:
+            self.respond(404, "text/plain", b"", send_body=send_body)
+            return
+        self.respond(200, "application/octet-stream", body, send_body=send_body)
+
+    def respond(self, status: int, content_type: str, body: bytes, headers: dict = None, send_body: bool = True):
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        for (key, value) in (headers or {}).items():
+            self.send_header(key, value)
+        self.end_headers()
+        if send_body:
+            self.wfile.write(body)
+
+
+def parse_address(address: str) -> (str, int):
+    """ "[host:]port" -> (host, port). The host defaults to localhost, listening on the network has to be asked for."""
+    (host, _, port) = address.rpartition(":")
+    return (host or DEFAULT_HOST, int(port or DEFAULT_PORT))
+
+
+def serve(http: HttpClient, address: str, routes: dict):
+    """Runs the mirror on address ("[host:]port") until interrupted, mirroring the requests in routes (see upstream_routes)."""
+    MirrorHandler.http = http
+    MirrorHandler.delta_service = DeltaService(http) if http.store is not None else None
+    MirrorHandler.routes = routes
+    (host, port) = parse_address(address)
+    server = ThreadingHTTPServer((host, port), MirrorHandler)
+    server.daemon_threads = True
+    print(f"Mirroring {', '.join(sorted(routes))}")
+    print(f"Serving on http://{host}:{server.server_address[1]}/, point update.py at it with --mirror", flush=True)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
@@ -0,0 +1,139 @@
+"""
+Picks the Paper build to update to.
+
+A local index of every known build per Minecraft version (build number, channel, time, download name, sha256 and
+change summaries) is kept in the cache directory. Each run asks the API for the version's list of build numbers,
+which the metadata cache usually turns into a 304, and only fetches details of builds it hasn't seen before.
+The build download then needs no further request, and builds can be chosen by channel and age.
+"""
+import os
+import json
+import time
+import datetime
+import tempfile
+import threading
+
+from paper_updater import CACHE_DIR
+from paper_updater.http_client import HttpClient
+
+PAPER_API = "https://api.papermc.io/v2/projects/paper"
+CHANNELS = ("default", "experimental")
+# With more new builds than this, the whole build list is fetched in one request instead of one request per build
+MAX_SINGLE_FETCHES = 3
+
+
+class NoMatchingBuild(Exception):
+    """No Paper build for the Minecraft version passes the channel and age filters."""
+
+
+def parse_build(build: dict) -> dict:
+    """Keeps the parts of an API build object the index needs."""
+    application = build["downloads"]["application"]
+    return {
+        "build": build["build"],
+        "time": build.get("time"),
+        "channel": build.get("channel", "default"),
+        "name": application["name"],
+        "sha256": application["sha256"],
+        "changes": [change.get("summary", "") for change in build.get("changes", [])],
+    }
+
+
+def build_age_hours(build: dict, now: float = None) -> float:
+    """Hours since build was published, or None if the API didn't say."""
+    if not build.get("time"):
+        return None
+    # fromisoformat doesn't accept "Z" before Python 3.11
+    published = datetime.datetime.fromisoformat(build["time"].replace("Z", "+00:00"))
+    return ((now or time.time()) - published.timestamp()) / 3600
+
+
+def select_build(builds: list[dict], channel: str = "default", min_age_hours: float = 0) -> dict:
+    """
+    Returns the newest build allowed by the filters, or None.
+    channel "default" only allows stable builds, "experimental" allows experimental builds too.
+    Builds younger than min_age_hours are skipped (builds without a time only pass when min_age_hours is 0).
+    """
+    allowed_channels = CHANNELS[:CHANNELS.index(channel) + 1]
+    now = time.time()
+    for build in sorted(builds, key=lambda build: build["build"], reverse=True):
+        if build["channel"] not in allowed_channels:
+            continue
+        if min_age_hours > 0:
+            age = build_age_hours(build, now)
+            if age is None or age < min_age_hours:
+                continue
+        return build
+    return None
+
+
+class BuildIndex:
+    def __init__(self, cache_dir: str = os.path.join(CACHE_DIR, "paper"), api: str = PAPER_API):
+        # None keeps the index in memory only
+        self.cache_dir = cache_dir
+        self.api = api
+        self._versions: dict[str, dict[int, dict]] = {}
+        self._locks: dict[str, threading.Lock] = {}
+        self._locks_lock = threading.Lock()
+
+    def _path(self, mc_version: str) -> str:
+        return os.path.join(self.cache_dir, f"builds-{mc_version}.json")
+
+    def _load(self, mc_version: str) -> dict[int, dict]:
+        if self.cache_dir is None:
+            return {}
+        try:
+            with open(self._path(mc_version), "r") as index_file:
+                return {build["build"]: build for build in json.load(index_file)["builds"]}
+        except (OSError, ValueError, KeyError):
+            return {}
+
+    def _save(self, mc_version: str, builds: dict[int, dict]):
+        if self.cache_dir is None:
+            return
+        os.makedirs(self.cache_dir, exist_ok=True)
+        (fd, temp_path) = tempfile.mkstemp(dir=self.cache_dir, suffix=".tmp")
+        with os.fdopen(fd, "w") as temp_file:
+            json.dump({"builds": [builds[number] for number in sorted(builds)]}, temp_file)
+        os.replace(temp_path, self._path(mc_version))
+
+    def _lock(self, mc_version: str) -> threading.Lock:
+        with self._locks_lock:
+            return self._locks.setdefault(mc_version, threading.Lock())
+
+    def builds(self, http: HttpClient, mc_version: str) -> list[dict]:
+        """Returns every build of mc_version, fetching details only for builds that aren't in the index yet."""
+        with self._lock(mc_version):
+            builds = self._versions.get(mc_version)
+            if builds is None:
+                builds = self._load(mc_version)
+                self._versions[mc_version] = builds
+
+            version_url = self.api + "/versions/" + mc_version
+            numbers = http.get_json(version_url)["builds"]
+            new_numbers = [number for number in numbers if number not in builds]
+            if len(new_numbers) > MAX_SINGLE_FETCHES:
+                for build in http.get_json(version_url + "/builds")["builds"]:
+                    builds[build["build"]] = parse_build(build)
+            else:
+                for number in new_numbers:
+                    builds[number] = parse_build(http.get_json(version_url + "/builds/" + str(number)))
+
+            if len(new_numbers) > 0:
+                self._save(mc_version, builds)
+            return [builds[number] for number in numbers if number in builds]
+
+    def get(self, http: HttpClient, mc_version: str, build: int) -> dict:
+        """Returns one build of mc_version, from the index if it's there."""
+        with self._lock(mc_version):
+            builds = self._versions.get(mc_version)
+            if builds is not None and build in builds:
+                return builds[build]
+        return parse_build(http.get_json(self.api + "/versions/" + mc_version + "/builds/" + str(build)))
+
+    def latest(self, http: HttpClient, mc_version: str, channel: str = "default", min_age_hours: float = 0) -> dict:
+        """The newest build of mc_version allowed by the filters, see select_build."""
+        build = select_build(self.builds(http, mc_version), channel, min_age_hours)
+        if build is None:
+            raise NoMatchingBuild(f"No {channel} Paper build for {mc_version} that is at least {min_age_hours} hours old")
+        return build
@@ -0,0 +1,349 @@
+"""
+Index of the jars in a plugins directory.
+
+The directory is scanned once per run with os.scandir, and every updater and the coverage report share the result
+instead of listing the directory again. Updaters keep it current through add() and remove() as they swap jars.
+
+Each jar's name and version are read from the plugin.yml (or paper-plugin.yml) inside it, so they are right even
+if the jar was renamed. What was read is saved in plugins/.plugin-index.json keyed by name, size and mtime, so
+unchanged jars are never opened again.
+
+While staging (see PluginIndex.begin_staging), add() and remove() only record changes: new jars are written to a
+staging directory (plugins/.staging or, during an update, plugins/.staging.next) and old ones stay in place, until
+paper_updater.generations swaps the whole set in.
+"""
+import os
+import re
+import json
+import shutil
+import zipfile
+import tempfile
+import threading
+import contextlib
+import contextvars
+
+# Plugin-1.2.3.jar, Plugin_v1.2.3.jar, ...
+VERSIONED_NAME = re.compile(r"^(.+?)[-_]v?(\d.*)$")
+INDEX_FILE_NAME = ".plugin-index.json"
+STAGING_DIR_NAME = ".staging"
+# Where an update stages its changes, so one that fails leaves those an earlier update staged alone
+NEXT_STAGING_DIR_NAME = ".staging.next"
+# paper-plugin.yml comes first, as that's the one Paper loads when a jar has both
+DESCRIPTOR_NAMES = ("paper-plugin.yml", "plugin.yml")
+DESCRIPTOR_KEYS = ("name", "version", "api-version")
+
+
+def parse_jar_name(file_name: str) -> (str, str):
+    """Guesses (plugin id, version) from a jar's file name. The version is None if the name doesn't include one."""
+    stem = os.path.splitext(file_name)[0]
+    match = VERSIONED_NAME.match(stem)
+    if match is None:
+        return (stem, None)
+    return (match.group(1), match.group(2))
+
+
+def parse_descriptor(text: str) -> dict:
+    """
+    Pulls the top level name, version and api-version out of a plugin.yml.
+    Only simple "key: value" lines are understood, which is all these keys ever use.
+    """
+    descriptor = {}
+    for line in text.splitlines():
+        if not line or line[0] in " \t#-":
+            continue
+
+        (key, separator, value) = line.partition(":")
+        key = key.strip()
+        if not separator or key not in DESCRIPTOR_KEYS:
+            continue
+
+        value = value.split(" #")[0].strip().strip("\"'")
+        # Unfilled build placeholders like ${project.version} don't tell us anything
+        if value and "${" not in value:
+            descriptor[key] = value
+
+    return descriptor
+
+
+def read_descriptor(jar_path: str) -> dict:
+    """
+    Returns the name, version and api-version declared inside a plugin jar, or {} if it has none.
+    zipfile only reads the jar's central directory and the one entry, not the whole jar.
+    """
+    try:
+        with zipfile.ZipFile(jar_path) as jar:
+            for descriptor_name in DESCRIPTOR_NAMES:
+                try:
+                    data = jar.read(descriptor_name)
+                except KeyError:
+                    continue
+                return parse_descriptor(data.decode("utf-8", "replace"))
+    except (OSError, zipfile.BadZipFile):
+        pass
+
+    return {}
+
+
+# Who is making index changes on this thread (or task), see changes_by
+_change_owner = contextvars.ContextVar("plugin_index_change_owner", default=None)
+
+
+@contextlib.contextmanager
+def changes_by(owner: str):
+    """Attributes the staged changes made inside the block to owner (e.g. an updater), see PluginIndex.drop_changes."""
+    token = _change_owner.set(owner)
+    try:
+        yield
+    finally:
+        _change_owner.reset(token)
+
+
+def _link(source_path: str, dest_path: str):
+    """Puts source_path at dest_path too, as a hardlink if the filesystem allows."""
+    if os.path.exists(dest_path):
+        os.remove(dest_path)
+    try:
+        os.link(source_path, dest_path)
+    except OSError:
+        shutil.copy2(source_path, dest_path)
+
+
+class JarInfo:
+    def __init__(self, name: str, size: int, mtime: float, descriptor: dict, sha256: str = None):
+        self.name = name
+        self.size = size
+        self.mtime = mtime
+        self.descriptor = descriptor
+        (file_plugin_id, self.file_version) = parse_jar_name(name)
+        self.declared_version = descriptor.get("version")
+        self.plugin_id = descriptor.get("name", file_plugin_id)
+        self.version = self.declared_version or self.file_version
+        self.api_version = descriptor.get("api-version")
+        # The checksum upstream published for the jar, recorded when it was installed (see paper_updater.audit)
+        self.sha256 = sha256
+
+
+class PluginIndex:
+    def __init__(self, plugins_dir: str):
+        self.plugins_dir = plugins_dir
+        self.index_path = os.path.join(plugins_dir, INDEX_FILE_NAME)
+        self.staging_dir = os.path.join(plugins_dir, STAGING_DIR_NAME)
+        self._jars: dict[str, JarInfo] = {}
+        self._lock = threading.Lock()
+        self._staging = False
+        # name -> (owner, JarInfo) of jars written to the staging directory
+        self._staged: dict[str, tuple] = {}
+        # name -> owner of jars to be removed
+        self._removed: dict[str, str] = {}
+        # Where the jars passed to resume_staging were staged, and name -> (owner, staged entry) of those removed since
+        self._resumed_dir: str = None
+        self._unstaged: dict[str, tuple] = {}
+        self._saved = self._load()
+        self.refresh()
+
+    def _load(self) -> dict:
+        try:
+            with open(self.index_path, "r") as index_file:
+                return json.load(index_file)["jars"]
+        except (OSError, ValueError, KeyError):
+            return {}
+
+    def save(self):
+        """Writes what was read from each jar to plugins/.plugin-index.json, for the next run."""
+        with self._lock:
+            jars = {
+                info.name: {"size": info.size, "mtime": info.mtime, "descriptor": info.descriptor, "sha256": info.sha256}
+                for info in self._jars.values()
+            }
+            if jars == self._saved:
+                return
+            self._saved = jars
+
+        (fd, temp_path) = tempfile.mkstemp(dir=self.plugins_dir, suffix=".tmp")
+        with os.fdopen(fd, "w") as temp_file:
+            json.dump({"jars": jars}, temp_file)
+        os.replace(temp_path, self.index_path)
+
+    def _jar_info(self, name: str, jar_path: str, size: int, mtime: float, keep_checksum: bool = True) -> JarInfo:
+        # Jars added since the last save (e.g. just swapped in from staging) are only known in memory
+        known = self._jars.get(name)
+        if known is not None and known.size == size and known.mtime == mtime:
+            return known
+        saved = self._saved.get(name)
+        if saved is not None and saved["size"] == size and saved["mtime"] == mtime:
+            return JarInfo(name, size, mtime, saved["descriptor"], saved.get("sha256"))
+
+        # The jar changed behind our back. Its recorded checksum stays, so an audit can tell it changed.
+        sha256 = None
+        if keep_checksum:
+            sha256 = known.sha256 if known is not None else (saved or {}).get("sha256")
+        return JarInfo(name, size, mtime, read_descriptor(jar_path), sha256)
+
+    def installed_checksum(self, name: str) -> str:
+        """The checksum recorded for the installed jar called name, even while staging, or None."""
+        return self._saved.get(name, {}).get("sha256")
+
+    def set_checksums(self, checksums: dict):
+        """Records the checksums ({name: sha256 or None}) of jars put in place without add(), e.g. by a rollback."""
+        with self._lock:
+            for (name, sha256) in checksums.items():
+                info = self._jars.get(name)
+                if info is not None:
+                    self._jars[name] = JarInfo(name, info.size, info.mtime, info.descriptor, sha256)
+
+    def refresh(self, changed_by_updater: bool = False):
+        """
+        Rereads the plugins directory. With changed_by_updater, jars that changed since were replaced by an updater
+        that doesn't use the index, so their recorded checksums no longer apply.
+        """
+        jars = {}
+        with os.scandir(self.plugins_dir) as entries:
+            for entry in entries:
+                if not entry.name.endswith(".jar") or not entry.is_file():
+                    continue
+                stat = entry.stat()
+                jars[entry.name] = self._jar_info(entry.name, entry.path, stat.st_size, stat.st_mtime, not changed_by_updater)
+
+        with self._lock:
+            # Staged changes stay visible, as if they had already been made
+            for name in self._removed:
+                jars.pop(name, None)
+            for (name, (_, info)) in self._staged.items():
+                jars[name] = info
+            self._jars = jars
+
+    def path(self, name: str) -> str:
+        """Where the jar called name is written to: the plugins directory, or the staging directory while staging."""
+        if self._staging:
+            return os.path.join(self.staging_dir, name)
+        return os.path.join(self.plugins_dir, name)
+
+    def installed_path(self, name: str) -> str:
+        """Where the installed jar called name is, even while staging."""
+        return os.path.join(self.plugins_dir, name)
+
+    def names(self) -> list[str]:
+        with self._lock:
+            return sorted(self._jars)
+
+    def get(self, name: str) -> JarInfo:
+        with self._lock:
+            return self._jars.get(name)
+
+    def find_all(self, prefix: str) -> list[str]:
+        return [name for name in self.names() if name.startswith(prefix)]
+
+    def find(self, prefix: str) -> str:
+        """Returns the first jar (by name) starting with prefix, or None."""
+        matches = self.find_all(prefix)
+        if len(matches) == 0:
+            return None
+        return matches[0]
+
+    def add(self, name: str, sha256: str = None):
+        """Records a jar that was just written to path(name), and the checksum upstream published for it, if any."""
+        jar_path = self.path(name)
+        stat = os.stat(jar_path)
+        info = self._jar_info(name, jar_path, stat.st_size, stat.st_mtime)
+        info = JarInfo(name, info.size, info.mtime, info.descriptor, sha256.lower() if sha256 is not None else None)
+        with self._lock:
+            self._jars[name] = info
+            if self._staging:
+                self._staged[name] = (_change_owner.get(), info)
+                self._removed.pop(name, None)
+
+    def remove(self, name: str):
+        """Deletes a jar from the plugins directory and the index. While staging, the jar is only marked for removal."""
+        with self._lock:
+            self._jars.pop(name, None)
+            if not self._staging:
+                os.remove(os.path.join(self.plugins_dir, name))
+                return
+
+            staged = self._staged.pop(name, None)
+            if staged is not None:
+                os.remove(os.path.join(self.staging_dir, name))
+                # Staged by an earlier update, drop_changes can still link it back
+                if staged[0] is None and self._resumed_dir is not None:
+                    self._unstaged[name] = (_change_owner.get(), staged)
+            if os.path.exists(os.path.join(self.plugins_dir, name)):
+                self._removed[name] = _change_owner.get()
+
+    def begin_staging(self, staging_dir: str = None):
+        """
+        From now on, changes are staged in staging_dir (by default plugins/.staging) until commit,
+        see the module docstring.
+        """
+        if staging_dir is not None:
+            self.staging_dir = staging_dir
+        os.makedirs(self.staging_dir, exist_ok=True)
+        # Jars (and lists of them) left by an update that never committed are stale,
+        # unfinished .part downloads are kept for resuming
+        with os.scandir(self.staging_dir) as entries:
+            for entry in entries:
+                if entry.is_file() and not entry.name.endswith(".part"):
+                    os.remove(entry.path)
+        with self._lock:
+            self._staging = True
+
+    def resume_staging(self, added: list[str], removed: list[str], checksums: dict = None, staged_dir: str = None):
+        """
+        Starts staging with changes staged earlier (see generations.Generations.stage), without clearing them.
+        checksums are the published checksums of the added jars, see add(). If the added jars were staged in
+        another directory, staged_dir, they are linked into the staging directory and left where they are.
+        """
+        with self._lock:
+            self._staging = True
+            if staged_dir is not None and os.path.abspath(staged_dir) != os.path.abspath(self.staging_dir):
+                self._resumed_dir = staged_dir
+                for name in added:
+                    _link(os.path.join(staged_dir, name), os.path.join(self.staging_dir, name))
+            for name in added:
+                jar_path = os.path.join(self.staging_dir, name)
+                stat = os.stat(jar_path)
+                info = self._jar_info(name, jar_path, stat.st_size, stat.st_mtime)
+                info = JarInfo(name, info.size, info.mtime, info.descriptor, (checksums or {}).get(name))
+                self._staged[name] = (None, info)
+            for name in removed:
+                if os.path.exists(os.path.join(self.plugins_dir, name)):
+                    self._removed[name] = None
+        self.refresh()
+
+    def staged_changes(self) -> (list[str], list[str]):
+        """Returns (jars added in the staging directory, jars to remove from the plugins directory)."""
+        with self._lock:
+            return (sorted(self._staged), sorted(self._removed))
+
+    def drop_changes(self, owner: str):
+        """Forgets the staged changes made by owner, e.g. an updater that failed halfway through."""
+        with self._lock:
+            for (name, (staged_owner, _)) in list(self._staged.items()):
+                if staged_owner == owner:
+                    del self._staged[name]
+                    os.remove(os.path.join(self.staging_dir, name))
+            for (name, removed_owner) in list(self._removed.items()):
+                if removed_owner == owner:
+                    del self._removed[name]
+            for (name, (unstaged_owner, staged)) in list(self._unstaged.items()):
+                if unstaged_owner == owner:
+                    del self._unstaged[name]
+                    _link(os.path.join(self._resumed_dir, name), os.path.join(self.staging_dir, name))
+                    self._staged[name] = staged
+        self.refresh()
+
+    def end_staging(self, keep_files: bool = False):
+        """
+        Stops staging, after the staged changes were committed or discarded, and rereads the plugins directory.
+        With keep_files, jars still in the staging directory are left there to be picked up by resume_staging.
+        """
+        with self._lock:
+            for name in self._staged:
+                staged_path = os.path.join(self.staging_dir, name)
+                if not keep_files and os.path.exists(staged_path):
+                    os.remove(staged_path)
+            self._staging = False
+            self._staged = {}
+            self._removed = {}
+            self._resumed_dir = None
+            self._unstaged = {}
+        self.refresh()
@@ -0,0 +1,135 @@
+"""
+Retry and circuit breaker policy shared by every request HttpClient sends.
+
+Failed requests (connection errors, timeouts, 429 and 5xx responses, exhausted GitHub rate limits) are retried with
+exponential backoff and full jitter, waiting at least as long as Retry-After or X-RateLimit-Reset ask for.
+A host that keeps failing has its circuit opened: further requests to it fail immediately for a while instead of
+each waiting out its own timeouts and retries, so one dead upstream can't eat the whole update window.
+"""
+import time
+import random
+import threading
+import email.utils
+
+RETRY_STATUSES = (429, 500, 502, 503, 504)
+DEFAULT_RETRIES = 3
+BACKOFF_BASE = 0.5
+BACKOFF_CAP = 30
+# A server asking us to wait longer than this is treated as a failure rather than waited for
+MAX_RETRY_WAIT = 60
+FAILURE_THRESHOLD = 5
+OPEN_SECONDS = 60
+
+
+class HostUnavailable(Exception):
+    """A host's circuit is open after repeated failures, so the request wasn't sent."""
+
+
+def is_rate_limited(response) -> bool:
+    """Whether response is GitHub saying the rate limit is used up (a 403 or 429 with no requests remaining)."""
+    return response.status_code in (403, 429) and response.headers.get("X-RateLimit-Remaining") == "0"
+
+
+def should_retry(response) -> bool:
+    return response.status_code in RETRY_STATUSES or is_rate_limited(response)
+
+
+def requested_wait(response, now: float = None) -> float:
+    """Seconds the server asked us to wait before trying again, or None."""
+    now = now or time.time()
+    retry_after = response.headers.get("Retry-After")
+    if retry_after:
+        if retry_after.strip().isdigit():
+            return float(retry_after)
+        try:
+            return max(0, email.utils.parsedate_to_datetime(retry_after).timestamp() - now)
+        except (TypeError, ValueError):
+            pass
+
+    reset = response.headers.get("X-RateLimit-Reset")
+    if is_rate_limited(response) and reset and reset.isdigit():
+        return max(0, int(reset) - now)
+    return None
+
+
+class RetryPolicy:
+    def __init__(self, retries: int = DEFAULT_RETRIES, backoff_base: float = BACKOFF_BASE, backoff_cap: float = BACKOFF_CAP, max_wait: float = MAX_RETRY_WAIT):
+        self.retries = retries
+        self.backoff_base = backoff_base
+        self.backoff_cap = backoff_cap
+        self.max_wait = max_wait
+
+    def backoff(self, attempt: int) -> float:
+        """Full jitter: anywhere between 0 and the exponential backoff for this attempt."""
+        return random.uniform(0, min(self.backoff_cap, self.backoff_base * 2 ** attempt))
+
+    def wait(self, attempt: int, response=None) -> float:
+        """
+        Seconds to wait before retry number attempt + 1, or None if it isn't worth retrying
+        (out of attempts, or the server wants us to wait too long).
+        """
+        if attempt >= self.retries:
+            return None
+        delay = self.backoff(attempt)
+        if response is not None:
+            asked = requested_wait(response)
+            if asked is not None:
+                if asked > self.max_wait:
+                    return None
+                delay = max(delay, asked)
+        return delay
+
+
+class CircuitBreaker:
+    """
+    Counts consecutive failures per host. After failure_threshold of them the host's circuit opens for open_seconds,
+    then a single trial request is let through: if it succeeds the circuit closes, otherwise it opens again.
+    """
+
+    def __init__(self, failure_threshold: int = FAILURE_THRESHOLD, open_seconds: float = OPEN_SECONDS):
+        self.failure_threshold = failure_threshold
+        self.open_seconds = open_seconds
+        self._failures: dict[str, int] = {}
+        self._opened_at: dict[str, float] = {}
+        self._trial: set[str] = set()
+        self._lock = threading.Lock()
+
+    def before_request(self, host: str) -> bool:
+        """
+        Raises HostUnavailable if requests to host shouldn't be sent right now. Returns whether this request is the
+        trial, in which case the caller has to call end_trial once it's done, whatever the outcome.
+        """
+        with self._lock:
+            opened_at = self._opened_at.get(host)
+            if opened_at is None:
+                return False
+            if time.monotonic() - opened_at < self.open_seconds or host in self._trial:
+                raise HostUnavailable(f"{host} failed {self._failures[host]} times in a row, not trying it again yet")
+            self._trial.add(host)
+            return True
+
+    def end_trial(self, host: str):
+        """
+        Ends a trial request. One that recorded neither a success nor a failure (it raised something else, e.g. too
+        many redirects) leaves the circuit open, and the next request becomes the trial instead.
+        """
+        with self._lock:
+            self._trial.discard(host)
+
+    def record_success(self, host: str):
+        with self._lock:
+            self._failures.pop(host, None)
+            self._opened_at.pop(host, None)
+            self._trial.discard(host)
+
+    def record_failure(self, host: str):
+        with self._lock:
+            failures = self._failures.get(host, 0) + 1
+            self._failures[host] = failures
+            if failures >= self.failure_threshold or host in self._trial:
+                self._opened_at[host] = time.monotonic()
+            self._trial.discard(host)
+
+    def is_open(self, host: str) -> bool:
+        with self._lock:
+            return host in self._opened_at
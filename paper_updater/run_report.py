@@ -0,0 +1,173 @@
+"""
+Structured report of a run, for finding out which upstream makes the update window slow.
+
+Each updater (and each phase of a server's update) gets a Stats record. While a thread works inside
+collect(stats), HttpClient counts its requests, cache hits, downloaded bytes and retries against that
+record, so updaters are measured without doing anything themselves.
+The report is written as JSON lines and, optionally, as a Prometheus textfile (for node_exporter's textfile collector).
+"""
+import os
+import json
+import time
+import tempfile
+import threading
+import contextlib
+import contextvars
+
+# A context variable rather than a thread local, so work handed to asyncio.to_thread is still counted
+_current = contextvars.ContextVar("paper_updater_stats", default=None)
+
+
+class Stats:
+    def __init__(self, server_root: str, kind: str, name: str):
+        self.server_root = server_root
+        # "updater" or "phase"
+        self.kind = kind
+        self.name = name
+        self.seconds = 0.0
+        self.metadata_requests = 0
+        self.metadata_seconds = 0.0
+        self.cache_hits = 0
+        self.download_bytes = 0
+        self.download_seconds = 0.0
+        self.retries = 0
+        self.delta_downloads = 0
+        self.outcome = None
+        self.error = None
+        self._lock = threading.Lock()
+
+    def add(self, **counts):
+        # Segmented downloads report from several threads at once
+        with self._lock:
+            for (name, value) in counts.items():
+                setattr(self, name, getattr(self, name) + value)
+
+    def to_dict(self) -> dict:
+        throughput = None
+        if self.download_seconds > 0:
+            throughput = self.download_bytes / self.download_seconds
+        return {
+            "type": self.kind,
+            "server_root": self.server_root,
+            "name": self.name,
+            "outcome": self.outcome,
+            "error": self.error,
+            "seconds": round(self.seconds, 3),
+            "metadata_requests": self.metadata_requests,
+            "metadata_seconds": round(self.metadata_seconds, 3),
+            "cache_hits": self.cache_hits,
+            "download_bytes": self.download_bytes,
+            "download_seconds": round(self.download_seconds, 3),
+            "download_bytes_per_second": None if throughput is None else round(throughput),
+            "retries": self.retries,
+            "delta_downloads": self.delta_downloads,
+        }
+
+
+def current() -> Stats:
+    """Returns the record the calling thread is collecting into, or None."""
+    return _current.get()
+
+
+def add(**counts):
+    """Adds to the calling thread's current record, if it has one."""
+    stats = current()
+    if stats is not None:
+        stats.add(**counts)
+
+
+@contextlib.contextmanager
+def collect(stats: Stats):
+    """Counts the calling thread's requests against stats, and times the block."""
+    token = _current.set(stats)
+    start = time.monotonic()
+    try:
+        yield stats
+    finally:
+        stats.seconds += time.monotonic() - start
+        _current.reset(token)
+
+
+class RunReport:
+    def __init__(self):
+        self.started = time.time()
+        self.records: list[Stats] = []
+        self._lock = threading.Lock()
+
+    def record(self, server_root: str, kind: str, name: str) -> Stats:
+        stats = Stats(server_root, kind, name)
+        with self._lock:
+            self.records.append(stats)
+        return stats
+
+    @contextlib.contextmanager
+    def phase(self, server_root: str, name: str):
+        """Times a phase of a server's update, counting its requests like an updater's."""
+        stats = self.record(server_root, "phase", name)
+        with collect(stats):
+            try:
+                yield stats
+            except BaseException as e:
+                stats.outcome = "failed"
+                stats.error = f"{type(e).__name__}: {e}"
+                raise
+        stats.outcome = "completed"
+
+    def lines(self) -> list[dict]:
+        run = {
+            "type": "run",
+            "started": round(self.started, 3),
+            "seconds": round(time.time() - self.started, 3),
+        }
+        with self._lock:
+            return [run] + [stats.to_dict() for stats in self.records]
+
+    def write_json_lines(self, file_path: str):
+        """Appends this run to file_path, one JSON object per line, starting with a "run" line."""
+        with open(file_path, "a") as report_file:
+            for line in self.lines():
+                report_file.write(json.dumps(line) + "\n")
+
+    def write_prometheus(self, file_path: str):
+        """Writes file_path as a Prometheus textfile, replacing it in one rename so it's never read half-written."""
+        metrics = {
+            "seconds": "Wall time spent",
+            "metadata_requests": "Metadata requests sent over the network",
+            "metadata_seconds": "Time spent waiting for metadata",
+            "cache_hits": "Requests and downloads answered from a cache",
+            "download_bytes": "Bytes downloaded",
+            "download_seconds": "Time spent downloading",
+            "retries": "Requests retried and downloads resumed",
+            "delta_downloads": "Jars rebuilt from a delta instead of downloaded whole",
+        }
+        lines = self.lines()
+        text = []
+        text.append("# HELP paper_updater_last_run_timestamp_seconds When the last run started.")
+        text.append("# TYPE paper_updater_last_run_timestamp_seconds gauge")
+        text.append(f"paper_updater_last_run_timestamp_seconds {lines[0]['started']}")
+        text.append("# HELP paper_updater_run_seconds How long the last run took.")
+        text.append("# TYPE paper_updater_run_seconds gauge")
+        text.append(f"paper_updater_run_seconds {lines[0]['seconds']}")
+        for (metric, description) in metrics.items():
+            text.append(f"# HELP paper_updater_{metric} {description}, per updater or phase.")
+            text.append(f"# TYPE paper_updater_{metric} gauge")
+            for line in lines[1:]:
+                text.append(f"paper_updater_{metric}{{{_labels(line)}}} {line[metric]}")
+        text.append("# HELP paper_updater_failed Whether the updater or phase failed.")
+        text.append("# TYPE paper_updater_failed gauge")
+        for line in lines[1:]:
+            text.append(f"paper_updater_failed{{{_labels(line)}}} {int(line['outcome'] == 'failed')}")
+
+        (fd, temp_path) = tempfile.mkstemp(dir=os.path.dirname(os.path.abspath(file_path)), suffix=".tmp")
+        with os.fdopen(fd, "w") as temp_file:
+            temp_file.write("\n".join(text) + "\n")
+        os.replace(temp_path, file_path)
+
+
+def _labels(line: dict) -> str:
+    labels = {"server": line["server_root"], "type": line["type"], "name": line["name"]}
+    return ",".join(f'{key}="{_escape(value)}"' for (key, value) in labels.items())
+
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
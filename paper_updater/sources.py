@@ -0,0 +1,184 @@
+"""
+Release sources for the declarative plugin manifest (plugins/updaters/plugins.json).
+
+Each source type is a function taking (http, source, mc_version), where source is the "source" object of a
+manifest entry, and returning the latest release as a dict:
+    {"version": str, "url": str, "sha256": str or None, "hashes": dict, "size": int or None, "mc_versions": list[str] or None}
+"hashes" are the other digests the source publishes for the file, {algorithm: hex digest} (e.g. Modrinth's sha512),
+checked by HttpClient.download like the sha256.
+"mc_versions" are the Minecraft versions the release supports, for sources that say (see paper_updater.compatibility).
+"""
+import re
+import json
+import urllib.parse
+
+from paper_updater.http_client import HttpClient
+from paper_updater.github import asset_sha256, latest_release_url
+
+
+MODRINTH_API = "https://api.modrinth.com/v2"
+MODRINTH_LOADERS = ["paper", "spigot", "bukkit"]
+HANGAR_API = "https://hangar.papermc.io/api/v1"
+
+
+class SourceError(Exception):
+    """A source has no release to offer, or its manifest entry is invalid."""
+
+
+def github_release(http: HttpClient, source: dict, mc_version: str) -> dict:
+    """
+    Latest GitHub release of source["repo"].
+    Optional: "asset", a regex picking the asset by name (default: the first asset),
+    "strip_prefix", removed from the tag to get the version (e.g. "v").
+    """
+    metadata = http.get_json(latest_release_url(source["repo"]))
+    return github_release_from_metadata(metadata, source)
+
+
+def github_release_from_metadata(metadata: dict, source: dict) -> dict:
+    assets = metadata["assets"]
+    if "asset" in source:
+        assets = [asset for asset in assets if re.search(source["asset"], asset["name"])]
+    if len(assets) == 0:
+        raise SourceError(f"No matching asset in the latest release of {source['repo']}")
+
+    version = metadata["tag_name"]
+    strip_prefix = source.get("strip_prefix", "")
+    if strip_prefix and version.startswith(strip_prefix):
+        version = version[len(strip_prefix):]
+
+    asset = assets[0]
+    return {
+        "version": version,
+        "url": asset["browser_download_url"],
+        "sha256": asset_sha256(asset),
+        "hashes": {},
+        "size": asset["size"],
+        "mc_versions": None,
+    }
+
+
+def jenkins_release(http: HttpClient, source: dict, mc_version: str) -> dict:
+    """
+    Artifact of the last successful build of the Jenkins job at source["job"] whose file name starts with
+    source["artifact"]. The version is the last "-" separated part of the artifact's file name.
+    """
+    metadata = http.get_json(source["job"] + "/lastSuccessfulBuild/api/json")
+    for artifact in metadata["artifacts"]:
+        if artifact["fileName"].startswith(source["artifact"]):
+            break
+    else:
+        raise SourceError(f"No artifact starting with {source['artifact']} in {source['job']}")
+
+    stem = artifact["fileName"].rsplit(".", 1)[0]
+    # Jobs that record fingerprints list the md5 of each artifact
+    fingerprint = next((fingerprint for fingerprint in metadata.get("fingerprint", []) if fingerprint.get("fileName") == artifact["fileName"]), None)
+    return {
+        "version": stem.split("-")[-1],
+        # The build number rather than lastSuccessfulBuild, so the URL always refers to the same file
+        "url": source["job"] + "/" + str(metadata["number"]) + "/artifact/" + artifact["relativePath"],
+        "sha256": None,
+        "hashes": {"md5": fingerprint["hash"]} if fingerprint is not None and fingerprint.get("hash") else {},
+        "size": None,
+        "mc_versions": None,
+    }
+
+
+def fill_release(http: HttpClient, source: dict, mc_version: str) -> dict:
+    """
+    Latest build of source["project"] from a PaperMC style v2 downloads API at source["api"]
+    (api.papermc.io, download.geysermc.org). source["download"] names the download to use (e.g. "spigot").
+    """
+    project_url = source["api"] + "/projects/" + source["project"]
+    version = http.get_json(project_url)["versions"][-1]
+    version_url = project_url + "/versions/" + version
+    build = http.get_json(version_url)["builds"][-1]
+    if isinstance(build, dict):
+        build = build["build"]
+
+    build_url = version_url + "/builds/" + str(build)
+    download = http.get_json(build_url)["downloads"][source["download"]]
+    return {
+        "version": version,
+        "url": build_url + "/downloads/" + source["download"],
+        "sha256": download["sha256"],
+        "hashes": {},
+        "size": None,
+        "mc_versions": None,
+    }
+
+
+def modrinth_release(http: HttpClient, source: dict, mc_version: str) -> dict:
+    """Newest version of the Modrinth project source["project"] that supports mc_version on Paper/Spigot/Bukkit."""
+    query = urllib.parse.urlencode({
+        "loaders": json.dumps(source.get("loaders", MODRINTH_LOADERS)),
+        "game_versions": json.dumps([mc_version]),
+    })
+    versions = http.get_json(MODRINTH_API + "/project/" + source["project"] + "/version?" + query)
+    if len(versions) == 0:
+        raise SourceError(f"No version of {source['project']} on Modrinth supports {mc_version}")
+    return modrinth_release_from_version(versions[0])
+
+
+def modrinth_release_from_version(version: dict) -> dict:
+    file = next((file for file in version["files"] if file["primary"]), version["files"][0])
+    return {
+        "version": version["version_number"],
+        "url": file["url"],
+        "sha256": None,
+        # Modrinth publishes sha512 and sha1 for every file
+        "hashes": {algorithm: digest for (algorithm, digest) in file.get("hashes", {}).items() if algorithm in ("sha512", "sha1")},
+        "size": file["size"],
+        "mc_versions": version.get("game_versions"),
+    }
+
+
+def hangar_release(http: HttpClient, source: dict, mc_version: str) -> dict:
+    """
+    Newest release of the Hangar project source["project"] that supports mc_version on Paper, on the "Release"
+    channel by default.
+    """
+    query = urllib.parse.urlencode({
+        "limit": 1,
+        "offset": 0,
+        "channel": source.get("channel", "Release"),
+        "platform": "PAPER",
+        "platformVersion": mc_version,
+    })
+    versions = http.get_json(HANGAR_API + "/projects/" + source["project"] + "/versions?" + query)["result"]
+    if len(versions) == 0:
+        raise SourceError(f"No release of {source['project']} on Hangar supports {mc_version}")
+
+    return hangar_release_from_version(versions[0], source["project"])
+
+
+def hangar_release_from_version(version: dict, project: str) -> dict:
+    download = version["downloads"]["PAPER"]
+    if download.get("downloadUrl") is None:
+        raise SourceError(f"{project} is only available from an external site: {download.get('externalUrl')}")
+
+    file_info = download["fileInfo"]
+    return {
+        "version": version["name"],
+        "url": download["downloadUrl"],
+        "sha256": file_info.get("sha256Hash"),
+        "hashes": {},
+        "size": file_info.get("sizeBytes"),
+        "mc_versions": version.get("platformDependencies", {}).get("PAPER"),
+    }
+
+
+SOURCES = {
+    "github": github_release,
+    "jenkins": jenkins_release,
+    "fill": fill_release,
+    "modrinth": modrinth_release,
+    "hangar": hangar_release,
+}
+
+
+def resolve_release(http: HttpClient, source: dict, mc_version: str) -> dict:
+    source_type = source.get("type")
+    if source_type not in SOURCES:
+        raise SourceError(f"Unknown source type: {source_type}")
+    return SOURCES[source_type](http, source, mc_version)
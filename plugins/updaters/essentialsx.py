@@ -1,48 +1,41 @@
 import os
-import requests
-import urllib.request
+import asyncio
 
+from paper_updater.http_client import HttpClient
+from paper_updater.async_http import AsyncHttpClient
+from paper_updater.github import asset_sha256, latest_release_url
+from paper_updater.plugin_index import PluginIndex
 
-def api_GET(endpoint: str) -> dict:
-    return requests.get(endpoint).json()
+# Read by update.py without importing this file, so this updater only loads when EssentialsX is installed
+JAR_PATTERNS = ["EssentialsX*"]
+# Looked up together with the other updaters' repos when a GitHub token is available
+GITHUB_REPOS = ["EssentialsX/Essentials"]
 
 
-def api_DOWNLOAD(endpoint: str, fileName: str) -> str:
-    print(f"Downloading {fileName}...")
-    response = urllib.request.urlretrieve(endpoint, fileName)
-    return fileName
+def get_essentialsx_file(index: PluginIndex) -> str:
+    return index.find("EssentialsX-")
 
 
-def get_essentialsx_file() -> str:
-    for file in os.listdir("."):
-        if file.startswith("EssentialsX-") and file.endswith(".jar"):
-            return file
-
-    return None
-
-
-def get_installed_components() -> set[str]:
+def get_installed_components(index: PluginIndex) -> set[str]:
     components: set[str] = set()
-    for file in os.listdir("."):
-        if file.startswith("EssentialsX") and file.endswith(".jar"):
-            component_name = file.split("-")[0]
-            components.add(component_name)
+    for file in index.find_all("EssentialsX"):
+        component_name = file.split("-")[0]
+        components.add(component_name)
 
     return components
 
 
-def get_installed_files() -> list[str]:
-    files: list[str] = []
-    for file in os.listdir("."):
-        if file.startswith("EssentialsX") and file.endswith(".jar"):
-            files.append(file)
+def get_installed_files(index: PluginIndex) -> list[str]:
+    return index.find_all("EssentialsX")
 
-    return files
 
-
-def get_current_version() -> str:
-    essentialsx_file = os.path.splitext(get_essentialsx_file())[0]
-    return essentialsx_file[12:]
+def get_current_version(index: PluginIndex) -> str:
+    essentialsx_file = get_essentialsx_file(index)
+    # plugin.yml is right even if the jar was renamed
+    declared_version = index.get(essentialsx_file).declared_version
+    if declared_version:
+        return declared_version
+    return os.path.splitext(essentialsx_file)[0][12:]
 
 
 def get_component_name(metadata_asset: dict) -> str:
@@ -51,39 +44,76 @@ def get_component_name(metadata_asset: dict) -> str:
     return name.split("-")[0]
 
 
-def download_asset(metadata_asset: dict):
+async def download_asset(http: AsyncHttpClient, metadata_asset: dict, index: PluginIndex):
     download_url = metadata_asset["browser_download_url"]
-    api_DOWNLOAD(download_url, metadata_asset["name"])
+    # The installed jar of the same component, for a delta against it
+    old_file = index.find(get_component_name(metadata_asset) + "-")
+    base_path = index.installed_path(old_file) if old_file is not None else None
+    await http.download(download_url, index.path(metadata_asset["name"]), asset_sha256(metadata_asset), metadata_asset["size"], base_path)
+    index.add(metadata_asset["name"], asset_sha256(metadata_asset))
+
+
+def check(mcVersion: str, plugins_dir: str, http: HttpClient, index: PluginIndex) -> list[dict]:
+    if len(get_installed_files(index)) == 0:
+        return []
 
+    latest_metadata = http.get_json(latest_release_url(GITHUB_REPOS[0]))
+    latest_version = latest_metadata["tag_name"]
+    current_version = get_current_version(index)
+    installed_components = get_installed_components(index)
 
-def update(mcVersion: str) -> list[str]:
-    if len(get_installed_files()) == 0:
+    plans = []
+    for asset in latest_metadata["assets"]:
+        asset_name = get_component_name(asset)
+        if asset_name not in installed_components:
+            continue
+
+        current_file = next(file for file in get_installed_files(index) if file.split("-")[0] == asset_name)
+        plans.append({
+            "name": asset_name,
+            "current_file": current_file,
+            "current_version": current_version,
+            "target_file": asset["name"],
+            "target_version": latest_version,
+            "up_to_date": current_version == latest_version,
+            "url": asset["browser_download_url"],
+            "sha256": asset_sha256(asset),
+            "size": asset["size"],
+        })
+
+    return plans
+
+
+async def update_async(mcVersion: str, plugins_dir: str, http: AsyncHttpClient, index: PluginIndex) -> list[str]:
+    if len(get_installed_files(index)) == 0:
         # Plugin not installed, skip
         return []
 
     print("Updating EssentialsX...")
-    latest_metadata_url = "https://api.github.com/repos/EssentialsX/Essentials/releases/latest"
-    latest_metadata = api_GET(latest_metadata_url)
+    latest_metadata_url = latest_release_url(GITHUB_REPOS[0])
+    latest_metadata = await http.get_json(latest_metadata_url)
     latest_version = latest_metadata["tag_name"]
-    current_version = get_current_version()
+    current_version = get_current_version(index)
 
     if current_version == latest_version:
         print("EssentialsX already at latest version.")
-        return get_installed_files()
+        return get_installed_files(index)
 
-    installed_components = get_installed_components()
-    old_files: set[str] = set()
-    for asset in latest_metadata["assets"]:
-        asset_name = get_component_name(asset)
-        if asset_name in installed_components:
-            download_asset(asset)
-            old_version = asset_name+"-"+current_version+".jar"
-            old_files.add(asset_name+"-"+current_version+".jar")
+    installed_components = get_installed_components(index)
+    old_files = get_installed_files(index)
+    assets = [asset for asset in latest_metadata["assets"] if get_component_name(asset) in installed_components]
+    # All components are downloaded at the same time
+    await asyncio.gather(*[download_asset(http, asset, index) for asset in assets])
+    updated_components = {get_component_name(asset) for asset in assets}
+    new_files = {asset["name"] for asset in assets}
 
+    # Old jars are found through the index rather than by name, as their names may not include the version
     for old_file in old_files:
+        if old_file in new_files or old_file.split("-")[0] not in updated_components:
+            continue
         print(f"Removing old EssentialsX component: {old_file}")
-        os.remove(old_file)
+        index.remove(old_file)
 
     print(f"Updated EssentialsX from {current_version} -> {latest_version}")
-    return get_installed_files()
+    return get_installed_files(index)
 
@@ -1,38 +1,31 @@
 import os
-import requests
-import urllib.request
 import re
 
+from paper_updater.http_client import HttpClient
+from paper_updater.github import asset_sha256, latest_release_url
+from paper_updater.plugin_index import PluginIndex
 
-def api_GET(endpoint: str) -> dict:
-    return requests.get(endpoint).json()
+JAR_PATTERNS = ["Vivecraft_Spigot_Extensions*"]
+GITHUB_REPOS = ["jrbudda/Vivecraft_Spigot_Extensions"]
 
 
-def api_DOWNLOAD(endpoint: str, fileName: str) -> str:
-    print(f"Downloading {fileName}...")
-    response = urllib.request.urlretrieve(endpoint, fileName)
-    return fileName
-
-
-def get_vivecraft_file() -> str:
+def get_vivecraft_file(index: PluginIndex) -> str:
     # updated: Vivecraft_Spigot_Extensions-1.20.4r1.jar
     # orig: Vivecraft_Spigot_Extensions.jar
-    for file in os.listdir("."):
-        if file.startswith("Vivecraft_Spigot_Extensions") and file.endswith(".jar"):
-            return file
-
-    return None
+    return index.find("Vivecraft_Spigot_Extensions")
 
 
-def get_current_version() -> str:
-    file_name = get_vivecraft_file()
+def get_current_version(index: PluginIndex) -> str:
+    file_name = get_vivecraft_file(index)
     if file_name is None:
         return "???"
 
+    declared_version = index.get(file_name).declared_version
     file_name = os.path.splitext(file_name)[0]
     file_name_split = file_name.split("-")
     if len(file_name_split) <= 1:
-        return "???"
+        # Renamed jar, fall back to the version in its plugin.yml
+        return declared_version or "???"
 
     return file_name_split[1]
 
@@ -41,7 +34,8 @@ def get_asset_for_mcversion(mcVersion: str, latest_metadata: dict) -> dict:
     for asset in latest_metadata["assets"]:
         name = asset["name"]
         match = re.search(r"\d+\.\d+\.\d+", name)
-        if match.group() == mcVersion:
+        # Assets without an MC version in their name aren't plugin builds
+        if match is not None and match.group() == mcVersion:
             return asset
 
 
@@ -51,38 +45,66 @@ def get_latest_version(asset: dict) -> str:
     return name[match.start():]
 
 
-def update(mcVersion: str) -> list[str]:
-    if get_vivecraft_file() == None:
+def check(mcVersion: str, plugins_dir: str, http: HttpClient, index: PluginIndex) -> list[dict]:
+    old_file = get_vivecraft_file(index)
+    if old_file == None:
+        return []
+
+    latest_metadata = http.get_json(latest_release_url(GITHUB_REPOS[0]))
+    latest_asset = get_asset_for_mcversion(mcVersion, latest_metadata)
+    if latest_asset is None:
+        raise Exception(f"No (modern) Vivecraft version found for {mcVersion}")
+    latest_version = get_latest_version(latest_asset)
+    current_version = get_current_version(index)
+
+    return [{
+        "name": "Vivecraft",
+        "current_file": old_file,
+        "current_version": current_version,
+        "target_file": "Vivecraft_Spigot_Extensions-"+latest_version+".jar",
+        "target_version": latest_version,
+        "up_to_date": current_version == latest_version,
+        "url": latest_asset["browser_download_url"],
+        "sha256": asset_sha256(latest_asset),
+        "size": latest_asset["size"],
+        # The asset was picked by the MC version in its name
+        "mc_versions": [mcVersion],
+    }]
+
+
+def update(mcVersion: str, plugins_dir: str, http: HttpClient, index: PluginIndex) -> list[str]:
+    old_file = get_vivecraft_file(index)
+    if old_file == None:
         # Plugin not installed, skip
         return []
 
     print("Updating Vivecraft...")
-    latest_metadata_url = "https://api.github.com/repos/jrbudda/Vivecraft_Spigot_Extensions/releases/latest"
-    latest_metadata = api_GET(latest_metadata_url)
+    latest_metadata_url = latest_release_url(GITHUB_REPOS[0])
+    latest_metadata = http.get_json(latest_metadata_url)
     latest_asset = get_asset_for_mcversion(mcVersion, latest_metadata)
     if latest_asset is None:
         print(f"Vivecraft FATAL: No (modern) version found for {mcVersion}!")
         raise Exception("Unable to retrieve latest version")
     latest_version = get_latest_version(latest_asset)
-    current_version = get_current_version()
+    current_version = get_current_version(index)
 
     # Use "created_at" property to determine latest version for current mcVersion
 
     if current_version == latest_version:
         print("Vivecraft already at latest version.")
-        return [get_vivecraft_file()]
+        return [old_file]
 
     if current_version == "???":
         print("Vivecraft is at an unknown version! Will update anyway.")
 
-    old_file = get_vivecraft_file() or ""
-
-    api_DOWNLOAD(latest_asset["browser_download_url"], "Vivecraft_Spigot_Extensions-"+latest_version+".jar")
+    new_file = "Vivecraft_Spigot_Extensions-"+latest_version+".jar"
+    http.download(latest_asset["browser_download_url"], index.path(new_file), asset_sha256(latest_asset), latest_asset["size"], index.installed_path(old_file))
+    index.add(new_file, asset_sha256(latest_asset))
 
-    if os.path.isfile(old_file):
+    if old_file != new_file:
         print(f"Removing old Vivecraft version: {old_file}")
-        os.remove(old_file)
+        index.remove(old_file)
 
     print(f"Updated Vivecraft from {current_version} -> {latest_version}")
-    return [get_vivecraft_file()]
+    return [new_file]
 
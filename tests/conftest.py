@@ -0,0 +1,70 @@
+"""
+Shared fixtures: tools/mock_upstream.py running in this process, and server roots (made the way bench/bench.py makes
+them) for running update.py against it.
+"""
+import os
+import sys
+import threading
+import subprocess
+import http.server
+
+import pytest
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+for directory in (REPO_ROOT, os.path.join(REPO_ROOT, "tools"), os.path.join(REPO_ROOT, "bench")):
+    if directory not in sys.path:
+        sys.path.insert(0, directory)
+
+import bench
+import mock_upstream
+
+UPDATE_PY = os.path.join(REPO_ROOT, "update.py")
+# One plugin of each source type
+PLUGINS = len(mock_upstream.SOURCE_TYPES)
+
+
+@pytest.fixture(scope="session")
+def upstream() -> str:
+    """Base URL of a mock upstream serving PLUGINS synthetic plugins and Paper builds."""
+    options = mock_upstream.parser.parse_args(["--port", "0", "--plugins", str(PLUGINS), "--jar-size", "4096", "--paper-size", "65536"])
+    mock_upstream.MockHandler.options = options
+    mock_upstream.MockHandler.world = mock_upstream.World(options)
+    server = http.server.ThreadingHTTPServer(("127.0.0.1", 0), mock_upstream.MockHandler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    yield f"http://127.0.0.1:{server.server_address[1]}"
+    server.shutdown()
+    server.server_close()
+
+
+@pytest.fixture
+def world(upstream) -> "mock_upstream.World":
+    """The mock upstream's synthetic plugins, for the checksums of what it serves."""
+    return mock_upstream.MockHandler.world
+
+
+@pytest.fixture
+def server_root(tmp_path, upstream) -> str:
+    """A server root with every synthetic plugin at version 1.0 and Paper build 1, and plugins/updaters next to it."""
+    manifest = bench.mock_request(upstream, "/_manifest")
+    return bench.make_servers(str(tmp_path), manifest, PLUGINS, 1)[0]
+
+
+@pytest.fixture
+def update_env(tmp_path, upstream) -> dict:
+    """The environment update.py runs in: the mock upstream as its mirror and a cache of its own."""
+    env = dict(os.environ)
+    env["PAPER_UPDATER_MIRROR"] = upstream
+    env["PAPER_UPDATER_CACHE"] = str(tmp_path / "cache")
+    env.pop("GITHUB_TOKEN", None)
+    env.pop("GH_TOKEN", None)
+    return env
+
+
+@pytest.fixture
+def update_py(tmp_path, update_env):
+    """Runs update.py against the mock upstream from tmp_path, returning the CompletedProcess."""
+    def run(*args: str) -> subprocess.CompletedProcess:
+        return subprocess.run([sys.executable, UPDATE_PY, *args], cwd=str(tmp_path), env=update_env, stdout=subprocess.PIPE, stderr=subprocess.STDOUT, text=True)
+
+    return run
@@ -0,0 +1,82 @@
+import os
+import stat
+import hashlib
+
+from paper_updater.artifact_store import ArtifactStore, sha256_file
+from paper_updater.digests import DigestCache
+from paper_updater.http_client import HttpClient
+
+import mock_upstream
+
+
+def write_in_place(path: str, offset: int, data: bytes):
+    """What root, cp over a jar or Bukkit's update folder do to a hardlinked jar."""
+    stat_before = os.stat(path)
+    os.chmod(path, 0o644)
+    with open(path, "r+b") as file:
+        file.seek(offset)
+        file.write(data)
+    # File times are only as fine as the kernel's clock tick, make sure the change shows
+    os.utime(path, ns=(stat_before.st_atime_ns, stat_before.st_mtime_ns + 1_000_000_000))
+
+
+def test_objects_are_read_only_and_verified(tmp_path):
+    store = ArtifactStore(str(tmp_path / "store"))
+    (tmp_path / "a.jar").write_bytes(b"jar contents")
+    sha256 = store.add(str(tmp_path / "a.jar"))
+    assert sha256 == hashlib.sha256(b"jar contents").hexdigest()
+    assert stat.S_IMODE(os.stat(store.path(sha256)).st_mode) == 0o444
+    assert store.verify(sha256, len(b"jar contents"))
+    assert not store.verify(sha256, 1)
+
+    write_in_place(store.path(sha256), 0, b"JAR")
+    assert not store.verify(sha256)
+    store.discard(sha256)
+    assert not os.path.exists(store.path(sha256))
+
+
+def test_corrupt_object_is_downloaded_again(tmp_path, upstream, world):
+    name = mock_upstream.plugin_name(0)
+    url = f"https://github.com/bench/{name}/releases/download/v{mock_upstream.LATEST_VERSION}/{mock_upstream.jar_name(name)}"
+    (sha256, size) = world.jar_info(name, mock_upstream.LATEST_VERSION, world.options.jar_size)
+    for server in ("server0", "server1"):
+        os.makedirs(tmp_path / server)
+
+    with HttpClient(store=ArtifactStore(str(tmp_path / "store")), mirror=upstream) as http:
+        http.download(url, str(tmp_path / "server1" / "a.jar"), sha256, size)
+        # Written to through server1's link, so the stored object changes too
+        write_in_place(str(tmp_path / "server1" / "a.jar"), 100, b"XXXX")
+        assert sha256_file(http.store.path(sha256)) != sha256
+
+        http.download(url, str(tmp_path / "server0" / "a.jar"), sha256, size)
+    assert sha256_file(str(tmp_path / "server0" / "a.jar")) == sha256
+    assert sha256_file(http.store.path(sha256)) == sha256
+
+
+def test_corrupt_object_found_by_url_is_downloaded_again(tmp_path, upstream, world):
+    # Jenkins publishes no sha256, so the object is found through the URL index
+    name = mock_upstream.plugin_name(1)
+    url = f"https://{mock_upstream.JENKINS_HOST}/job/{name}/{mock_upstream.BUILD_NUMBER}/artifact/build/libs/{mock_upstream.jar_name(name)}"
+    (sha256, _) = world.jar_info(name, mock_upstream.LATEST_VERSION, world.options.jar_size)
+
+    with HttpClient(store=ArtifactStore(str(tmp_path / "store")), mirror=upstream) as http:
+        http.download(url, str(tmp_path / "a.jar"))
+        write_in_place(http.store.path(sha256), 0, b"PK\0\0")
+        http.download(url, str(tmp_path / "b.jar"))
+    assert sha256_file(str(tmp_path / "b.jar")) == sha256
+
+
+def test_digest_cache(tmp_path):
+    jar_path = str(tmp_path / "a.jar")
+    with open(jar_path, "wb") as jar_file:
+        jar_file.write(b"first")
+    digests = DigestCache(str(tmp_path / "cache")).digest_files([jar_path], ("sha256",))
+    assert digests[jar_path]["sha256"] == hashlib.sha256(b"first").hexdigest()
+
+    # Saved, and found again by the next run without hashing the file
+    assert DigestCache(str(tmp_path / "cache")).get(os.stat(jar_path))["sha256"] == hashlib.sha256(b"first").hexdigest()
+
+    write_in_place(jar_path, 0, b"other")
+    cache = DigestCache(str(tmp_path / "cache"))
+    assert cache.get(os.stat(jar_path)) == {}
+    assert cache.digest_files([jar_path], ("sha256",))[jar_path]["sha256"] == hashlib.sha256(b"other").hexdigest()
@@ -0,0 +1,67 @@
+import hashlib
+
+import pytest
+
+from paper_updater import delta
+from paper_updater.artifact_store import ArtifactStore
+from paper_updater.delta_service import DeltaService
+from paper_updater.http_client import HttpClient
+
+import mock_upstream
+
+JAR_SIZE = 64 * 1024
+
+
+def test_round_trip(tmp_path):
+    base = mock_upstream.make_jar("Plugin", "1.0", JAR_SIZE)
+    target = mock_upstream.make_jar("Plugin", "2.0", JAR_SIZE)
+    base_path = tmp_path / "base.jar"
+    base_path.write_bytes(base)
+
+    body = delta.make_delta(base, target)
+    # Only plugin.yml changed, the filler entries are copied
+    assert len(body) < len(target) // 4
+
+    (sha256, size) = delta.apply_delta(str(base_path), body, str(tmp_path / "target.jar"))
+    assert sha256 == hashlib.sha256(target).hexdigest()
+    assert size == len(target)
+    assert (tmp_path / "target.jar").read_bytes() == target
+
+
+def test_wrong_base(tmp_path):
+    target = mock_upstream.make_jar("Plugin", "2.0", JAR_SIZE)
+    body = delta.make_delta(mock_upstream.make_jar("Plugin", "1.0", JAR_SIZE), target)
+    other_path = tmp_path / "other.jar"
+    other_path.write_bytes(mock_upstream.make_jar("Other", "1.0", JAR_SIZE))
+    # The caller compares the result with the checksum it expects, see HttpClient._fetch_delta
+    (sha256, _) = delta.apply_delta(str(other_path), body, str(tmp_path / "target.jar"))
+    assert sha256 != hashlib.sha256(target).hexdigest()
+
+    with pytest.raises(delta.DeltaError):
+        delta.apply_delta(str(other_path), body[:len(delta.MAGIC) + 4], str(tmp_path / "target.jar"))
+    with pytest.raises(delta.DeltaError):
+        delta.apply_delta(str(other_path), target, str(tmp_path / "target.jar"))
+
+
+def test_delta_path_round_trip():
+    url = "https://github.com/bench/Bench0000/releases/download/v2.0/Bench0000-2.0.jar?x=1"
+    base_sha256 = "ab" * 32
+    path = delta.delta_url("http://service", base_sha256, url)[len("http://service"):]
+    assert delta.parse_delta_path(path) == (base_sha256, url)
+
+
+def test_service_against_upstream(tmp_path, upstream, world):
+    name = mock_upstream.plugin_name(0)
+    url = f"https://github.com/bench/{name}/releases/download/v{mock_upstream.LATEST_VERSION}/{mock_upstream.jar_name(name)}"
+    base_path = tmp_path / "base.jar"
+    base_path.write_bytes(mock_upstream.make_jar(name, mock_upstream.OLD_VERSION, world.options.jar_size))
+
+    with HttpClient(store=ArtifactStore(str(tmp_path / "store")), mirror=upstream) as http:
+        base_sha256 = http.store.add(str(tmp_path / "base.jar"))
+        body = DeltaService(http).delta(base_sha256, url)
+        assert body is not None
+        # An unknown base has nothing to make a delta against
+        assert DeltaService(http).delta("00" * 32, url) is None
+
+    (sha256, _) = delta.apply_delta(http.store.path(base_sha256), body, str(tmp_path / "target.jar"))
+    assert sha256 == world.jar_info(name, mock_upstream.LATEST_VERSION, world.options.jar_size)[0]
@@ -0,0 +1,29 @@
+from paper_updater.engine import is_latest_version
+from paper_updater.plugin_index import JarInfo
+
+GITHUB_PLUGIN = {"name": "Plugin", "prefix": "Plugin", "source": {"type": "github", "repo": "owner/Plugin"}}
+FILL_PLUGIN = {"name": "Floodgate", "prefix": "floodgate-spigot", "source": {"type": "fill", "api": "https://download.geysermc.org/v2", "project": "floodgate", "download": "spigot"}}
+
+
+def jar(name: str, version: str = None) -> JarInfo:
+    return JarInfo(name, 0, 0, {"version": version} if version else {})
+
+
+def test_versions_from_file_names():
+    assert is_latest_version(GITHUB_PLUGIN, jar("Plugin-5.0.0.jar"), "5.0.0")
+    assert not is_latest_version(GITHUB_PLUGIN, jar("Plugin-5.0.0-SNAPSHOT.jar"), "5.0.0")
+
+
+def test_declared_versions():
+    assert is_latest_version(GITHUB_PLUGIN, jar("Plugin.jar", "5.0.0"), "5.0.0")
+    # A pre-release moves on to the release
+    assert not is_latest_version(GITHUB_PLUGIN, jar("Plugin.jar", "5.0.0-SNAPSHOT"), "5.0.0")
+    assert not is_latest_version(GITHUB_PLUGIN, jar("Plugin.jar", "5.0.0-beta.1"), "5.0.0")
+    assert not is_latest_version(GITHUB_PLUGIN, jar("Plugin.jar", "5.0.01"), "5.0.0")
+
+
+def test_fill_build_details():
+    # The fill API only says 2.2.3, the jar declares the build it is
+    assert is_latest_version(FILL_PLUGIN, jar("floodgate-spigot.jar", "2.2.3-SNAPSHOT (b110-4e2c9a1)"), "2.2.3")
+    assert not is_latest_version(FILL_PLUGIN, jar("floodgate-spigot.jar", "2.2.2-SNAPSHOT (b100-0a1b2c3)"), "2.2.3")
+    assert not is_latest_version(FILL_PLUGIN, jar("floodgate-spigot.jar", "2.2.30"), "2.2.3")
@@ -0,0 +1,168 @@
+import os
+import sys
+import json
+import subprocess
+
+from paper_updater.generations import Generations
+from paper_updater.plugin_index import PluginIndex, changes_by
+
+import bench
+from conftest import UPDATE_PY
+
+
+def write_jar(path: str, name: str):
+    bench.write_old_jar(path, name)
+
+
+def test_commit_and_rollback(tmp_path):
+    server_root = str(tmp_path)
+    plugins_dir = os.path.join(server_root, "plugins")
+    os.makedirs(plugins_dir)
+    write_jar(os.path.join(plugins_dir, "Kept-1.0.jar"), "Kept")
+    write_jar(os.path.join(plugins_dir, "Old-1.0.jar"), "Old")
+    os.symlink("paper-1.jar", os.path.join(server_root, "paper.jar"))
+
+    index = PluginIndex(plugins_dir)
+    index.begin_staging()
+    write_jar(index.path("Old-2.0.jar"), "Old")
+    index.add("Old-2.0.jar", "ab" * 32)
+    index.remove("Old-1.0.jar")
+    # Nothing changes in the server before commit
+    assert sorted(os.listdir(plugins_dir)) == [".staging", "Kept-1.0.jar", "Old-1.0.jar"]
+
+    generations = Generations(server_root)
+    assert generations.commit(index, "paper-2.jar") == 1
+    index.save()
+    assert sorted(name for name in os.listdir(plugins_dir) if name.endswith(".jar")) == ["Kept-1.0.jar", "Old-2.0.jar"]
+    assert os.readlink(os.path.join(server_root, "paper.jar")) == "paper-2.jar"
+    assert PluginIndex(plugins_dir).get("Old-2.0.jar").sha256 == "ab" * 32
+
+    generation = generations.rollback()
+    assert generation["added"] == ["Old-2.0.jar"]
+    assert generation["removed"] == ["Old-1.0.jar"]
+    assert sorted(name for name in os.listdir(plugins_dir) if name.endswith(".jar")) == ["Kept-1.0.jar", "Old-1.0.jar"]
+    assert os.readlink(os.path.join(server_root, "paper.jar")) == "paper-1.jar"
+    assert generations.numbers() == []
+
+
+def test_commit_without_changes_keeps_generations(tmp_path):
+    server_root = str(tmp_path)
+    plugins_dir = os.path.join(server_root, "plugins")
+    os.makedirs(plugins_dir)
+    os.symlink("paper-2.jar", os.path.join(server_root, "paper.jar"))
+
+    generations = Generations(server_root)
+    for _ in range(3):
+        index = PluginIndex(plugins_dir)
+        index.begin_staging()
+        # paper.jar already points at the build, e.g. before the server restarted onto it
+        assert generations.commit(index, "paper-2.jar") is None
+        assert generations.stage(index, "paper-2.jar") is None
+    assert generations.numbers() == []
+
+
+def test_update_then_rollback(server_root, update_py):
+    plugins_dir = os.path.join(server_root, "plugins")
+    old_jars = sorted(name for name in os.listdir(plugins_dir) if name.endswith(".jar"))
+
+    result = update_py("--servers", server_root)
+    assert result.returncode == 0, result.stdout
+    new_jars = sorted(name for name in os.listdir(plugins_dir) if name.endswith(".jar"))
+    assert all(name.endswith("-2.0.jar") for name in new_jars) and len(new_jars) == len(old_jars)
+    assert os.readlink(os.path.join(server_root, "paper.jar")) == "paper-1.21.4-5.jar"
+
+    result = update_py("--servers", server_root, "--rollback")
+    assert result.returncode == 0, result.stdout
+    assert sorted(name for name in os.listdir(plugins_dir) if name.endswith(".jar")) == old_jars
+    assert os.readlink(os.path.join(server_root, "paper.jar")) == "paper-1.21.4-1.jar"
+
+
+def test_reruns_before_restart_make_no_generations(server_root, update_py):
+    # version_history.json still says build 1 until the server restarts, every run has to see that Paper is done
+    for _ in range(3):
+        result = update_py("--servers", server_root)
+        assert result.returncode == 0, result.stdout
+
+    generations = Generations(server_root)
+    assert generations.numbers() == [1]
+    with open(os.path.join(generations.path(1), "generation.json")) as generation_file:
+        assert json.load(generation_file)["paper"]["previous_target"] == "paper-1.21.4-1.jar"
+    assert "already points at build 5" in result.stdout
+
+
+def stage_update(server_root: str) -> Generations:
+    """Stages Old-1.0.jar's replacement by Old-2.0.jar, the way update.py --daemon does."""
+    plugins_dir = os.path.join(server_root, "plugins")
+    os.makedirs(plugins_dir)
+    write_jar(os.path.join(plugins_dir, "Old-1.0.jar"), "Old")
+    generations = Generations(server_root)
+    index = PluginIndex(plugins_dir)
+    generations.begin_staging(index)
+    write_jar(index.path("Old-2.0.jar"), "Old")
+    index.add("Old-2.0.jar", "ab" * 32)
+    index.remove("Old-1.0.jar")
+    assert generations.stage(index)["added"] == ["Old-2.0.jar"]
+    return generations
+
+
+def test_failed_update_keeps_staged(tmp_path):
+    generations = stage_update(str(tmp_path))
+    index = PluginIndex(generations.plugins_dir)
+    generations.begin_staging(index)
+    # What was staged is seen as installed, so it isn't downloaded again
+    assert index.names() == ["Old-2.0.jar"]
+    write_jar(index.path("New-1.0.jar"), "New")
+    index.add("New-1.0.jar")
+    # The update fails, see update.update_server
+    index.end_staging()
+
+    (staged, number) = generations.apply_staged()
+    assert staged["added"] == ["Old-2.0.jar"] and number == 1
+    assert sorted(name for name in os.listdir(generations.plugins_dir) if name.endswith(".jar")) == ["Old-2.0.jar"]
+    assert PluginIndex(generations.plugins_dir).get("Old-2.0.jar").sha256 == "ab" * 32
+
+
+def test_failed_updater_keeps_staged_jar(tmp_path):
+    generations = stage_update(str(tmp_path))
+    index = PluginIndex(generations.plugins_dir)
+    generations.begin_staging(index)
+    with changes_by("old.py"):
+        index.remove("Old-2.0.jar")
+        write_jar(index.path("Old-3.0.jar"), "Old")
+        index.add("Old-3.0.jar")
+    # old.py failed halfway, see update.run_updaters
+    index.drop_changes("old.py")
+    assert index.names() == ["Old-2.0.jar"]
+    assert generations.stage(index)["added"] == ["Old-2.0.jar"]
+    assert sorted(os.listdir(generations.staging_dir)) == ["Old-2.0.jar", "staged.json"]
+    assert not os.path.exists(generations.next_staging_dir)
+
+
+def run_daemon_check(tmp_path, env: dict, server_root: str):
+    """Runs update.py --daemon until its first check is done."""
+    daemon = subprocess.Popen([sys.executable, UPDATE_PY, "--servers", server_root, "--daemon", "--retries", "0"], cwd=str(tmp_path), env=env, stdout=subprocess.PIPE, stderr=subprocess.STDOUT, text=True)
+    output = []
+    try:
+        for line in daemon.stdout:
+            output.append(line)
+            if line.startswith("Next check in"):
+                break
+    finally:
+        daemon.kill()
+        daemon.wait()
+    return "".join(output)
+
+
+def test_failed_daemon_check_keeps_staged(tmp_path, server_root, update_env, update_py):
+    output = run_daemon_check(tmp_path, update_env, server_root)
+    assert "use --apply-staged to swap them in" in output, output
+
+    # Upstream is down for the next check
+    output = run_daemon_check(tmp_path, {**update_env, "PAPER_UPDATER_MIRROR": "http://127.0.0.1:9", "PAPER_UPDATER_CACHE": str(tmp_path / "empty-cache")}, server_root)
+    assert "Unexpected error" in output, output
+
+    result = update_py("--servers", server_root, "--apply-staged")
+    assert "swapped in the update staged" in result.stdout, result.stdout
+    plugins_dir = os.path.join(server_root, "plugins")
+    assert all(name.endswith("-2.0.jar") for name in os.listdir(plugins_dir) if name.endswith(".jar"))
+    assert os.readlink(os.path.join(server_root, "paper.jar")) == "paper-1.21.4-5.jar"
@@ -0,0 +1,51 @@
+import pytest
+
+from paper_updater import mirror
+
+
+@pytest.mark.parametrize(("header", "expected"), [
+    ("bytes=0-9", (0, 9)),
+    ("bytes=90-", (90, 99)),
+    ("bytes=-10", (90, 99)),
+    ("bytes=-1000", (0, 99)),
+    ("bytes=50-1000", (50, 99)),
+    # Past the end, the handler answers 416
+    ("bytes=200-", (200, 99)),
+    ("bytes=0-9,20-29", None),
+    ("bytes=a-b", None),
+    ("items=0-9", None),
+    ("", None),
+    (None, None),
+])
+def test_parse_range(header, expected):
+    assert mirror.parse_range(header, 100) == expected
+
+
+def test_parse_address():
+    assert mirror.parse_address("8080") == ("127.0.0.1", 8080)
+    assert mirror.parse_address("0.0.0.0:8080") == ("0.0.0.0", 8080)
+
+
+def test_routes():
+    routes = mirror.upstream_routes([
+        {"name": "LuckPerms", "prefix": "LuckPerms", "source": {"type": "jenkins", "job": "https://ci.example.com/job/LuckPerms", "artifact": "LuckPerms-"}},
+    ])
+    for url in (
+        "https://api.github.com/repos/owner/repo/releases/latest",
+        "https://github.com/owner/repo/releases/download/v1.0/repo-1.0.jar",
+        "https://api.papermc.io/v2/projects/paper/versions/1.21.4/builds",
+        "https://api.papermc.io/v2/projects/paper/versions/1.21.4/builds/5/downloads/paper-1.21.4-5.jar",
+        "https://api.modrinth.com/v2/project/abc/version?loaders=%5B%22paper%22%5D",
+        "https://ci.example.com/job/LuckPerms/lastSuccessfulBuild/api/json",
+        "https://ci.example.com/job/LuckPerms/123/artifact/bukkit/LuckPerms-Bukkit-5.4.jar",
+    ):
+        assert mirror.is_routed(routes, url), url
+    for url in (
+        "https://api.github.com/user/repos",
+        "https://api.github.com/graphql",
+        "https://api.github.com/repos/owner/repo/contents/secret",
+        "https://ci.example.com/job/Other/lastSuccessfulBuild/api/json",
+        "https://example.com/anything.jar",
+        "http://api.github.com/repos/owner/repo/releases/latest",
+    ):
+        assert not mirror.is_routed(routes, url), url
@@ -0,0 +1,91 @@
+import time
+import email.utils
+
+import pytest
+
+from paper_updater.http_client import HttpClient
+from paper_updater.resilience import RetryPolicy, CircuitBreaker, HostUnavailable, requested_wait, should_retry
+
+
+class Response:
+    def __init__(self, status_code: int, headers: dict = None):
+        self.status_code = status_code
+        self.headers = headers or {}
+
+    def close(self):
+        pass
+
+
+def test_retry_policy_gives_up():
+    policy = RetryPolicy(retries=2, backoff_base=0.5, backoff_cap=30)
+    for attempt in range(2):
+        assert 0 <= policy.wait(attempt) <= 0.5 * 2 ** attempt
+    assert policy.wait(2) is None
+
+
+def test_retry_policy_waits_as_asked():
+    policy = RetryPolicy(retries=3, max_wait=60)
+    assert policy.wait(0, Response(503, {"Retry-After": "7"})) >= 7
+    # Asked to wait too long, not worth retrying
+    assert policy.wait(0, Response(503, {"Retry-After": "600"})) is None
+
+
+def test_requested_wait():
+    now = time.time()
+    assert requested_wait(Response(429, {"Retry-After": "12"}), now) == 12
+    date = email.utils.formatdate(now + 30, usegmt=True)
+    assert 28 <= requested_wait(Response(503, {"Retry-After": date}), now) <= 31
+    rate_limited = Response(403, {"X-RateLimit-Remaining": "0", "X-RateLimit-Reset": str(int(now) + 20)})
+    assert should_retry(rate_limited)
+    assert 19 <= requested_wait(rate_limited, now) <= 21
+    assert requested_wait(Response(500), now) is None
+    assert not should_retry(Response(404))
+
+
+def test_circuit_opens_and_closes():
+    breaker = CircuitBreaker(failure_threshold=2, open_seconds=0.05)
+    breaker.record_failure("host")
+    assert breaker.before_request("host") is False
+    breaker.record_failure("host")
+    with pytest.raises(HostUnavailable):
+        breaker.before_request("host")
+
+    time.sleep(0.06)
+    assert breaker.before_request("host") is True
+    # Only one trial at a time
+    with pytest.raises(HostUnavailable):
+        breaker.before_request("host")
+    breaker.record_failure("host")
+    with pytest.raises(HostUnavailable):
+        breaker.before_request("host")
+
+    time.sleep(0.06)
+    assert breaker.before_request("host") is True
+    breaker.record_success("host")
+    assert not breaker.is_open("host")
+    assert breaker.before_request("host") is False
+
+
+def test_unexpected_error_ends_the_trial():
+    breaker = CircuitBreaker(failure_threshold=1, open_seconds=0)
+    breaker.record_failure("host")
+
+    class Unexpected(Exception):
+        pass
+
+    def send():
+        raise Unexpected()
+
+    with HttpClient(breaker=breaker, retry=RetryPolicy(0)) as http:
+        with pytest.raises(Unexpected):
+            http._request("https://host/path", send)
+        # The next request is let through as the trial instead of the host staying blocked
+        assert http._request("https://host/path", lambda: Response(200)).status_code == 200
+    assert not breaker.is_open("host")
+
+
+def test_request_retries_then_succeeds():
+    responses = [Response(503), Response(502), Response(200)]
+    with HttpClient(breaker=CircuitBreaker(failure_threshold=5), retry=RetryPolicy(3, backoff_base=0.001)) as http:
+        assert http._request("https://host/path", lambda: responses.pop(0)).status_code == 200
+    assert responses == []
@@ -0,0 +1,88 @@
+#!/bin/python3
+"""
+Companion service for update.py --delta: answers requests for new versions of jars with zip entry level deltas
+(see paper_updater.delta) against a version the client already has.
+
+GET /<old sha256>/<host>/<path> fetches https://<host>/<path> into the service's artifact store (or finds it there)
+and returns the delta from the stored jar with that sha256. It answers 404 when it doesn't have the old jar, which
+it does whenever it fetched it before or shares its artifact store with the clients' update.py, and when there's
+no delta to be made (the files aren't zips). Clients then download the whole jar as usual.
+
+Only jar downloads the updaters make are fetched (see paper_updater.mirror.upstream_routes, with the Jenkins jobs and
+fill APIs in --manifest), anything else is a 404, so the service can't be used as a proxy or to fill its disk.
+
+Run it close to the upstreams, or next to a mirror, so only deltas cross the slow link:
+    python3 tools/delta_server.py --port 8802
+    ./update.py --delta http://delta-host:8802
+"""
+import os
+import sys
+import argparse
+import http.server
+
+# Run as a script from anywhere, with the paper_updater package next to tools/
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from paper_updater import CACHE_DIR, engine, mirror
+from paper_updater.delta import parse_delta_path
+from paper_updater.delta_service import DeltaService
+from paper_updater.http_client import HttpClient
+from paper_updater.artifact_store import ArtifactStore
+
+parser = argparse.ArgumentParser(description="Serves jar updates as deltas", formatter_class=argparse.ArgumentDefaultsHelpFormatter)
+parser.add_argument("--host", type=str, default="127.0.0.1")
+parser.add_argument("--port", type=int, default=8802)
+parser.add_argument("--store", type=str, default=CACHE_DIR, help="Artifact store directory to keep jars in.")
+parser.add_argument("--manifest", type=str, default="plugins/updaters/plugins.json", help="Plugin manifest whose Jenkins jobs and fill APIs may be fetched from too.")
+
+
+class DeltaHandler(http.server.BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    service = None
+    routes = {}
+
+    def log_message(self, format: str, *args):
+        sys.stderr.write(f"{self.command} {self.path} -> {format % args}\n")
+
+    def do_GET(self):
+        request = parse_delta_path(self.path)
+        if request is None:
+            self.respond(404, b"")
+            return
+        (base_sha256, url) = request
+        if not mirror.is_routed(self.routes, url) or not mirror.is_artifact(url):
+            self.respond(404, b"")
+            return
+
+        try:
+            body = self.service.delta(base_sha256, url)
+        except Exception as e:
+            sys.stderr.write(f"Unable to make a delta for {url}: {type(e).__name__}: {e}\n")
+            self.respond(502, b"")
+            return
+        if body is None:
+            self.respond(404, b"")
+            return
+        self.respond(200, body)
+
+    def respond(self, status: int, body: bytes):
+        self.send_response(status)
+        self.send_header("Content-Type", "application/octet-stream")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+def main():
+    options = parser.parse_args()
+    http_client = HttpClient(store=ArtifactStore(options.store), mirror=os.environ.get("PAPER_UPDATER_MIRROR"))
+    DeltaHandler.service = DeltaService(http_client)
+    DeltaHandler.routes = mirror.upstream_routes(engine.load_manifest(options.manifest) if os.path.isfile(options.manifest) else [])
+    server = http.server.ThreadingHTTPServer((options.host, options.port), DeltaHandler)
+    server.daemon_threads = True
+    print(f"Serving deltas on http://{options.host}:{server.server_address[1]}/", flush=True)
+    server.serve_forever()
+
+
+if __name__ == "__main__":
+    main()
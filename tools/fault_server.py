@@ -0,0 +1,134 @@
+#!/bin/python3
+"""
+Local stand-in for an upstream (GitHub, Jenkins, PaperMC, ...) that misbehaves on purpose, for trying out the
+retry and circuit breaker policy in paper_updater.resilience.
+
+Serves the files under --root (Range requests included, so resumed downloads work), and injects one kind of fault
+into a share of the requests:
+    status     answer with --status (503 by default), with Retry-After if --retry-after is given
+    ratelimit  a GitHub style 403 with X-RateLimit-Remaining: 0 and X-RateLimit-Reset --retry-after seconds from now
+    drop       send the headers and half the body, then close the connection
+    reset      close the connection without answering
+    delay      answer normally after --delay seconds
+    hang       answer after --delay seconds, meant to be longer than the client's read timeout
+
+Faults hit a random --fault-rate share of requests, or with --fail-first N, the first N requests for each path.
+
+    python3 tools/fault_server.py --root /tmp/upstream --fault status --fail-first 2
+"""
+import os
+import sys
+import time
+import random
+import argparse
+import threading
+import collections
+import http.server
+
+parser = argparse.ArgumentParser(description="Serves files with injected faults", formatter_class=argparse.ArgumentDefaultsHelpFormatter)
+parser.add_argument("--root", type=str, default=".", help="Directory to serve.")
+parser.add_argument("--host", type=str, default="127.0.0.1")
+parser.add_argument("--port", type=int, default=8800)
+parser.add_argument("--fault", type=str, default="status", choices=["status", "ratelimit", "drop", "reset", "delay", "hang"])
+parser.add_argument("--fault-rate", type=float, default=0.0, help="Share of requests (0 to 1) that get the fault.")
+parser.add_argument("--fail-first", type=int, default=0, help="Give the first N requests for each path the fault.")
+parser.add_argument("--status", type=int, default=503, help="Status for the status fault.")
+parser.add_argument("--retry-after", type=int, default=None, help="Seconds to ask clients to wait, for the status and ratelimit faults.")
+parser.add_argument("--delay", type=float, default=2.0, help="Seconds to wait, for the delay and hang faults.")
+
+
+class FaultHandler(http.server.BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    options = None
+    requests_per_path = collections.Counter()
+    lock = threading.Lock()
+
+    def log_message(self, format: str, *args):
+        sys.stderr.write(f"{self.command} {self.path} -> {format % args}\n")
+
+    def should_fault(self) -> bool:
+        with self.lock:
+            self.requests_per_path[self.path] += 1
+            count = self.requests_per_path[self.path]
+        if count <= self.options.fail_first:
+            return True
+        return random.random() < self.options.fault_rate
+
+    def do_HEAD(self):
+        self.serve(send_body=False)
+
+    def do_GET(self):
+        self.serve(send_body=True)
+
+    def serve(self, send_body: bool):
+        path = os.path.join(self.options.root, self.path.split("?")[0].lstrip("/"))
+        if not os.path.isfile(path):
+            self.send_error(404)
+            return
+        with open(path, "rb") as served_file:
+            body = served_file.read()
+
+        fault = self.options.fault if self.should_fault() else None
+        if fault == "reset":
+            self.close_connection = True
+            return
+        if fault in ("delay", "hang"):
+            time.sleep(self.options.delay)
+        if fault == "status":
+            self.send_response(self.options.status)
+            if self.options.retry_after is not None:
+                self.send_header("Retry-After", str(self.options.retry_after))
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+            return
+        if fault == "ratelimit":
+            self.send_response(403)
+            self.send_header("X-RateLimit-Remaining", "0")
+            self.send_header("X-RateLimit-Reset", str(int(time.time()) + (self.options.retry_after or 1)))
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+            return
+
+        status = 200
+        start = 0
+        end = len(body) - 1
+        range_header = self.headers.get("Range")
+        if range_header and range_header.startswith("bytes="):
+            (first, _, last) = range_header[len("bytes="):].partition("-")
+            start = int(first)
+            end = min(int(last), end) if last else end
+            if start > end:
+                self.send_response(416)
+                self.send_header("Content-Range", f"bytes */{len(body)}")
+                self.send_header("Content-Length", "0")
+                self.end_headers()
+                return
+            status = 206
+
+        part = body[start:end + 1]
+        self.send_response(status)
+        self.send_header("Accept-Ranges", "bytes")
+        if status == 206:
+            self.send_header("Content-Range", f"bytes {start}-{end}/{len(body)}")
+        self.send_header("Content-Length", str(len(part)))
+        self.send_header("Content-Type", "application/json" if path.endswith(".json") else "application/octet-stream")
+        self.end_headers()
+        if not send_body:
+            return
+        if fault == "drop":
+            self.wfile.write(part[:len(part) // 2])
+            self.wfile.flush()
+            self.close_connection = True
+            return
+        self.wfile.write(part)
+
+
+def main():
+    FaultHandler.options = parser.parse_args()
+    server = http.server.ThreadingHTTPServer((FaultHandler.options.host, FaultHandler.options.port), FaultHandler)
+    print(f"Serving {FaultHandler.options.root} on http://{FaultHandler.options.host}:{FaultHandler.options.port}/", flush=True)
+    server.serve_forever()
+
+
+if __name__ == "__main__":
+    main()
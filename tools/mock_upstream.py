@@ -0,0 +1,438 @@
+#!/bin/python3
+"""
+Local stand-in for every upstream update.py talks to (PaperMC, GitHub, Jenkins, GeyserMC, Modrinth, Hangar), so
+runs can be benchmarked and tried out without touching the real services.
+
+Point update.py at it with PAPER_UPDATER_MIRROR, e.g. PAPER_UPDATER_MIRROR=http://127.0.0.1:8801: a request for
+https://<host>/<path> then arrives here as /<host>/<path>. Answers come from, in order:
+    recordings  responses saved under --recordings (with --record, anything not recorded yet is fetched from the
+                real host and saved there first)
+    synthetic   --plugins made up plugins, Bench0000, Bench0001, ..., each with a release 2.0 from one of the
+                github, jenkins, fill, modrinth and hangar sources in turn, and --paper-builds Paper builds for
+                --mc-version. GET /_manifest returns the plugins.json entries for them.
+
+Synthetic jars hold a plugin.yml and --jar-size bytes of filler, and are the same every run. Only the plugin.yml
+differs between versions of a plugin, so they also make good material for --delta.
+Metadata has an ETag, so revalidation gets a 304.
+--latency delays every response and --bandwidth caps how fast bodies are sent, to get closer to a real network.
+
+Modrinth's POST /v2/version_files/update recognises the sha512 of version 1.0 and 2.0 of the synthetic Modrinth
+plugins (see make_jar), and Hangar version listings include version 1.0 too, for trying out --identify.
+
+GET /_stats returns the number of requests and body bytes sent per host, POST /_stats/reset starts them over.
+
+    python3 tools/mock_upstream.py --plugins 100 --jar-size 262144 --latency 0.05
+"""
+import io
+import os
+import sys
+import json
+import time
+import random
+import hashlib
+import zipfile
+import argparse
+import threading
+import collections
+import http.server
+import urllib.parse
+import urllib.request
+
+SOURCE_TYPES = ("github", "jenkins", "fill", "modrinth", "hangar")
+LATEST_VERSION = "2.0"
+# The version --identify finds installed, see World.modrinth_version_files
+OLD_VERSION = "1.0"
+# Jenkins build and fill build number of every synthetic release
+BUILD_NUMBER = 20
+JENKINS_HOST = "ci.bench.invalid"
+# So synthetic jars are byte for byte the same every time
+ZIP_DATE_TIME = (2024, 1, 1, 0, 0, 0)
+SEND_CHUNK_SIZE = 64 * 1024
+# Synthetic jars' filler is split into entries of this size
+FILLER_ENTRY_SIZE = 16 * 1024
+
+parser = argparse.ArgumentParser(description="Serves recorded and synthetic upstream responses", formatter_class=argparse.ArgumentDefaultsHelpFormatter)
+parser.add_argument("--host", type=str, default="127.0.0.1")
+parser.add_argument("--port", type=int, default=8801, help="Port to listen on, 0 for any free one.")
+parser.add_argument("--recordings", type=str, default=None, help="Directory of recorded responses.")
+parser.add_argument("--record", action="store_true", help="Fetch responses that aren't recorded yet from the real hosts and save them to --recordings.")
+parser.add_argument("--plugins", type=int, default=10, help="Number of synthetic plugins.")
+parser.add_argument("--mc-version", type=str, default="1.21.4", help="Minecraft version of the synthetic Paper builds.")
+parser.add_argument("--paper-builds", type=int, default=5, help="Number of synthetic Paper builds.")
+parser.add_argument("--jar-size", type=int, default=64 * 1024, help="Filler bytes in each synthetic plugin jar.")
+parser.add_argument("--paper-size", type=int, default=1024 * 1024, help="Filler bytes in each synthetic Paper jar.")
+parser.add_argument("--latency", type=float, default=0.0, help="Seconds to wait before every response.")
+parser.add_argument("--bandwidth", type=float, default=0.0, help="Bytes per second each body is sent at, 0 for unlimited.")
+
+
+def make_jar(name: str, version: str, filler_size: int) -> bytes:
+    """
+    A plugin jar with a plugin.yml and filler_size bytes of filler, the same every time for the same arguments.
+    The filler only depends on name, so versions of a plugin differ in their plugin.yml like a small real update.
+    """
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, "w") as jar:
+        jar.writestr(zipfile.ZipInfo("plugin.yml", ZIP_DATE_TIME), f"name: {name}\nversion: {version}\nmain: bench.{name}\napi-version: '1.21'\n")
+        filler = random.Random(name).getrandbits(filler_size * 8).to_bytes(filler_size, "little") if filler_size > 0 else b""
+        for (number, start) in enumerate(range(0, len(filler), FILLER_ENTRY_SIZE)):
+            jar.writestr(zipfile.ZipInfo(f"bench/Filler{number}.class", ZIP_DATE_TIME), filler[start:start + FILLER_ENTRY_SIZE])
+    return buffer.getvalue()
+
+
+def plugin_name(number: int) -> str:
+    return f"Bench{number:04d}"
+
+
+def jar_name(name: str) -> str:
+    return f"{name}-{LATEST_VERSION}.jar"
+
+
+def manifest_entry(number: int) -> dict:
+    """The plugins.json entry for synthetic plugin number."""
+    name = plugin_name(number)
+    source_type = SOURCE_TYPES[number % len(SOURCE_TYPES)]
+    if source_type == "github":
+        source = {"type": "github", "repo": f"bench/{name}", "strip_prefix": "v"}
+    elif source_type == "jenkins":
+        source = {"type": "jenkins", "job": f"https://{JENKINS_HOST}/job/{name}", "artifact": f"{name}-"}
+    elif source_type == "fill":
+        source = {"type": "fill", "api": "https://download.geysermc.org/v2", "project": name.lower(), "download": "spigot"}
+    elif source_type == "modrinth":
+        source = {"type": "modrinth", "project": name.lower()}
+    else:
+        source = {"type": "hangar", "project": name}
+    return {"name": name, "prefix": name, "source": source}
+
+
+class World:
+    """The synthetic plugins and Paper builds, and the routes serving them."""
+
+    def __init__(self, options: argparse.Namespace):
+        self.options = options
+        # url path -> function returning (content type, body)
+        self.routes = {}
+        self._jar_info = {}
+        self._lock = threading.Lock()
+        # sha512 of a Modrinth plugin's jar -> the plugin's latest version object, see modrinth_version_files
+        self._modrinth_hashes = None
+        self._modrinth_versions = {}
+        for number in range(options.plugins):
+            self._add_plugin(number)
+        self._add_paper()
+
+    def jar_info(self, name: str, version: str, filler_size: int) -> (str, int):
+        """(sha256, size) of a synthetic jar, generated once to find out."""
+        key = (name, version, filler_size)
+        with self._lock:
+            info = self._jar_info.get(key)
+        if info is None:
+            body = make_jar(name, version, filler_size)
+            info = (hashlib.sha256(body).hexdigest(), len(body))
+            with self._lock:
+                self._jar_info[key] = info
+        return info
+
+    def _json(self, path: str, make_body):
+        self.routes[path] = lambda: ("application/json", json.dumps(make_body()).encode())
+
+    def _download(self, path: str, name: str, version: str, filler_size: int):
+        self.routes[path] = lambda: ("application/java-archive", make_jar(name, version, filler_size))
+
+    def github_release(self, name: str, with_digest: bool = True) -> dict:
+        (sha256, size) = self.jar_info(name, LATEST_VERSION, self.options.jar_size)
+        asset = {
+            "name": jar_name(name),
+            "browser_download_url": f"https://github.com/bench/{name}/releases/download/v{LATEST_VERSION}/{jar_name(name)}",
+            "size": size,
+        }
+        if with_digest:
+            asset["digest"] = "sha256:" + sha256
+        return {"tag_name": "v" + LATEST_VERSION, "assets": [asset]}
+
+    def _add_plugin(self, number: int):
+        name = plugin_name(number)
+        source = manifest_entry(number)["source"]
+        jar_size = self.options.jar_size
+        mc_version = self.options.mc_version
+
+        if source["type"] == "github":
+            self._json(f"/api.github.com/repos/bench/{name}/releases/latest", lambda: self.github_release(name))
+            self._download(f"/github.com/bench/{name}/releases/download/v{LATEST_VERSION}/{jar_name(name)}", name, LATEST_VERSION, jar_size)
+        elif source["type"] == "jenkins":
+            job_path = f"/{JENKINS_HOST}/job/{name}"
+            self._json(job_path + "/lastSuccessfulBuild/api/json", lambda: {
+                "number": BUILD_NUMBER,
+                "artifacts": [{"fileName": jar_name(name), "relativePath": "build/libs/" + jar_name(name)}],
+                "fingerprint": [{"fileName": jar_name(name), "hash": hashlib.md5(make_jar(name, LATEST_VERSION, jar_size)).hexdigest()}],
+            })
+            self._download(f"{job_path}/{BUILD_NUMBER}/artifact/build/libs/{jar_name(name)}", name, LATEST_VERSION, jar_size)
+        elif source["type"] == "fill":
+            project_path = f"/download.geysermc.org/v2/projects/{source['project']}"
+            version_path = f"{project_path}/versions/{LATEST_VERSION}"
+            self._json(project_path, lambda: {"project_id": source["project"], "versions": [LATEST_VERSION]})
+            self._json(version_path, lambda: {"builds": [BUILD_NUMBER]})
+            self._json(f"{version_path}/builds/{BUILD_NUMBER}", lambda: {
+                "build": BUILD_NUMBER,
+                "downloads": {"spigot": {"name": jar_name(name), "sha256": self.jar_info(name, LATEST_VERSION, jar_size)[0]}},
+            })
+            self._download(f"{version_path}/builds/{BUILD_NUMBER}/downloads/spigot", name, LATEST_VERSION, jar_size)
+        elif source["type"] == "modrinth":
+            download_url = f"https://cdn.modrinth.com/data/{source['project']}/versions/{LATEST_VERSION}/{jar_name(name)}"
+            def version() -> dict:
+                body = make_jar(name, LATEST_VERSION, jar_size)
+                return {
+                    "project_id": source["project"],
+                    "version_number": LATEST_VERSION,
+                    "game_versions": [mc_version],
+                    "loaders": ["paper", "spigot", "bukkit"],
+                    "files": [{
+                        "primary": True,
+                        "url": download_url,
+                        "filename": jar_name(name),
+                        "size": len(body),
+                        "hashes": {"sha512": hashlib.sha512(body).hexdigest(), "sha1": hashlib.sha1(body).hexdigest()},
+                    }],
+                }
+            self._modrinth_versions[name] = version
+            self._json(f"/api.modrinth.com/v2/project/{source['project']}/version", lambda: [version()])
+            self._download("/cdn.modrinth.com" + urllib.parse.urlsplit(download_url).path, name, LATEST_VERSION, jar_size)
+        else:
+            download_url = f"https://hangarcdn.papermc.io/plugins/bench/{name}/versions/{LATEST_VERSION}/PAPER/{jar_name(name)}"
+
+            def versions() -> dict:
+                (sha256, size) = self.jar_info(name, LATEST_VERSION, jar_size)
+                (old_sha256, old_size) = self.jar_info(name, OLD_VERSION, jar_size)
+                old_url = download_url.replace(LATEST_VERSION, OLD_VERSION)
+                return {"result": [{
+                    "name": LATEST_VERSION,
+                    "platformDependencies": {"PAPER": [mc_version]},
+                    "downloads": {"PAPER": {"downloadUrl": download_url, "fileInfo": {"name": jar_name(name), "sha256Hash": sha256, "sizeBytes": size}}},
+                }, {
+                    "name": OLD_VERSION,
+                    "platformDependencies": {"PAPER": [mc_version]},
+                    "downloads": {"PAPER": {"downloadUrl": old_url, "fileInfo": {"name": f"{name}-{OLD_VERSION}.jar", "sha256Hash": old_sha256, "sizeBytes": old_size}}},
+                }]}
+            self._json(f"/hangar.papermc.io/api/v1/projects/{name}/versions", versions)
+            self._download("/hangarcdn.papermc.io" + urllib.parse.urlsplit(download_url).path, name, LATEST_VERSION, jar_size)
+
+    def paper_build(self, number: int) -> dict:
+        mc_version = self.options.mc_version
+        name = f"paper-{mc_version}-{number}.jar"
+        return {
+            "build": number,
+            "time": f"2024-01-{number % 28 + 1:02d}T00:00:00.000Z",
+            "channel": "default",
+            "promoted": False,
+            "changes": [{"commit": f"{number:040x}", "summary": f"Synthetic build {number}", "message": f"Synthetic build {number}"}],
+            "downloads": {"application": {"name": name, "sha256": self.jar_info("Paper", str(number), self.options.paper_size)[0]}},
+        }
+
+    def _add_paper(self):
+        mc_version = self.options.mc_version
+        numbers = list(range(1, self.options.paper_builds + 1))
+        version_path = f"/api.papermc.io/v2/projects/paper/versions/{mc_version}"
+        self._json("/api.papermc.io/v2/projects/paper", lambda: {"project_id": "paper", "versions": [mc_version]})
+        self._json(version_path, lambda: {"project_id": "paper", "version": mc_version, "builds": numbers})
+        self._json(version_path + "/builds", lambda: {"project_id": "paper", "version": mc_version, "builds": [self.paper_build(number) for number in numbers]})
+        for number in numbers:
+            self._json(f"{version_path}/builds/{number}", lambda number=number: self.paper_build(number))
+            self._download(f"{version_path}/builds/{number}/downloads/paper-{mc_version}-{number}.jar", "Paper", str(number), self.options.paper_size)
+
+    def graphql(self, request: dict) -> dict:
+        """Answers paper_updater.github's batched latest release query for the synthetic repos."""
+        variables = request.get("variables", {})
+        with_digest = " digest" in request.get("query", "")
+        data = {}
+        for key in variables:
+            if not key.startswith("owner"):
+                continue
+            i = key[len("owner"):]
+            name = variables["name" + i]
+            if variables[key] != "bench" or ("/api.github.com/repos/bench/" + name + "/releases/latest") not in self.routes:
+                data["repo" + i] = None
+                continue
+            release = self.github_release(name, with_digest)
+            nodes = [{"name": asset["name"], "downloadUrl": asset["browser_download_url"], "size": asset["size"], **({"digest": asset["digest"]} if with_digest else {})} for asset in release["assets"]]
+            data["repo" + i] = {"latestRelease": {"tagName": release["tag_name"], "releaseAssets": {"totalCount": len(nodes), "nodes": nodes}}}
+        return {"data": data}
+
+    def modrinth_version_files(self, request: dict) -> dict:
+        """Answers Modrinth's version_files/update for the sha512 hashes of the synthetic Modrinth plugins' jars."""
+        with self._lock:
+            if self._modrinth_hashes is None:
+                self._modrinth_hashes = {
+                    hashlib.sha512(make_jar(name, version, self.options.jar_size)).hexdigest(): name
+                    for name in self._modrinth_versions
+                    for version in (OLD_VERSION, LATEST_VERSION)
+                }
+        answer = {}
+        for sha512 in request.get("hashes", []):
+            name = self._modrinth_hashes.get(sha512)
+            if name is not None and self.options.mc_version in request.get("game_versions", [self.options.mc_version]):
+                answer[sha512] = self._modrinth_versions[name]()
+        return answer
+
+    def manifest(self) -> dict:
+        return {"plugins": [manifest_entry(number) for number in range(self.options.plugins)]}
+
+
+def recording_path(recordings: str, path: str) -> str:
+    """Where the response for path (/<host>/<rest>?<query>) is recorded: <recordings>/<host>/<quoted rest and query>."""
+    (host, _, rest) = path.lstrip("/").partition("/")
+    return os.path.join(recordings, host, urllib.parse.quote(rest, safe="") or "_")
+
+
+class MockHandler(http.server.BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    options = None
+    world = None
+    stats = collections.defaultdict(lambda: {"requests": 0, "bytes": 0})
+    lock = threading.Lock()
+
+    def log_message(self, format: str, *args):
+        pass
+
+    def count(self, body_size: int):
+        host = self.path.lstrip("/").partition("/")[0]
+        with self.lock:
+            self.stats[host]["requests"] += 1
+            self.stats[host]["bytes"] += body_size
+
+    def do_HEAD(self):
+        self.serve(send_body=False)
+
+    def do_GET(self):
+        self.serve(send_body=True)
+
+    def do_POST(self):
+        body = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        if self.path == "/_stats/reset":
+            with self.lock:
+                self.stats.clear()
+            self.respond(200, "application/json", b"{}")
+            return
+        if self.path.split("?")[0] == "/api.github.com/graphql":
+            time.sleep(self.options.latency)
+            answer = json.dumps(self.world.graphql(json.loads(body))).encode()
+            self.count(len(answer))
+            self.respond(200, "application/json", answer)
+            return
+        if self.path.split("?")[0] == "/api.modrinth.com/v2/version_files/update":
+            time.sleep(self.options.latency)
+            answer = json.dumps(self.world.modrinth_version_files(json.loads(body))).encode()
+            self.count(len(answer))
+            self.respond(200, "application/json", answer)
+            return
+        self.respond(404, "text/plain", b"")
+
+    def find(self) -> (str, bytes):
+        """(content type, body) for this request, or None."""
+        path = self.path.split("?")[0]
+        if path == "/_stats":
+            with self.lock:
+                return ("application/json", json.dumps(self.stats).encode())
+        if path == "/_manifest":
+            return ("application/json", json.dumps(self.world.manifest(), indent=4).encode())
+
+        if self.options.recordings is not None:
+            recorded_path = recording_path(self.options.recordings, self.path)
+            if os.path.isfile(recorded_path):
+                with open(recorded_path, "rb") as recorded_file:
+                    body = recorded_file.read()
+                return ("application/json" if body[:1] in (b"{", b"[") else "application/octet-stream", body)
+
+        route = self.world.routes.get(path)
+        if route is not None:
+            return route()
+
+        if self.options.record and self.options.recordings is not None:
+            return self.record()
+        return None
+
+    def record(self) -> (str, bytes):
+        """Fetches this request from the real host and saves the answer."""
+        request = urllib.request.Request("https:/" + self.path, headers={"User-Agent": "paper-plugin-updater"})
+        try:
+            with urllib.request.urlopen(request, timeout=60) as response:
+                content_type = response.headers.get("Content-Type", "application/octet-stream")
+                body = response.read()
+        except OSError as e:
+            sys.stderr.write(f"Unable to record {self.path}: {e}\n")
+            return None
+
+        recorded_path = recording_path(self.options.recordings, self.path)
+        os.makedirs(os.path.dirname(recorded_path), exist_ok=True)
+        with open(recorded_path + ".tmp", "wb") as recorded_file:
+            recorded_file.write(body)
+        os.replace(recorded_path + ".tmp", recorded_path)
+        sys.stderr.write(f"Recorded {self.path}\n")
+        return (content_type, body)
+
+    def serve(self, send_body: bool):
+        if self.options.latency > 0:
+            time.sleep(self.options.latency)
+        found = self.find()
+        if found is None:
+            self.count(0)
+            self.respond(404, "text/plain", b"")
+            return
+        (content_type, body) = found
+
+        etag = '"' + hashlib.sha256(body).hexdigest()[:32] + '"'
+        if self.headers.get("If-None-Match") == etag:
+            self.count(0)
+            self.respond(304, content_type, b"", {"ETag": etag})
+            return
+
+        status = 200
+        headers = {"ETag": etag, "Accept-Ranges": "bytes"}
+        range_header = self.headers.get("Range")
+        if range_header and range_header.startswith("bytes="):
+            (first, _, last) = range_header[len("bytes="):].partition("-")
+            start = int(first)
+            end = min(int(last), len(body) - 1) if last else len(body) - 1
+            if start > end:
+                self.count(0)
+                self.respond(416, content_type, b"", {"Content-Range": f"bytes */{len(body)}"})
+                return
+            headers["Content-Range"] = f"bytes {start}-{end}/{len(body)}"
+            body = body[start:end + 1]
+            status = 206
+
+        self.count(len(body) if send_body else 0)
+        self.respond(status, content_type, body, headers, send_body)
+
+    def respond(self, status: int, content_type: str, body: bytes, headers: dict = None, send_body: bool = True):
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        for (key, value) in (headers or {}).items():
+            self.send_header(key, value)
+        self.end_headers()
+        if not send_body:
+            return
+
+        if self.options.bandwidth <= 0:
+            self.wfile.write(body)
+            return
+        for start in range(0, len(body), SEND_CHUNK_SIZE):
+            chunk = body[start:start + SEND_CHUNK_SIZE]
+            self.wfile.write(chunk)
+            time.sleep(len(chunk) / self.options.bandwidth)
+
+
+def main():
+    options = parser.parse_args()
+    if options.record and options.recordings is None:
+        parser.error("--record needs --recordings")
+    MockHandler.options = options
+    MockHandler.world = World(options)
+    server = http.server.ThreadingHTTPServer((options.host, options.port), MockHandler)
+    server.daemon_threads = True
+    # The first line tells whoever started us (e.g. bench/bench.py) where to find us, with --port 0 too
+    print(f"Serving on http://{options.host}:{server.server_address[1]}", flush=True)
+    server.serve_forever()
+
+
+if __name__ == "__main__":
+    main()
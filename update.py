@@ -1,39 +1,85 @@
 #!/bin/python3
+import re
+import ast
 import json
+import time
+import fnmatch
 import argparse
-import requests
-import urllib.request
 import os
+import sys
+import inspect
+import threading
 import traceback
+import functools
+import contextlib
+import contextvars
+import concurrent.futures
+
+from paper_updater import engine, github, run_report
+from paper_updater.http_client import HttpClient, DEFAULT_POOL_SIZE, DEFAULT_HOST_LIMIT
+from paper_updater.metadata_cache import MetadataCache, DEFAULT_TTL
+from paper_updater.artifact_store import ArtifactStore
+from paper_updater.plugin_index import PluginIndex, changes_by
+from paper_updater.generations import Generations, swap_symlink
+from paper_updater.paper import BuildIndex, PAPER_API, CHANNELS
+from paper_updater.compatibility import CompatibilityMatrix, StrandedPlugins
+from paper_updater.digests import DigestCache
+from paper_updater.run_report import RunReport
+from paper_updater.resilience import RetryPolicy, DEFAULT_RETRIES
+
+# Paths are resolved against the directory update.py was started in once, up front. A legacy updater's os.chdir
+# (see run_updater) changes the cwd of the whole process, other threads must not see their paths move with it.
+START_DIR = os.getcwd()
+UPDATERS_DIR = os.path.join(START_DIR, "plugins", "updaters")
 
 parser = argparse.ArgumentParser(prog="papermc-updater", description="Updates plugins and Paper version", formatter_class=argparse.ArgumentDefaultsHelpFormatter)
 parser.add_argument("mc_version", type=str, nargs="?", help="Specify a new Minecraft version to upgrade to.")
+parser.add_argument("--force", action="store_true", help="Upgrade to mc_version even if some plugins have no release that supports it.")
+parser.add_argument("-j", "--jobs", type=int, default=4, help="Number of plugin updaters to run at the same time.")
+parser.add_argument("--cache-ttl", type=float, default=DEFAULT_TTL, help="Seconds to reuse cached metadata before revalidating it with the server.")
+parser.add_argument("--no-cache", action="store_true", help="Don't read or write the on-disk metadata cache.")
+parser.add_argument("--no-store", action="store_true", help="Don't share downloaded jars through the on-disk artifact store.")
+parser.add_argument("--host-limit", type=int, default=DEFAULT_HOST_LIMIT, help="Number of requests sent to the same host at the same time.")
+parser.add_argument("--paper-channel", type=str, choices=CHANNELS, default="default", help="Only update Paper to builds from this channel (experimental also allows default builds).")
+parser.add_argument("--paper-min-age", type=float, default=0, metavar="HOURS", help="Only update Paper to builds published at least this many hours ago.")
+parser.add_argument("--retries", type=int, default=DEFAULT_RETRIES, help="Times a failed request or download is retried, with backoff, before giving up.")
+parser.add_argument("--segments", type=int, default=1, help="Download large files as this many parallel byte ranges, if the server supports it.")
+parser.add_argument("--mirror", type=str, metavar="URL", default=os.environ.get("PAPER_UPDATER_MIRROR"), help="Send every request through the mirror at URL (see --serve-mirror), also settable with $PAPER_UPDATER_MIRROR.")
+parser.add_argument("--serve-mirror", type=str, metavar="[HOST:]PORT", help="Run as a caching mirror for other hosts' update.py --mirror, instead of updating anything.")
+parser.add_argument("--delta", type=str, metavar="URL", help="Ask the delta service at URL (see tools/delta_server.py) for updated jars as deltas against the installed version, downloading whole jars when that fails.")
+parser.add_argument("--servers", type=str, nargs="+", metavar="SERVER_ROOT", help="Update these server roots instead of the current directory.")
+parser.add_argument("--manifest", type=str, help="File listing server roots to update, one per line.")
+parser.add_argument("--server-jobs", type=int, default=4, help="Number of servers to update at the same time with --servers/--manifest.")
+parser.add_argument("--identify", action="store_true", help="Look up jars no updater accounts for on Modrinth and Hangar by their hashes, and update the ones found there.")
+parser.add_argument("--check", action="store_true", help="Only show what would be updated, without downloading or changing anything.")
+parser.add_argument("--audit", action="store_true", help="Check the jars in plugins and paper.jar against the checksums upstream published for them, reporting corrupt, tampered and unknown files.")
+parser.add_argument("--json", action="store_true", help="With --check or --audit, print the result as one JSON object per server.")
+parser.add_argument("--rollback", action="store_true", help="Undo the last update: put back the jars (and paper.jar) it replaced.")
+parser.add_argument("--daemon", action="store_true", help="Keep running, checking for updates every --interval seconds and downloading them into staging, to be swapped in by --apply-staged.")
+parser.add_argument("--interval", type=float, default=3600, metavar="SECONDS", help="Seconds between the checks of --daemon. Keep --cache-ttl below it so every check revalidates the metadata.")
+parser.add_argument("--apply-staged", action="store_true", help="Swap in the update staged by --daemon, without any network access (e.g. while the server is stopped).")
+parser.add_argument("--report", type=str, metavar="FILE", help="Append a JSON lines report of the run (timings, requests, downloads, cache hits and outcome per updater) to FILE.")
+parser.add_argument("--prometheus", type=str, metavar="FILE", help="Write the run report as a Prometheus textfile to FILE.")
 args = vars(parser.parse_args())
 
 # Helpful web functions
-def api_GET(endpoint: str) -> dict:
-    return requests.get("https://api.papermc.io/v2/projects/paper" + endpoint).json()
+# Every Paper build seen so far, so each run only asks about new ones
+paper_builds = BuildIndex()
+# Which MC versions each plugin release supports, see paper_updater.compatibility
+compatibility_matrix = CompatibilityMatrix()
+# Hashes of installed jars, for --identify and --audit
+digest_cache = DigestCache()
 
 
-def api_DOWNLOAD(endpoint: str, fileName: str) -> str:
-    """
-    # Dear heavens, this takes farrrrr too long to download
-    # https://stackoverflow.com/a/10744565
-    response = requests.get("https://api.papermc.io/v2/projects/paper" + endpoint, stream=True)
-    with open(fileName, "wb") as handle:
-        for data in tqdm(response.iter_content()):
-            handle.write(data)
-    """
-    print(f"Downloading {fileName}...")
-    response = urllib.request.urlretrieve("https://api.papermc.io/v2/projects/paper" + endpoint, fileName)
-    return fileName
+def api_DOWNLOAD(http: HttpClient, endpoint: str, fileName: str, sha256: str = None, base_path: str = None) -> str:
+    return http.download(PAPER_API + endpoint, fileName, sha256, base_path=base_path)
 
 
 # Update paper.jar
-def paper_get_current_version() -> (int, str):
+def paper_get_current_version(server_root: str) -> (int, str):
     paper_build = None
     paper_mc_version = None
-    with open("version_history.json", "r") as versionFile:
+    with open(os.path.join(server_root, "version_history.json"), "r") as versionFile:
         versionData = json.loads(versionFile.readline())
         print(f"Current PaperMC version: {versionData['currentVersion']}")
         # git-Paper-493 (MC: 1.20.4)
@@ -48,50 +94,84 @@ def paper_get_current_version() -> (int, str):
     return (int(paper_build), paper_mc_version)
 
 
-def paper_get_latest_version(mc_version: str) -> int:
+def paper_get_latest_version(http: HttpClient, mc_version: str) -> int:
     print("Checking latest PaperMC build...")
-    response = api_GET("/versions/" + mc_version)
-    paper_build = int(response["builds"][-1])
-    print(f"Latest PaperMC build: {paper_build}")
+    build = paper_builds.latest(http, mc_version, args["paper_channel"], args["paper_min_age"])
+    paper_build = build["build"]
+    print(f"Latest PaperMC build: {paper_build} ({build['channel']})")
 
     return paper_build
 
 
-def paper_get_build_download_name(mc_version: str, build: int) -> str:
-    response = api_GET("/versions/" + mc_version + "/builds/" + str(build))
-    download_name = response["downloads"]["application"]["name"]
+def paper_get_build_download(http: HttpClient, mc_version: str, build: int) -> dict:
+    """Returns the build's "name" and "sha256", along with its "channel", "time" and "changes"."""
+    return paper_builds.get(http, mc_version, build)
+
+
+def paper_print_changes(http: HttpClient, mc_version: str, from_build: int, to_build: int):
+    for build in paper_builds.builds(http, mc_version):
+        if from_build < build["build"] <= to_build:
+            for change in build["changes"]:
+                print(f" - {build['build']}: {change}")
+
+
+def paper_get_build_download_name(http: HttpClient, mc_version: str, build: int) -> str:
+    download_name = paper_get_build_download(http, mc_version, build)["name"]
     print(f"Download name: {download_name}")
     return download_name
 
 
-def paper_download_build(mc_version: str, build: int) -> str:
-    download_name = paper_get_build_download_name(mc_version, build)
-    new_paper_path = api_DOWNLOAD("/versions/" + mc_version + "/builds/" + str(build) + "/downloads/" + download_name, download_name)
-    return new_paper_path
+def paper_download_build(http: HttpClient, server_root: str, mc_version: str, build: int) -> str:
+    download = paper_get_build_download(http, mc_version, build)
+    download_name = download["name"]
+    print(f"Download name: {download_name}")
+    # The current build, for a delta against it
+    current_path = os.path.realpath(os.path.join(server_root, "paper.jar"))
+    api_DOWNLOAD(http, "/versions/" + mc_version + "/builds/" + str(build) + "/downloads/" + download_name, os.path.join(server_root, download_name), download["sha256"], current_path)
+    return download_name
+
 
+def paper_symlink(server_root: str, new_paper_path: str):
+    # Renaming over paper.jar swaps the link in one step, so there is never a moment without a paper.jar
+    swap_symlink(os.path.join(server_root, "paper.jar"), new_paper_path)
 
-def paper_symlink(new_paper_path: str):
-    os.remove("paper.jar")
-    os.symlink(new_paper_path, "paper.jar")
+
+def paper_is_linked(server_root: str, download_name: str) -> bool:
+    """
+    Whether paper.jar already points at download_name. version_history.json only changes once the server restarts, so
+    until then this is how a build that was already swapped in is told apart from one that still needs updating to.
+    """
+    paper_jar = os.path.join(server_root, "paper.jar")
+    return os.path.islink(paper_jar) and os.path.basename(os.readlink(paper_jar)) == download_name
 
 
-def paper_update(upgrade_version: str) -> str:
-    (paper_build, paper_mc_version) = paper_get_current_version() 
+def paper_update(http: HttpClient, server_root: str, upgrade_version: str, generations: Generations = None) -> (str, str):
+    """
+    Downloads the latest Paper build. Returns (upgrade_version, the new build's file name or None if up to date).
+    With generations, paper.jar is left alone for Generations.commit to point at the new build, otherwise it's done here.
+    """
+    (paper_build, paper_mc_version) = paper_get_current_version(server_root)
     print("")
 
     if not upgrade_version:
         print("mc_version not specified, using current MC version")
         upgrade_version = paper_mc_version
 
-    latest_paper_build = paper_get_latest_version(upgrade_version)
+    latest_paper_build = paper_get_latest_version(http, upgrade_version)
     if latest_paper_build <= paper_build and paper_mc_version == upgrade_version:
         print("Paper is already at latest build!")
-        return upgrade_version
+        return (upgrade_version, None)
+    if paper_is_linked(server_root, paper_get_build_download(http, upgrade_version, latest_paper_build)["name"]):
+        print(f"paper.jar already points at build {latest_paper_build}, it is used once the server restarts")
+        return (upgrade_version, None)
     
     print("Update available!")
+    if paper_mc_version == upgrade_version:
+        paper_print_changes(http, upgrade_version, paper_build, latest_paper_build)
 
-    latest_path = paper_download_build(upgrade_version, latest_paper_build)
-    paper_symlink(latest_path)
+    latest_path = paper_download_build(http, server_root, upgrade_version, latest_paper_build)
+    if generations is None:
+        paper_symlink(server_root, latest_path)
 
     version_format = "({mc}) {build}"
     if paper_mc_version == upgrade_version:
@@ -101,89 +181,845 @@ def paper_update(upgrade_version: str) -> str:
     new_version = version_format.format(mc=upgrade_version, build=latest_paper_build)
     print(f"Successfully updated paper: {old_version} -> {new_version}")
 
-    return upgrade_version
+    return (upgrade_version, latest_path)
 
 
-def run_plugin_updaters(updaters_dir: str, upgrade_version: str) -> (int, int, list[str]):
-    if not os.path.isdir(updaters_dir):
-        return (0, 0)
+def paper_check(server_root: str, index: PluginIndex, http: HttpClient, upgrade_version: str) -> list[dict]:
+    """Works out what paper_update would do. Has the same shape as the plugin checkers so it can run alongside them."""
+    (paper_build, paper_mc_version) = paper_get_current_version(server_root)
+    if not upgrade_version:
+        upgrade_version = paper_mc_version
 
-    success_counter = 0
-    updater_total = 0
+    latest_paper_build = paper_get_latest_version(http, upgrade_version)
+    download = paper_get_build_download(http, upgrade_version, latest_paper_build)
+    return [{
+        "name": "Paper",
+        "current_file": "paper.jar",
+        "current_version": f"{paper_mc_version} build {paper_build}",
+        "target_file": download["name"],
+        "target_version": f"{upgrade_version} build {latest_paper_build}",
+        "up_to_date": (latest_paper_build <= paper_build and paper_mc_version == upgrade_version) or paper_is_linked(server_root, download["name"]),
+        "url": PAPER_API + "/versions/" + upgrade_version + "/builds/" + str(latest_paper_build) + "/downloads/" + download["name"],
+        "sha256": download["sha256"],
+        "size": None,
+    }]
 
-    plugins_accounted_for: list[str] = []
 
-    for updater_file_name in os.listdir(updaters_dir):
+class ThreadOutput:
+    """
+    Stands in for sys.stdout while updaters run in worker threads.
+    Anything a thread prints while capturing goes to its own buffer, so each updater's output stays in one piece.
+    """
+
+    def __init__(self, stream):
+        self._stream = stream
+        # Held in a context variable rather than a thread local, so async updaters' asyncio.to_thread calls print into their buffer
+        self._context_buffers = contextvars.ContextVar("thread_output_buffers", default=None)
+
+    def _buffers(self) -> list:
+        buffers = self._context_buffers.get()
+        if buffers is None:
+            buffers = []
+            self._context_buffers.set(buffers)
+        return buffers
+
+    def start_capture(self):
+        # Captures nest, so a captured function can capture part of its own output
+        self._buffers().append([])
+
+    def stop_capture(self) -> str:
+        return "".join(self._buffers().pop())
+
+    def write(self, text: str) -> int:
+        buffers = self._buffers()
+        if len(buffers) == 0:
+            return self._stream.write(text)
+        buffers[-1].append(text)
+        return len(text)
+
+    def flush(self):
+        self._stream.flush()
+
+    def __getattr__(self, name: str):
+        return getattr(self._stream, name)
+
+
+@contextlib.contextmanager
+def thread_output():
+    """Installs a ThreadOutput as sys.stdout for the duration, unless one is already installed."""
+    if isinstance(sys.stdout, ThreadOutput):
+        yield sys.stdout
+        return
+
+    stdout = sys.stdout
+    output = ThreadOutput(stdout)
+    sys.stdout = output
+    try:
+        yield output
+    finally:
+        sys.stdout = stdout
+
+
+def run_captured(output: ThreadOutput, function, *function_args):
+    """Runs function on the current thread, returning (result, printed output, exc_info or None)."""
+    output.start_capture()
+    result = None
+    error = None
+    try:
+        result = function(*function_args)
+    except Exception:
+        error = sys.exc_info()
+    finally:
+        captured = output.stop_capture()
+
+    return (result, captured, error)
+
+
+# Updaters written before plugins_dir was passed in work relative to the cwd, so only one of them may run at a time.
+# Nothing else uses relative paths, see START_DIR.
+legacy_cwd_lock = threading.Lock()
+
+
+def run_updater(updater, index: PluginIndex, http: HttpClient, upgrade_version: str) -> list[str]:
+    plugins_dir = index.plugins_dir
+    if hasattr(updater, "update_async"):
+        # Imported here so runs without async updaters don't import asyncio
+        from paper_updater.async_http import AsyncHttpClient, run_async
+        return run_async(updater.update_async, upgrade_version, plugins_dir, AsyncHttpClient(http), index)
+
+    parameter_count = len(inspect.signature(updater.update).parameters)
+    if parameter_count >= 4:
+        return updater.update(upgrade_version, plugins_dir, http, index)
+
+    # Updaters that don't take the index change the plugins directory behind its back
+    try:
+        if parameter_count == 3:
+            return updater.update(upgrade_version, plugins_dir, http)
+        if parameter_count == 2:
+            return updater.update(upgrade_version, plugins_dir)
+
+        with legacy_cwd_lock:
+            old_cwd = os.getcwd()
+            os.chdir(plugins_dir)
+            try:
+                return updater.update(upgrade_version)
+            finally:
+                os.chdir(old_cwd)
+    finally:
+        index.refresh(changed_by_updater=True)
+
+
+def run_checker(updater, index: PluginIndex, http: HttpClient, upgrade_version: str) -> list[dict]:
+    return updater.check(upgrade_version, index.plugins_dir, http, index)
+
+
+def run_measured(stats: run_report.Stats, updater, *updater_args):
+    """Runs updater, counting its time and requests against stats, and its plugin index changes as made by stats.name."""
+    with run_report.collect(stats), changes_by(stats.name):
+        return updater(*updater_args)
+
+
+MANIFEST_NAME = "plugins.json"
+
+
+def load_manifest_plugins(updaters_dir: str, index: PluginIndex = None) -> list:
+    """
+    Returns (name, plugin) pairs for the entries in the plugin manifest, if there is one.
+    With an index, only plugins that are installed are returned.
+    """
+    manifest_path = os.path.join(updaters_dir, MANIFEST_NAME)
+    if not os.path.isfile(manifest_path):
+        return []
+    return [
+        (f"{os.path.relpath(manifest_path, START_DIR)} ({plugin['name']})", plugin)
+        for plugin in engine.load_manifest(manifest_path)
+        if index is None or index.find(plugin["prefix"]) is not None
+    ]
+
+
+def read_jar_patterns(updater_source_path: str) -> list[str]:
+    """
+    Returns the JAR_PATTERNS an updater script declares (fnmatch patterns for the jars it updates), or None.
+    The script is parsed, not imported, so this is cheap even for updaters that have slow imports.
+    """
+    with open(updater_source_path, "r") as updater_file:
+        tree = ast.parse(updater_file.read(), updater_source_path)
+
+    for node in tree.body:
+        if isinstance(node, ast.Assign) and any(isinstance(target, ast.Name) and target.id == "JAR_PATTERNS" for target in node.targets):
+            return list(ast.literal_eval(node.value))
+    return None
+
+
+def load_updater_modules(updaters_dir: str, index: PluginIndex = None) -> list:
+    """
+    Imports the updater scripts, returning (path, module) pairs.
+    With an index, scripts declaring JAR_PATTERNS that match none of the installed jars aren't imported at all.
+    """
+    names = index.names() if index is not None else None
+    modules = []
+    # Sorted so updaters always run and report in the same order
+    for updater_file_name in sorted(os.listdir(updaters_dir)):
         (updater_file_name, updater_file_ext) = os.path.splitext(updater_file_name)
         if updater_file_ext != ".py":
             continue
 
-        updater_total = updater_total + 1
         updater_file_path = os.path.join(updaters_dir, updater_file_name)
+        if names is not None:
+            jar_patterns = read_jar_patterns(updater_file_path + updater_file_ext)
+            if jar_patterns is not None and not any(fnmatch.filter(names, pattern) for pattern in jar_patterns):
+                continue
+
+        # Named as before paths were resolved, e.g. plugins/updaters/essentialsx, in the output and the run report
+        updater_file_path = os.path.relpath(updater_file_path, START_DIR)
         updater_module_path = updater_file_path.replace(os.sep, ".")
-        updater = __import__(updater_module_path, fromlist=[None])
-        did_attempt = False
-        try:
-            os.chdir("plugins")
-            files = updater.update(upgrade_version)
-            did_attempt = len(files) > 0
-            if did_attempt:
-                plugins_accounted_for.extend(files)
-                success_counter = success_counter + 1
-            else:
-                updater_total = updater_total - 1
-        except:
-            print(f"Unexpected error when running the updater found in {updater_file_path}!")
-            traceback.print_exc() 
-        finally:
-            os.chdir("..")
-
-        if did_attempt:
-            print("")
+        modules.append((updater_file_path, __import__(updater_module_path, fromlist=[None])))
+
+    return modules
+
+
+def load_updaters(updaters_dir: str, index: PluginIndex = None) -> list:
+    """
+    Returns (name, updater) pairs for the entries in the plugin manifest followed by the updater scripts.
+    Each updater is called as updater(index, http, upgrade_version).
+    With an index, updaters for plugins that aren't installed are left out, see load_updater_modules.
+    """
+    updaters = []
+    for (name, plugin) in load_manifest_plugins(updaters_dir, index):
+        updaters.append((name, functools.partial(engine.update_plugin, plugin)))
+    for (updater_file_path, updater) in load_updater_modules(updaters_dir, index):
+        updaters.append((updater_file_path, functools.partial(run_updater, updater)))
+
+    return updaters
+
+
+def load_checkers(updaters_dir: str, index: PluginIndex = None) -> (list, list[str]):
+    """
+    Like load_updaters, but each checker returns the plans for its plugins instead of updating them.
+    Also returns the updater scripts that have no check function, and so can't say what they would do.
+    """
+    checkers = []
+    unsupported = []
+    for (name, plugin) in load_manifest_plugins(updaters_dir, index):
+        checkers.append((name, functools.partial(engine.check_plugin, plugin)))
+    for (updater_file_path, updater) in load_updater_modules(updaters_dir, index):
+        if hasattr(updater, "check"):
+            checkers.append((updater_file_path, functools.partial(run_checker, updater)))
+        else:
+            unsupported.append(updater_file_path)
+
+    return (checkers, unsupported)
+
+
+def run_plugin_updaters(http: HttpClient, updaters_dir: str, index: PluginIndex, upgrade_version: str, jobs: int = 1, report: RunReport = None, server_root: str = ".") -> (int, int, list[str]):
+    if not os.path.isdir(updaters_dir):
+        return (0, 0, [])
+    return run_updaters(http, load_updaters(updaters_dir, index), index, upgrade_version, jobs, report, server_root)
+
+
+def run_updaters(http: HttpClient, updaters: list, index: PluginIndex, upgrade_version: str, jobs: int = 1, report: RunReport = None, server_root: str = ".") -> (int, int, list[str]):
+    """Runs (name, updater) pairs, see load_updaters. Returns (updaters that succeeded, updaters run, jars accounted for)."""
+    if report is None:
+        report = RunReport()
+
+    success_counter = 0
+    updater_total = 0
+
+    plugins_accounted_for: list[str] = []
+
+    updater_stats = [report.record(server_root, "updater", updater_file_path) for (updater_file_path, _) in updaters]
+
+    with thread_output() as output:
+        with concurrent.futures.ThreadPoolExecutor(max_workers=max(1, jobs)) as executor:
+            futures = [
+                executor.submit(run_captured, output, run_measured, stats, updater, index, http, upgrade_version)
+                for ((_, updater), stats) in zip(updaters, updater_stats)
+            ]
+
+            # Results are reported in submission order, not completion order
+            for ((updater_file_path, _), stats, future) in zip(updaters, updater_stats, futures):
+                (files, updater_output, error) = future.result()
+                print(updater_output, end="")
+
+                updater_total = updater_total + 1
+                did_attempt = False
+                if error is not None:
+                    stats.outcome = "failed"
+                    stats.error = f"{error[0].__name__}: {error[1]}"
+                    print(f"Unexpected error when running the updater found in {updater_file_path}!")
+                    # Printed to stdout so it stays with the rest of this server's output
+                    traceback.print_exception(*error, file=sys.stdout)
+                    # Whatever it got through stays unchanged rather than half updated
+                    index.drop_changes(updater_file_path)
+                else:
+                    did_attempt = len(files) > 0
+                    if did_attempt:
+                        stats.outcome = "completed"
+                        plugins_accounted_for.extend(files)
+                        success_counter = success_counter + 1
+                    else:
+                        stats.outcome = "not installed"
+                        updater_total = updater_total - 1
+
+                if did_attempt:
+                    print("")
 
     return (success_counter, updater_total, plugins_accounted_for)
 
 
-def report_updater_coverage(plugins_accounted_for_list: list[str]):
+def run_identified_updaters(http: HttpClient, index: PluginIndex, plugins_accounted_for: list[str], upgrade_version: str, jobs: int = 1, report: RunReport = None, server_root: str = ".") -> (int, int, list[str]):
+    """Updates the jars no updater accounted for that Modrinth or Hangar recognise, see paper_updater.identify."""
+    # Jars an updater is replacing are accounted for too, they're only still installed because of staging
+    (_, removed) = index.staged_changes()
+    accounted_for = set(plugins_accounted_for) | set(removed)
+    unaccounted = [name for name in index.names() if name not in accounted_for]
+    if len(unaccounted) == 0:
+        return (0, 0, [])
+
+    from paper_updater import identify
+    print(f"Looking up {len(unaccounted)} jars without an updater on Modrinth and Hangar...")
+    (plans, unrecognised) = identify.identify(http, index, unaccounted, upgrade_version, digest_cache)
+    print(f"Recognised {len(plans)} of them")
+    print("")
+    updaters = [(f"{plan['current_file']} (identified)", functools.partial(identify.update_identified, plan)) for plan in plans]
+    return run_updaters(http, updaters, index, upgrade_version, jobs, report, server_root)
+
+
+def report_updater_coverage(index: PluginIndex, plugins_accounted_for_list: list[str]) -> list[str]:
     plugins_accounted_for: set[str] = set(plugins_accounted_for_list)
     unaccounted_plugins: set[str] = set()
-    os.chdir("plugins")
-    for file in os.listdir("."):
-        if not os.path.isfile(file):
-            continue
-        if not file.endswith(".jar"):
-            continue
-
+    for file in index.names():
         if file not in plugins_accounted_for:
             unaccounted_plugins.add(file)
-    os.chdir("..")
 
     unaccounted_plugins_len = len(unaccounted_plugins)
     if unaccounted_plugins_len == 0:
-        return
+        return []
 
     print("")
     print(f"{unaccounted_plugins_len} plugins not updated due to a missing updater script:")
-    for unaccounted_plugin in unaccounted_plugins:
+    for unaccounted_plugin in sorted(unaccounted_plugins):
         print(f" - {unaccounted_plugin}")
 
+    return sorted(unaccounted_plugins)
 
-def main():
-    global args
-    upgrade_version = paper_update(args["mc_version"])
-    print("")
 
-    print(f"Updating plugins using update scripts in 'plugins/updaters'...")
-    print("")
-    (updates_completed, total_updaters, plugins_accounted_for) = run_plugin_updaters("plugins/updaters", upgrade_version)
+def collect_github_repos(updaters_dir: str, index: PluginIndex) -> list[str]:
+    """The GitHub repos ("owner/name") the updaters for the installed plugins will ask for the latest release of."""
+    repos = []
+    for (_, plugin) in load_manifest_plugins(updaters_dir, index):
+        if plugin["source"]["type"] == "github":
+            repos.append(plugin["source"]["repo"])
+    for (_, updater) in load_updater_modules(updaters_dir, index):
+        repos.extend(getattr(updater, "GITHUB_REPOS", []))
+    return repos
+
+
+def resolve_server(http: HttpClient, server_root: str, index: PluginIndex, mc_version: str, jobs: int, report: RunReport = None) -> dict:
+    """
+    Resolves the latest Paper build and plugin releases all at the same time, as none of them depend on each other.
+    Returns {"mc_version", "current_mc_version", "plan", "errors", "unsupported"}, see load_checkers. Nothing is
+    downloaded, but every response is remembered by http, so updating afterwards doesn't wait on the same metadata again.
+    """
+    (checkers, unsupported) = load_checkers(UPDATERS_DIR, index) if os.path.isdir(UPDATERS_DIR) else ([], [])
+
+    plan = []
+    errors = []
+    with thread_output() as output:
+        (current, _, error) = run_captured(output, paper_get_current_version, server_root)
+        if error is not None:
+            raise error[1]
+        current_mc_version = current[1]
+        upgrade_version = mc_version or current_mc_version
+
+        checkers.insert(0, ("Paper", functools.partial(paper_check, server_root)))
+        if report is None:
+            # Nobody asked for the numbers, they are simply dropped
+            report = RunReport()
+        checker_stats = [report.record(server_root, "resolve", name) for (name, _) in checkers]
+
+        with concurrent.futures.ThreadPoolExecutor(max_workers=max(1, jobs)) as executor:
+            def submit(checker, stats: run_report.Stats) -> concurrent.futures.Future:
+                return executor.submit(run_captured, output, run_measured, stats, checker, index, http, upgrade_version)
+
+            # Paper is looked up while the GitHub releases of all plugins are fetched in one query,
+            # which the plugin checkers then find remembered
+            futures = [submit(checkers[0][1], checker_stats[0])]
+            if os.path.isdir(UPDATERS_DIR):
+                with run_report.collect(report.record(server_root, "resolve", "GitHub releases")):
+                    github.prefetch_latest_releases(http, collect_github_repos(UPDATERS_DIR, index))
+            futures.extend(submit(checker, stats) for ((_, checker), stats) in zip(checkers[1:], checker_stats[1:]))
+
+            # What the checkers print is only progress, the plan is what's returned
+            for ((name, _), stats, future) in zip(checkers, checker_stats, futures):
+                (items, _, error) = future.result()
+                if error is not None:
+                    stats.outcome = "failed"
+                    stats.error = f"{error[0].__name__}: {error[1]}"
+                    errors.append({"updater": name, "error": stats.error})
+                    continue
+                stats.outcome = "completed"
+                plan.extend(items)
+
+    return {
+        "mc_version": upgrade_version,
+        "current_mc_version": current_mc_version,
+        "plan": plan,
+        "errors": errors,
+        "unsupported": unsupported,
+    }
+
+
+def update_server(http: HttpClient, server_root: str, mc_version: str, jobs: int, report: RunReport = None, stage_only: bool = False) -> dict:
+    """Updates a server. With stage_only, everything is downloaded but left staged, for --apply-staged to swap in."""
+    if report is None:
+        report = RunReport()
+
+    index = PluginIndex(os.path.abspath(os.path.join(server_root, "plugins")))
+    # Paper and plugin metadata are fetched side by side first, the update itself then finds it all remembered.
+    # Errors are left for the update to run into and report.
+    with report.phase(server_root, "resolve_metadata"):
+        resolved = resolve_server(http, server_root, index, mc_version, jobs, report)
+
+    if resolved["mc_version"] != resolved["current_mc_version"]:
+        # Refused before anything is downloaded, rather than found out when the server starts
+        compatibility = check_compatibility(resolved, index)
+        report_compatibility(resolved, compatibility)
+        if len(compatibility["stranded"]) > 0 and not args["force"]:
+            raise StrandedPlugins(f"Not upgrading to {resolved['mc_version']}, {len(compatibility['stranded'])} updaters found no release that supports it (use --force to upgrade anyway)")
+
+    # Everything is downloaded into plugins/.staging.next first, and only swapped in once all downloads are done.
+    # What an earlier --daemon check staged stays as it was until then.
+    generations = Generations(server_root, index.plugins_dir)
+    with generations.lock():
+        generations.begin_staging(index)
+        try:
+            with report.phase(server_root, "paper_update"):
+                (upgrade_version, new_paper_path) = paper_update(http, server_root, mc_version, generations)
+            print("")
+
+            print(f"Updating plugins using update scripts in 'plugins/updaters'...")
+            print("")
+            with report.phase(server_root, "run_plugin_updaters"):
+                (updates_completed, total_updaters, plugins_accounted_for) = run_plugin_updaters(http, UPDATERS_DIR, index, upgrade_version, jobs, report, server_root)
+            if args["identify"]:
+                with report.phase(server_root, "identify"):
+                    (identified_completed, identified_total, identified_files) = run_identified_updaters(http, index, plugins_accounted_for, upgrade_version, jobs, report, server_root)
+                updates_completed += identified_completed
+                total_updaters += identified_total
+                plugins_accounted_for = plugins_accounted_for + identified_files
+
+            if stage_only:
+                staged = generations.stage(index, new_paper_path)
+                # The old jars are still installed, but they're accounted for by the updaters that staged their replacements
+                if staged is not None:
+                    plugins_accounted_for = plugins_accounted_for + staged["removed"]
+            else:
+                with report.phase(server_root, "commit"):
+                    generation = generations.commit(index, new_paper_path)
+        except BaseException:
+            index.end_staging()
+            raise
+    if stage_only:
+        if staged is not None:
+            print(f"Staged {len(staged['added'])} new and {len(staged['removed'])} old jars{' and Paper' if staged['paper'] else ''}, use --apply-staged to swap them in.")
+    elif generation is not None:
+        print(f"Swapped in the update. Replaced files are kept as generation {generation}, use --rollback to go back to them.")
+    index.save()
+
+    unaccounted_plugins = None
     if updates_completed == total_updaters:
         print(f"Successfully updated {updates_completed}/{total_updaters} plugins!")
-        report_updater_coverage(plugins_accounted_for)
+        with report.phase(server_root, "report_updater_coverage"):
+            unaccounted_plugins = report_updater_coverage(index, plugins_accounted_for)
     else:
-        print(f"Failed to update some plugins. {updatesCompleted}/{totalUpdaters} plugins were updated.")
+        print(f"Failed to update some plugins. {updates_completed}/{total_updaters} plugins were updated.")
         print("Unable to give updater coverage due to update failures")
 
+    return {
+        "server_root": server_root,
+        "mc_version": upgrade_version,
+        "updates_completed": updates_completed,
+        "total_updaters": total_updaters,
+        "unaccounted_plugins": unaccounted_plugins,
+    }
+
+
+def read_server_manifest(manifest_path: str) -> list[str]:
+    """Reads one server root per line. Blank lines and lines starting with # are ignored."""
+    manifest_dir = os.path.dirname(os.path.abspath(manifest_path))
+    server_roots = []
+    with open(manifest_path, "r") as manifest_file:
+        for line in manifest_file:
+            line = line.strip()
+            if not line or line.startswith("#"):
+                continue
+            server_roots.append(os.path.normpath(os.path.join(manifest_dir, os.path.expanduser(line))))
+
+    return server_roots
+
+
+def update_servers(http: HttpClient, server_roots: list[str], mc_version: str, jobs: int, server_jobs: int, report: RunReport = None, stage_only: bool = False) -> list[dict]:
+    """
+    Updates several server roots in parallel, printing each server's output in one piece.
+    Metadata is only fetched once per URL and jars only downloaded once thanks to the shared HttpClient,
+    so servers on the same MC version cost little more than one.
+    """
+    results = []
+    with thread_output() as output:
+        with concurrent.futures.ThreadPoolExecutor(max_workers=max(1, server_jobs)) as executor:
+            futures = [
+                executor.submit(run_captured, output, update_server, http, server_root, mc_version, jobs, report, stage_only)
+                for server_root in server_roots
+            ]
+
+            for (server_root, future) in zip(server_roots, futures):
+                (result, server_output, error) = future.result()
+                print(f"===== {server_root} =====")
+                print(server_output, end="")
+                if error is not None:
+                    if issubclass(error[0], StrandedPlugins):
+                        print(error[1])
+                    else:
+                        print(f"Unexpected error when updating {server_root}!")
+                        traceback.print_exception(*error, file=sys.stdout)
+                    result = {"server_root": server_root, "error": f"{error[0].__name__}: {error[1]}"}
+                print("")
+                results.append(result)
+
+    return results
+
+
+def check_compatibility(resolved: dict, index: PluginIndex) -> dict:
+    compatibility = compatibility_matrix.check(resolved, index)
+    compatibility_matrix.save()
+    return compatibility
+
+
+def report_compatibility(resolved: dict, compatibility: dict):
+    print(f"Upgrading Minecraft from {resolved['current_mc_version']} to {resolved['mc_version']}:")
+    for plugin in compatibility["stranded"]:
+        print(f" - {plugin['name']}: {plugin['reason']}")
+    if len(compatibility["unknown"]) > 0:
+        print(f" Unknown whether these support {resolved['mc_version']}: {', '.join(compatibility['unknown'])}")
+    if len(compatibility["stranded"]) == 0:
+        print(f" Every plugin with known compatibility supports {resolved['mc_version']}")
+
+
+def check_server(http: HttpClient, server_root: str, mc_version: str, jobs: int) -> dict:
+    """Works out what update_server would do, without downloading anything or touching the server."""
+    index = PluginIndex(os.path.abspath(os.path.join(server_root, "plugins")))
+    result = resolve_server(http, server_root, index, mc_version, jobs)
+    result["compatibility"] = None
+    if result["mc_version"] != result["current_mc_version"]:
+        result["compatibility"] = check_compatibility(result, index)
+
+    for item in result["plan"]:
+        download_size = item["size"]
+        if item["up_to_date"] or (http.store is not None and http.store.lookup(item["url"], item["sha256"]) is not None):
+            download_size = 0
+        item["download_size"] = download_size
+
+    return {"server_root": server_root, **result}
+
+
+def check_servers(http: HttpClient, server_roots: list[str], mc_version: str, jobs: int, server_jobs: int) -> list[dict]:
+    results = []
+    with thread_output() as output:
+        with concurrent.futures.ThreadPoolExecutor(max_workers=max(1, server_jobs)) as executor:
+            futures = [
+                executor.submit(run_captured, output, check_server, http, server_root, mc_version, jobs)
+                for server_root in server_roots
+            ]
+
+            for (server_root, future) in zip(server_roots, futures):
+                (result, _, error) = future.result()
+                if error is not None:
+                    result = {"server_root": server_root, "error": f"{error[0].__name__}: {error[1]}"}
+                results.append(result)
+
+    return results
+
+
+def format_size(size: int) -> str:
+    if size is None:
+        return "unknown size"
+    return f"{size / (1024 * 1024):.1f} MiB"
+
+
+def report_check(result: dict):
+    print(f"===== {result['server_root']} =====")
+    if "error" in result:
+        print(f"Unable to check {result['server_root']}: {result['error']}")
+        print("")
+        return
+
+    print(f"Minecraft version: {result['mc_version']}")
+    updates = [item for item in result["plan"] if not item["up_to_date"]]
+    for item in result["plan"]:
+        if item["up_to_date"]:
+            print(f" {item['name']}: {item['current_version']} (up to date)")
+            continue
+        download = "already downloaded" if item["download_size"] == 0 else format_size(item["download_size"])
+        print(f" {item['name']}: {item['current_version']} -> {item['target_version']} ({download})")
+        print(f"   {item['current_file']} -> {item['target_file']}")
+        print(f"   {item['url']}")
+
+    for error in result["errors"]:
+        print(f" Unable to check {error['updater']}: {error['error']}")
+    for updater_file_path in result["unsupported"]:
+        print(f" {updater_file_path} can't be checked without running it")
+    if result["compatibility"] is not None:
+        report_compatibility(result, result["compatibility"])
+
+    download_sizes = [item["download_size"] for item in updates]
+    total = sum(size for size in download_sizes if size is not None)
+    summary = f"{len(updates)} updates available, {format_size(total)} to download"
+    if None in download_sizes:
+        summary += " (plus files of unknown size)"
+    print(summary)
+    print("")
+
+
+def paper_published_sha256(http: HttpClient, server_root: str) -> (str, str):
+    """(sha256, where it's from) of the Paper build paper.jar points at, or (None, None) if that isn't known."""
+    # paper-1.21.4-123.jar
+    match = re.fullmatch(r"paper-(.+)-(\d+)\.jar", os.path.basename(os.path.realpath(os.path.join(server_root, "paper.jar"))))
+    if match is None:
+        return (None, None)
+    (mc_version, build) = (match.group(1), int(match.group(2)))
+    try:
+        return (paper_builds.get(http, mc_version, build)["sha256"], f"Paper {mc_version} build {build}")
+    except Exception:
+        return (None, None)
+
+
+def audit_server(http: HttpClient, server_root: str, jobs: int) -> dict:
+    """Hashes the server's jars and compares them against the checksums upstream published, see paper_updater.audit."""
+    from paper_updater import audit
+    index = PluginIndex(os.path.abspath(os.path.join(server_root, "plugins")))
+    # The latest releases' checksums also cover up to date jars installed before checksums were recorded
+    resolved = resolve_server(http, server_root, index, None, jobs)
+    latest = {}
+    for item in resolved["plan"]:
+        published = dict(item.get("hashes") or {})
+        if item["sha256"] is not None:
+            published["sha256"] = item["sha256"]
+        if item["up_to_date"] and len(published) > 0 and item["name"] != "Paper":
+            latest[item["current_file"]] = (published, f"latest release of {item['name']}")
+
+    expected = {}
+    paper_path = os.path.realpath(os.path.join(server_root, "paper.jar"))
+    if os.path.exists(paper_path):
+        (sha256, source) = paper_published_sha256(http, server_root)
+        expected[paper_path] = ({"sha256": sha256} if sha256 is not None else {}, source)
+    for name in index.names():
+        info = index.get(name)
+        if info.sha256 is not None:
+            expected[index.installed_path(name)] = ({"sha256": info.sha256}, "recorded when installed")
+        else:
+            expected[index.installed_path(name)] = latest.get(name, ({}, None))
+
+    files = audit.audit_files(expected, digest_cache)
+    counts = {status: sum(1 for file in files if file["status"] == status) for status in audit.STATUSES}
+    return {"server_root": server_root, "files": files, "counts": counts}
+
+
+def report_audit(result: dict):
+    from paper_updater import audit
+    print(f"===== {result['server_root']} =====")
+    if "error" in result:
+        print(f"Unable to audit {result['server_root']}: {result['error']}")
+        print("")
+        return
+
+    for file in result["files"]:
+        if file["status"] == audit.OK:
+            continue
+        print(f" {file['status']:>8}  {os.path.relpath(file['file'], result['server_root'])}")
+        for (algorithm, digest) in file["expected"].items():
+            if file["digests"] is not None and file["digests"][algorithm] != digest.lower():
+                print(f"           {algorithm} {file['digests'][algorithm]}, expected {digest} ({file['source']})")
+
+    counts = result["counts"]
+    print(f"{len(result['files'])} files: " + ", ".join(f"{counts[status]} {status}" for status in audit.STATUSES))
+    print("")
+
+
+def rollback_server(server_root: str):
+    generations = Generations(server_root)
+    with generations.lock():
+        generation = generations.rollback()
+    if generation is None:
+        print(f"{server_root}: nothing to roll back")
+        return
+
+    print(f"{server_root}: rolled back the update from {time.strftime('%Y-%m-%d %H:%M', time.localtime(generation['time']))}")
+    for name in generation["added"]:
+        print(f" - removed {name}")
+    for name in generation["replaced"] + generation["removed"]:
+        print(f" - restored {name}")
+    if generation["paper"] is not None:
+        print(f" - restored paper.jar")
+
+
+def apply_staged_server(server_root: str):
+    generations = Generations(server_root)
+    try:
+        with generations.lock():
+            (staged, generation) = generations.apply_staged()
+    except FileNotFoundError as e:
+        print(f"{server_root}: {e}")
+        return
+    if staged is None:
+        print(f"{server_root}: nothing staged")
+        return
+
+    print(f"{server_root}: swapped in the update staged at {time.strftime('%Y-%m-%d %H:%M', time.localtime(staged['time']))}")
+    for name in staged["added"]:
+        print(f" + {name}")
+    for name in staged["removed"]:
+        print(f" - {name}")
+    if staged["paper"] is not None:
+        print(f" paper.jar -> {os.path.basename(staged['paper'])}")
+    if generation is not None:
+        print(f"Replaced files are kept as generation {generation}, use --rollback to go back to them.")
+
+
+def report_batch(results: list[dict]):
+    print("Summary:")
+    servers_succeeded = 0
+    for result in results:
+        server_root = result["server_root"]
+        if "error" in result:
+            print(f" - {server_root}: FAILED ({result['error']})")
+            continue
+
+        summary = f"MC {result['mc_version']}, {result['updates_completed']}/{result['total_updaters']} plugins updated"
+        if result["unaccounted_plugins"] is None:
+            summary += ", some plugin updates failed"
+        else:
+            servers_succeeded = servers_succeeded + 1
+            if len(result["unaccounted_plugins"]) > 0:
+                summary += f", {len(result['unaccounted_plugins'])} without an updater"
+        print(f" - {server_root}: {summary}")
+
+    print(f"Successfully updated {servers_succeeded}/{len(results)} servers!")
+
+
+def main():
+    global args
+    server_roots = list(args["servers"] or [])
+    if args["manifest"]:
+        server_roots.extend(read_server_manifest(args["manifest"]))
+    # Absolute from here on, see START_DIR
+    server_roots = [os.path.abspath(server_root) for server_root in server_roots]
+
+    if args["rollback"]:
+        for server_root in server_roots or [START_DIR]:
+            rollback_server(server_root)
+        return
+
+    if args["apply_staged"]:
+        for server_root in server_roots or [START_DIR]:
+            apply_staged_server(server_root)
+        return
+
+    cache = None if args["no_cache"] else MetadataCache(ttl=args["cache_ttl"])
+    if args["no_cache"]:
+        paper_builds.cache_dir = None
+        compatibility_matrix.cache_dir = None
+        digest_cache.cache_dir = None
+    store = None if args["no_store"] else ArtifactStore(digest_cache=digest_cache)
+    pool_size = max(DEFAULT_POOL_SIZE, args["jobs"] * max(1, args["server_jobs"]))
+    with HttpClient(pool_size=pool_size, cache=cache, store=store, segments=args["segments"], host_limit=args["host_limit"], retry=RetryPolicy(args["retries"]), mirror=args["mirror"], delta_service=args["delta"]) as http:
+        github.authorize(http)
+        # Modes most runs don't use import their modules here, to keep them out of every run's startup
+        if args["serve_mirror"]:
+            from paper_updater import mirror
+            manifest_plugins = [plugin for (_, plugin) in load_manifest_plugins(UPDATERS_DIR)]
+            mirror.serve(http, args["serve_mirror"], mirror.upstream_routes(manifest_plugins))
+            return
+
+        if args["audit"]:
+            from paper_updater import audit
+            results = []
+            for server_root in server_roots or [START_DIR]:
+                try:
+                    result = audit_server(http, server_root, args["jobs"])
+                except Exception as e:
+                    result = {"server_root": server_root, "error": f"{type(e).__name__}: {e}"}
+                if args["json"]:
+                    print(json.dumps(result))
+                else:
+                    report_audit(result)
+                results.append(result)
+            # Something to act on, for cron and monitoring
+            if any("error" in result or result["counts"][audit.CORRUPT] + result["counts"][audit.TAMPERED] > 0 for result in results):
+                sys.exit(1)
+            return
+
+        if args["check"]:
+            results = check_servers(http, server_roots or [START_DIR], args["mc_version"], args["jobs"], args["server_jobs"])
+            for result in results:
+                if args["json"]:
+                    print(json.dumps(result))
+                else:
+                    report_check(result)
+            return
+
+        if args["daemon"]:
+            run_daemon(http, server_roots, args["interval"])
+            return
+
+        if not run_update(http, server_roots, stage_only=False):
+            sys.exit(1)
+
+
+def run_update(http: HttpClient, server_roots: list[str], stage_only: bool) -> bool:
+    """Updates (or with stage_only, stages) the servers. Returns False if the update was refused, see StrandedPlugins."""
+    report = RunReport()
+    try:
+        if len(server_roots) == 0:
+            try:
+                update_server(http, START_DIR, args["mc_version"], args["jobs"], report, stage_only)
+            except StrandedPlugins as e:
+                print(e)
+                return False
+        else:
+            results = update_servers(http, server_roots, args["mc_version"], args["jobs"], args["server_jobs"], report, stage_only)
+            report_batch(results)
+        return True
+    finally:
+        # Written even if the run failed, that's when it's most useful
+        if args["report"]:
+            report.write_json_lines(args["report"])
+        if args["prometheus"]:
+            report.write_prometheus(args["prometheus"])
+
+
+def run_daemon(http: HttpClient, server_roots: list[str], interval: float):
+    """
+    Stages every update as soon as it's published, so all that's left at restart time is --apply-staged.
+    Metadata older than --cache-ttl is revalidated with conditional requests, so a check with nothing new costs
+    a round of 304s, and jars already staged come from the artifact store.
+    """
+    while True:
+        start = time.monotonic()
+        print(f"{time.strftime('%Y-%m-%d %H:%M:%S')}: checking for updates", flush=True)
+        # Each check has to see what upstream has now, not what an earlier check fetched
+        http.forget()
+        try:
+            # An upgrade that would strand plugins is just checked again next time, they may have caught up by then
+            run_update(http, server_roots, stage_only=True)
+        except Exception:
+            print("Unexpected error when checking for updates!")
+            traceback.print_exc(file=sys.stdout)
+
+        delay = max(0, interval - (time.monotonic() - start))
+        print(f"Next check in {round(delay)}s", flush=True)
+        time.sleep(delay)
+
 
 if __name__ == "__main__":
     main()
-